@@ -8,6 +8,10 @@ import asyncio
 
 app = FastAPI()
 
+# Only one replica should run the Kite feed and alert engine; the others serve API + WebSockets
+# and receive frames over the broadcast bus (WS_BROADCAST_BUS=redis)
+FEED_ENABLED = os.getenv("FEED_ENABLED", "true").lower() == "true"
+
 # CORS Configuration
 origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
 
@@ -41,11 +45,18 @@ async def startup_db_client():
             
     db.connect()
     await db.create_indexes()
+
+    from backend.routers.websocket import manager
+    from backend.services.broadcast_bus import WS_BROADCAST_BUS, create_bus
+    if WS_BROADCAST_BUS != "local":
+        await manager.attach_bus(create_bus())
+    if not FEED_ENABLED:
+        print("FEED_ENABLED=false: serving API and WebSockets only")
+        return
     
     # Start Ticker Service (Real or Mock)
     from backend.services.ticker import ticker_service
     from backend.services.alert_engine import alert_engine
-    from backend.routers.websocket import manager
     import asyncio
     
     # Initialize Alert Engine (Cache)
@@ -71,7 +82,7 @@ async def startup_db_client():
         if system_state and system_state.get("status") == "ONLINE":
              await db["system_state"].update_one({"_id": system_state["_id"]}, {"$set": {"status": "OFFLINE"}})
 
-    ticker_service.start(on_ticks=alert_engine.enqueue_ticks, access_token=access_token)
+    ticker_service.start(on_ticks=alert_engine.offer_ticks, access_token=access_token)
     
     # Cache Instruments
     from backend.services.kite_client import kite_client
@@ -121,6 +132,16 @@ async def check_token_expiration():
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    from backend.services.alert_engine import alert_engine
+    from backend.services.ticker import ticker_service
+    from backend.routers.websocket import manager
+    from backend.services.notifications import notification_service
+    alert_engine.stop()
+    if ticker_service.journal:
+        ticker_service.journal.close()
+    if manager.bus:
+        await manager.bus.stop()
+    await notification_service.close()
     db.close()
 
 @app.get("/")
@@ -145,17 +166,27 @@ async def health_check():
 async def metrics():
     from backend.services.ticker import ticker_service
     from backend.services.alert_engine import alert_engine
+    from backend.routers.websocket import manager
+    from backend.services.notifications import notification_service
     
     return {
         "ticker": {
             "connected": ticker_service.connected,
             "total_ticks": ticker_service.metrics["total_ticks"],
+            "journal": ticker_service.journal.status() if ticker_service.journal else None,
+            "ingest": ticker_service.ingest.status() if ticker_service.ingest else None,
             "uptime": ticker_service.metrics["uptime_start"]
         },
         "alert_engine": {
             "monitored_users": len(alert_engine.user_settings),
-            "monitored_tokens": len(alert_engine.token_map)
+            "monitored_tokens": len(alert_engine.token_map),
+            "tick_queue": alert_engine.queue.status(),
+            "cooldowns": alert_engine.cooldowns.status(),
+            "alert_writer": alert_engine.alert_writer.status(),
+            "shards": alert_engine.shards.status() if alert_engine.shards else None
         },
+        "websocket": manager.status(),
+        "notifications": notification_service.status(),
         "system": {
             "cpu_usage": "Not implemented", # Requires psutil
             "memory_usage": "Not implemented"
@@ -79,6 +79,10 @@ class SettingsBase(BaseModel):
     whatsapp_number: Optional[str] = None
     telegram_chat_id: Optional[str] = None
 
+    # Digest: alerts within `digest_seconds` of each other go out as one message per channel
+    digest_enabled: bool = False
+    digest_seconds: int = Field(5, ge=1, le=300)
+
 class SettingsInDB(SettingsBase):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     user_id: PyObjectId
@@ -6,6 +6,7 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from backend.database import get_database
 from backend.models import UserCreate, UserResponse, UserInDB, Token, TokenData, SettingsInDB
+from backend.services.cache_events import cache_events
 import os
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
@@ -85,6 +86,7 @@ async def register(user: UserCreate, db = Depends(get_database)):
     # Initialize default settings for the user
     default_settings = SettingsInDB(user_id=str(new_user.inserted_id))
     await db["settings"].insert_one(default_settings.model_dump(by_alias=True, exclude={"id"}))
+    cache_events.settings_updated(default_settings)
     
     return UserResponse(**created_user)
 
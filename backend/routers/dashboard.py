@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from backend.services.ticker import ticker_service
 from backend.database import get_database
 from datetime import datetime
@@ -26,14 +26,17 @@ async def get_system_logs(limit: int = 50):
 @router.get("/heatmap")
 async def get_heatmap_data():
     # Return data for heatmap (symbol, % change)
-    data = []
-    for token, history in ticker_service.price_history.items():
-        if history:
-            last = history[-1]
-            # We need symbol map, but for now let's just send token or enrich if possible
-            # Ideally ticker service should map token -> symbol
-            data.append({
-                "token": token,
-                "change": last.get("change", 0)
-            })
-    return data
+    # We need symbol map, but for now let's just send token or enrich if possible
+    # Ideally ticker service should map token -> symbol
+    return [{"token": last["token"], "change": last["change"]} for last in ticker_service.price_history.latest()]
+
+@router.get("/sparklines")
+async def get_sparklines(tokens: str = Query(None, description="Comma-separated instrument tokens (default: all)"),
+                         points: int = Query(20, ge=3, le=500)):
+    """Downsampled recent price series for many tokens in one response"""
+    history = ticker_service.price_history
+    try:
+        wanted = [int(token) for token in tokens.split(",") if token.strip()] if tokens else list(history.slots)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="tokens must be comma-separated integers")
+    return {"points": points, "series": history.sparklines(wanted, points)}
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from backend.database import get_database
 from backend.models import SettingsBase, SettingsInDB, UserInDB
 from backend.routers.auth import get_current_user
+from backend.services.cache_events import cache_events
 from datetime import datetime
 
 router = APIRouter(prefix="/api/settings", tags=["Settings"])
@@ -37,7 +38,9 @@ async def update_settings(
     if not result:
         raise HTTPException(status_code=404, detail="Settings not found")
         
-    return SettingsInDB(**result)
+    settings = SettingsInDB(**result)
+    cache_events.settings_updated(settings)
+    return settings
 
 @router.post("/preset")
 async def apply_preset(
@@ -63,7 +66,9 @@ async def apply_preset(
         {"$set": update_data},
         return_document=True
     )
-    return SettingsInDB(**result)
+    settings = SettingsInDB(**result)
+    cache_events.settings_updated(settings)
+    return settings
 
 @router.post("/test-notification")
 async def test_notification(
@@ -113,4 +118,6 @@ async def reset_settings(
         {"$set": update_data},
         return_document=True
     )
-    return SettingsInDB(**result)
+    settings = SettingsInDB(**result)
+    cache_events.settings_updated(settings)
+    return settings
@@ -7,6 +7,7 @@ from backend.routers.auth import get_current_user
 from bson import ObjectId
 
 from backend.services.kite_client import kite_client
+from backend.services.cache_events import cache_events
 
 router = APIRouter(prefix="/api/stocks", tags=["Stocks"])
 
@@ -62,6 +63,7 @@ async def add_stock(
     # Subscribe in Ticker
     from backend.services.ticker import ticker_service
     ticker_service.subscribe([valid_inst["instrument_token"]])
+    cache_events.stock_added(current_user.id, new_stock.symbol, new_stock.instrument_token, stock_id=str(result.inserted_id))
     
     return StockInDB(**created_stock)
 
@@ -101,12 +103,13 @@ async def bulk_add_stocks(
             instrument_token=valid_inst["instrument_token"],
             exchange=valid_inst["exchange"]
         )
-        await db["stocks"].insert_one(new_stock.model_dump(by_alias=True, exclude={"id"}))
+        result = await db["stocks"].insert_one(new_stock.model_dump(by_alias=True, exclude={"id"}))
         added.append(symbol)
         
         # Subscribe
         from backend.services.ticker import ticker_service
         ticker_service.subscribe([valid_inst["instrument_token"]])
+        cache_events.stock_added(current_user.id, new_stock.symbol, new_stock.instrument_token, stock_id=str(result.inserted_id))
         
     return {"added": added, "failed": failed}
 
@@ -116,12 +119,14 @@ async def remove_stock(
     current_user: UserInDB = Depends(get_current_user),
     db = Depends(get_database)
 ):
-    result = await db["stocks"].delete_one({
+    stock = await db["stocks"].find_one_and_delete({
         "user_id": current_user.id,
         "symbol": symbol
     })
     
-    if result.deleted_count == 0:
+    if stock is None:
         raise HTTPException(status_code=404, detail="Stock not found")
+
+    cache_events.stock_removed(current_user.id, symbol, stock.get("instrument_token"), stock_id=str(stock["_id"]))
         
     return {"message": "Stock removed successfully"}
@@ -1,40 +1,421 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import List
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from backend.database import db
+from backend.services.cache_events import CacheEvent, CacheEventBus, cache_events, STOCK_ADDED, STOCK_REMOVED
+from backend.services.tick_codec import JSON, FORMATS, encode_message, encode_tick, tick_frame
+from backend.services.broadcast_bus import TICKS, MESSAGE, CACHE_EVENT
+import asyncio
 import json
+import math
+import os
+import time
 
 router = APIRouter(prefix="/ws", tags=["WebSocket"])
 
+# Frames queued per client before it counts as slow
+WS_QUEUE_FRAMES = int(os.getenv("WS_QUEUE_FRAMES", 256))
+# A single send taking longer than this means the client is gone
+WS_SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", 10))
+# Frame types where only the latest matters; a slow client gets those conflated instead of dropped
+CONFLATABLE = {"TICK_UPDATE", "DASHBOARD_UPDATE"}
+# Message types replayed to clients that connect later (only the latest of each is kept)
+STICKY = {"DASHBOARD_UPDATE"}
+# TICK_UPDATE frames per second per client (clients may ask for another rate); 0 = as fast as they drain
+WS_FRAME_RATE = float(os.getenv("WS_FRAME_RATE", 4))
+MAX_FRAME_RATE = 30
+
+class ClientConnection:
+    """One socket's bounded outbound queue, drained by its own writer task.
+
+    When the queue is full, conflatable frames replace the pending frame of
+    the same type (latest wins) and anything else disconnects the client,
+    since it could never catch up without losing alerts.
+
+    Ticks bypass the queue: they are conflated to the latest tick per token
+    and sent as one TICK_UPDATE at most `frame_rate` times a second, so a
+    busy feed costs each client a bounded number of frames.
+    """
+    def __init__(self, websocket: WebSocket, max_frames: int, format: str = JSON, frame_rate: float = WS_FRAME_RATE):
+        self.websocket = websocket
+        self.format = format # JSON text frames, or MessagePack binary frames
+        self.frame_rate = frame_rate
+        self.pending_ticks: Dict[int, object] = {} # token -> latest encoded tick since the last frame
+        self.ticks_since = None # monotonic time the oldest pending tick arrived
+        self.next_tick_frame = 0.0 # monotonic time the next TICK_UPDATE may go out
+        self.max_frames = max_frames
+        self.queue = deque() # (type, frame, monotonic enqueue time)
+        self.conflated: Dict[str, tuple] = {} # type -> (frame, enqueue time), while the queue is full
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.connected_at = time.monotonic()
+        self.user_id: Optional[str] = None # Set when the client authenticated
+        self.tokens: Optional[Set[int]] = None # None until it subscribes: receives every tick
+        self.metrics = {"sent": 0, "conflated": 0, "conflated_ticks": 0, "last_lag_ms": 0.0, "max_lag_ms": 0.0}
+
+    def offer(self, kind: str, frame) -> bool:
+        """Queue a frame; False when the client is too slow to keep"""
+        now = time.monotonic()
+        if len(self.queue) < self.max_frames:
+            self.queue.append((kind, frame, now))
+        elif kind in CONFLATABLE:
+            previous = self.conflated.get(kind)
+            self.conflated[kind] = (frame, previous[1] if previous else now)
+            self.metrics["conflated"] += 1
+        else:
+            return False
+        self.wakeup.set()
+        return True
+
+    def offer_ticks(self, encoded: Dict[int, object]):
+        """Merge the latest encoded tick per token into the next TICK_UPDATE"""
+        now = time.monotonic()
+        if self.ticks_since is None:
+            self.ticks_since = now
+        before = len(self.pending_ticks)
+        self.pending_ticks.update(encoded)
+        self.metrics["conflated_ticks"] += before + len(encoded) - len(self.pending_ticks)
+        # With ticks already pending, a throttled writer wakes itself when the frame is due
+        if not before or now >= self.next_tick_frame:
+            self.wakeup.set()
+
+    def set_frame_rate(self, frame_rate: float):
+        if not math.isfinite(frame_rate):
+            return # NaN would stall the tick frames for good; keep the current rate
+        self.frame_rate = min(max(frame_rate, 0), MAX_FRAME_RATE)
+        self.next_tick_frame = 0.0
+        self.wakeup.set()
+
+    def lag_ms(self) -> float:
+        """How long the oldest pending frame has been waiting"""
+        oldest = [self.queue[0][2]] if self.queue else []
+        oldest += [queued for _, queued in self.conflated.values()]
+        if self.ticks_since is not None:
+            oldest.append(self.ticks_since)
+        return (time.monotonic() - min(oldest)) * 1000 if oldest else 0.0
+
+    def _next_frame(self):
+        """(frame, enqueue time) to send now, or None"""
+        if self.queue:
+            _, frame, queued = self.queue.popleft()
+            return frame, queued
+        if self.conflated:
+            return self.conflated.pop(next(iter(self.conflated)))
+        now = time.monotonic()
+        if self.pending_ticks and now >= self.next_tick_frame:
+            frame = tick_frame(list(self.pending_ticks.values()), self.format)
+            queued = self.ticks_since
+            self.pending_ticks = {}
+            self.ticks_since = None
+            self.next_tick_frame = now + 1 / self.frame_rate if self.frame_rate else now
+            return frame, queued
+        return None
+
+    async def run(self):
+        """Writer loop; returns when a send fails or times out"""
+        while True:
+            next_frame = self._next_frame()
+            if next_frame is None:
+                self.wakeup.clear()
+                if self.pending_ticks:
+                    # Throttled: sleep until the next frame slot unless something else arrives
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), self.next_tick_frame - time.monotonic())
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self.wakeup.wait()
+                continue
+            frame, queued = next_frame
+            try:
+                send = self.websocket.send_bytes if isinstance(frame, bytes) else self.websocket.send_text
+                await asyncio.wait_for(send(frame), WS_SEND_TIMEOUT_SECONDS)
+            except Exception as e:
+                print(f"Dropping WebSocket client: {e!r}")
+                return
+            lag = (time.monotonic() - queued) * 1000
+            self.metrics["sent"] += 1
+            self.metrics["last_lag_ms"] = lag
+            self.metrics["max_lag_ms"] = max(self.metrics["max_lag_ms"], lag)
+
+    def status(self) -> Dict:
+        return {
+            "depth": len(self.queue) + len(self.conflated),
+            "pending_ticks": len(self.pending_ticks),
+            "frame_rate": self.frame_rate,
+            "lag_ms": round(self.lag_ms(), 1),
+            "connected_seconds": round(time.monotonic() - self.connected_at),
+            "subscriptions": None if self.tokens is None else len(self.tokens),
+            **self.metrics,
+        }
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, max_frames: int = WS_QUEUE_FRAMES, frame_rate: float = WS_FRAME_RATE):
+        self.max_frames = max_frames
+        self.frame_rate = frame_rate
+        self.latest: Dict[str, dict] = {} # STICKY type -> last message
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.token_clients: Dict[int, Set[ClientConnection]] = {} # instrument_token -> subscribed clients
+        self.firehose: Set[ClientConnection] = set() # Clients that never subscribed get every tick
+        # Watchlists of connected users, so removals (which may carry only a symbol or a stock _id) find their token
+        self.watchlists: Dict[str, Dict[str, int]] = {} # user_id -> {symbol: instrument_token}
+        self.stock_ids: Dict[str, Tuple[str, str]] = {} # stock _id -> (user_id, symbol)
+        self.bus = None # When set, broadcasts go through it and reach every replica's clients
+        self.events: Optional[CacheEventBus] = None # Cache events relayed through the bus land here
+        self.metrics = {"broadcasts": 0, "dropped_slow": 0, "reaped": 0}
 
-    async def connect(self, websocket: WebSocket):
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
+
+    async def connect(self, websocket: WebSocket, format: str = JSON, frame_rate: float = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, self.max_frames, format if format in FORMATS else JSON, self.frame_rate)
+        if frame_rate is not None:
+            client.set_frame_rate(frame_rate)
+        self.clients[websocket] = client
+        self.firehose.add(client)
+        for kind, message in self.latest.items():
+            client.offer(kind, encode_message(message, client.format))
+        client.task = asyncio.create_task(self._write(client))
+
+    async def _write(self, client: ClientConnection):
+        await client.run()
+        # The writer only returns on a dead or stalled socket
+        if self.clients.get(client.websocket) is client:
+            self.metrics["reaped"] += 1
+            self._remove(client)
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        client = self.clients.get(websocket)
+        if client is not None:
+            self._remove(client)
 
-    async def broadcast(self, message: dict):
-        # Broadcast to all connected clients
-        # In a real app, we might filter by user subscriptions
-        for connection in self.active_connections:
+    def _remove(self, client: ClientConnection):
+        self.clients.pop(client.websocket, None)
+        self.firehose.discard(client)
+        self._unindex(client, client.tokens or ())
+        if client.user_id is not None and not any(c.user_id == client.user_id for c in self.clients.values()):
+            self.watchlists.pop(client.user_id, None)
+            self.stock_ids = {stock_id: owner for stock_id, owner in self.stock_ids.items() if owner[0] != client.user_id}
+        if client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+        asyncio.create_task(self._close(client.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass # Already closed
+
+    def subscribe(self, websocket: WebSocket, tokens: Iterable[int], user_id: str = None):
+        """Narrow a client to (additional) instrument tokens"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        if client.tokens is None:
+            client.tokens = set()
+            self.firehose.discard(client)
+        if user_id is not None:
+            client.user_id = user_id
+            self.watchlists.setdefault(user_id, {})
+        for token in tokens:
+            client.tokens.add(token)
+            self.token_clients.setdefault(token, set()).add(client)
+
+    def watch(self, websocket: WebSocket, user_id: str, stocks: Iterable[dict]):
+        """Subscribe an authenticated client to its user's stocks ({_id, symbol, instrument_token} documents)"""
+        watchlist = self.watchlists.setdefault(user_id, {})
+        for stock in stocks:
+            watchlist[stock["symbol"]] = stock["instrument_token"]
+            if stock.get("_id") is not None:
+                self.stock_ids[str(stock["_id"])] = (user_id, stock["symbol"])
+        self.subscribe(websocket, list(watchlist.values()), user_id)
+
+    def unsubscribe(self, websocket: WebSocket, tokens: Iterable[int]):
+        client = self.clients.get(websocket)
+        if client is None or client.tokens is None:
+            return
+        tokens = set(tokens) & client.tokens
+        client.tokens -= tokens
+        self._unindex(client, tokens)
+
+    def _unindex(self, client: ClientConnection, tokens: Iterable[int]):
+        for token in tokens:
+            clients = self.token_clients.get(token)
+            if clients is not None:
+                clients.discard(client)
+                if not clients:
+                    del self.token_clients[token]
+
+    def handle_message(self, websocket: WebSocket, text: str):
+        """Client -> server: {"action": "subscribe" | "unsubscribe", "tokens": [instrument_token, ...]},
+        {"action": "format", "format": "json" | "msgpack"} or {"action": "rate", "fps": frames per second}"""
+        try:
+            message = json.loads(text)
+            action = message.get("action")
+            tokens = [int(token) for token in message.get("tokens", [])]
+        except (ValueError, TypeError, AttributeError):
+            return
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        if action == "subscribe":
+            self.subscribe(websocket, tokens)
+        elif action == "unsubscribe":
+            self.unsubscribe(websocket, tokens)
+        elif action == "rate":
             try:
-                await connection.send_json(message)
-            except Exception as e:
-                # Handle broken connections
-                print(f"Error broadcasting to client: {e}")
+                client.set_frame_rate(float(message.get("fps")))
+            except (TypeError, ValueError):
                 pass
+            return
+        elif action == "format":
+            if message.get("format") in FORMATS and message["format"] != client.format:
+                client.format = message["format"]
+                client.pending_ticks = {} # Encoded for the old format; the next tick refreshes them
+                client.ticks_since = None
+            client.offer("FORMAT", encode_message({"type": "FORMAT", "format": client.format}, client.format))
+            return
+        else:
+            return
+        if client.tokens is None:
+            return # Unsubscribing before ever subscribing: still on the firehose, nothing to report
+        client.offer("SUBSCRIPTIONS", encode_message({"type": "SUBSCRIPTIONS", "tokens": sorted(client.tokens)}, client.format))
+
+    def apply_event(self, event: CacheEvent):
+        """Keep authenticated clients' watchlists in step with their stocks"""
+        if event.kind not in (STOCK_ADDED, STOCK_REMOVED):
+            return
+        user_id, symbol = event.user_id, event.symbol
+        if event.stock_id:
+            user_id, symbol = self.stock_ids.get(event.stock_id, (user_id, symbol))
+        watchlist = self.watchlists.get(user_id)
+        if watchlist is None:
+            return # No authenticated client of this user on this replica
+        # Removals from the router or a change-stream delete may not carry the token; the watchlist has it
+        previous = watchlist.pop(symbol, None) if symbol else None
+        stale = {token for token in (previous, event.instrument_token) if token is not None}
+        if event.kind == STOCK_ADDED:
+            watchlist[symbol] = event.instrument_token
+            if event.stock_id:
+                self.stock_ids[event.stock_id] = (user_id, symbol)
+            stale.discard(event.instrument_token)
+        elif event.stock_id:
+            self.stock_ids.pop(event.stock_id, None)
+        stale -= set(watchlist.values()) # Still watched under another symbol
+        for client in [c for c in self.clients.values() if c.user_id == user_id]:
+            if stale:
+                self.unsubscribe(client.websocket, stale)
+            if event.kind == STOCK_ADDED:
+                self.subscribe(client.websocket, [event.instrument_token])
+
+    async def attach_bus(self, bus, events: CacheEventBus = cache_events):
+        """Route broadcasts through `bus`; this replica's clients are then fed from the bus only.
+        Cache events published on `events` are relayed to the other replicas' buses too."""
+        self.bus = bus
+        self.events = events
+        events.relay = lambda event: bus.publish(CACHE_EVENT, event.to_dict())
+        bus.subscribe(self._on_bus)
+        await bus.start()
+
+    async def _on_bus(self, kind: str, data):
+        if kind == TICKS:
+            self.deliver_ticks(data)
+        elif kind == MESSAGE:
+            self.deliver(data)
+        elif kind == CACHE_EVENT and self.events is not None:
+            # Comes back to the publishing replica too; handlers are idempotent
+            self.events.publish(CacheEvent.from_dict(data), relay=False)
+
+    async def broadcast_ticks(self, ticks: List[dict]):
+        """Send the latest tick per token to the clients watching it, on every replica"""
+        latest = {}
+        for tick in ticks:
+            latest[tick["instrument_token"]] = tick # Only the newest tick per token can be sent
+        if self.bus:
+            await self.bus.publish(TICKS, list(latest.values()))
+        else:
+            self.deliver_ticks(latest.values())
+
+    async def broadcast(self, message: dict):
+        """Send a message to every client, on every replica; never waits on a socket"""
+        if self.bus:
+            await self.bus.publish(MESSAGE, message)
+        else:
+            self.deliver(message)
+
+    def deliver_ticks(self, ticks: Iterable[dict]):
+        """Hand this process' clients their ticks; every tick is encoded once per wire format.
+        Ticks are conflated per client and framed by its writer at the client's frame rate."""
+        self.metrics["broadcasts"] += 1
+        latest = {tick["instrument_token"]: tick for tick in ticks}
+        formats = {client.format for client in self.clients.values()}
+        encoded = {format: {token: encode_tick(tick, format) for token, tick in latest.items()} for format in formats}
+
+        outgoing: Dict[ClientConnection, Dict[int, object]] = {}
+        for token in latest:
+            for client in self.token_clients.get(token, ()):
+                outgoing.setdefault(client, {})[token] = encoded[client.format][token]
+        for client in self.firehose:
+            outgoing[client] = encoded[client.format]
+
+        for client, ticks_by_token in outgoing.items():
+            client.offer_ticks(ticks_by_token)
+
+    def deliver(self, message: dict):
+        """Encode once per wire format and queue for every client of this process"""
+        frames = {}
+        kind = message.get("type")
+        self.metrics["broadcasts"] += 1
+        if kind in STICKY:
+            self.latest[kind] = message
+        for client in list(self.clients.values()):
+            if client.format not in frames:
+                frames[client.format] = encode_message(message, client.format)
+            if not client.offer(kind, frames[client.format]):
+                self.metrics["dropped_slow"] += 1
+                self._remove(client)
+
+    def status(self) -> Dict:
+        return {
+            "connections": len(self.clients), **self.metrics,
+            "bus": self.bus.status() if self.bus else None,
+            "clients": [client.status() for client in self.clients.values()],
+        }
 
 manager = ConnectionManager()
+cache_events.subscribe(manager.apply_event)
+
+async def watchlist(token: str):
+    """(user_id, stocks) of the user a JWT belongs to"""
+    from backend.routers.auth import get_current_user
+    user = await get_current_user(token, db.db)
+    stocks = await db["stocks"].find({"user_id": user.id}, {"symbol": 1, "instrument_token": 1}).to_list(length=500)
+    return str(user.id), [stock for stock in stocks if stock.get("instrument_token")]
 
 @router.websocket("/stocks")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, token: str = None, format: str = JSON, fps: float = None):
+    # ?token=<JWT> limits ticks to the user's watchlist; otherwise the client
+    # gets every tick until it sends a subscribe message.
+    # ?format=msgpack switches to binary MessagePack frames (when available)
+    # ?fps=N caps TICK_UPDATE frames per second for this client
+    subscription = None
+    if token:
+        try:
+            subscription = await watchlist(token)
+        except HTTPException:
+            await websocket.close(code=1008)
+            return
+    await manager.connect(websocket, format, fps)
+    if subscription:
+        user_id, stocks = subscription
+        manager.watch(websocket, user_id, stocks)
     try:
         while True:
-            # Keep connection alive, maybe listen for client messages (subscriptions)
-            data = await websocket.receive_text()
-            # For MVP, we just keep it open. Client doesn't need to send anything yet.
+            manager.handle_message(websocket, await websocket.receive_text())
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
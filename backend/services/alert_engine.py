@@ -1,18 +1,112 @@
 import asyncio
-from typing import Dict, List
+import os
+import time
+import numpy as np
+from typing import Callable, Dict, List, Tuple
 from datetime import datetime, timedelta
-from backend.services.algorithms import TrailingAlgo, RollingWindowAlgo
-from backend.models import AlgoMode, AlertType, SettingsInDB
+from backend.services.algorithms import tick_time
+from backend.services.batch_engine import TickBatch, trailing_batch
+from backend.services.indicators import IndicatorLayer
+from backend.services.tick_buffer import ConflatingTickBuffer
+from backend.services.cooldowns import CooldownTable
+from backend.services.alert_store import AlertWriter
+from backend.services.snapshots import capture, write, save_snapshot, restore_snapshot
+from backend.services.subscriber_index import TokenPlan, build_plan, build_plans
+from backend.services.cache_events import (
+    CacheEvent, cache_events, watch_collection, stock_event, settings_event,
+    STOCK_ADDED, STOCK_REMOVED, SETTINGS_UPDATED,
+)
+from backend.models import AlgoMode, AlertType, SettingsBase, SettingsInDB
 from backend.database import db
 
+# "batch" evaluates a tick batch with NumPy, "reference" walks it tick by tick
+ENGINE_MODE = os.getenv("ALERT_ENGINE_MODE", "batch")
+# Deltas keep the cache current; the full reload is only a consistency check
+CACHE_RECONCILE_SECONDS = int(os.getenv("CACHE_RECONCILE_SECONDS", 900))
+# >1 runs evaluation in that many processes, partitioned by instrument_token
+ENGINE_SHARDS = int(os.getenv("ALERT_ENGINE_SHARDS", 0))
+# Batches queued as-is before the tick queue starts conflating per token
+TICK_QUEUE_MAX_BATCHES = int(os.getenv("TICK_QUEUE_MAX_BATCHES", 100))
+# Indicator + cooldown state is snapshotted here so a restart resumes where it left off ("" disables)
+SNAPSHOT_PATH = os.getenv("ALERT_SNAPSHOT_PATH", "alert_engine_snapshot.npz")
+SNAPSHOT_SECONDS = int(os.getenv("ALERT_SNAPSHOT_SECONDS", 30))
+# Older snapshots are ignored: trailing highs/lows from a previous session would be wrong
+SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("ALERT_SNAPSHOT_MAX_AGE_SECONDS", 900))
+
+class TrackedDict(dict):
+    """dict that counts its own mutations, so compiled indexes know when to rebuild.
+    Only top-level writes are tracked: replace a token's subscriber list, don't append to it."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+
+    def pop(self, *args):
+        self.version += 1
+        return super().pop(*args)
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version += 1
+
+    def clear(self):
+        super().clear()
+        self.version += 1
+
 class AlertEngine:
-    def __init__(self):
-        self.trailing_algo = TrailingAlgo()
-        self.rolling_algos: Dict[int, RollingWindowAlgo] = {} # user_id -> Algo
+    def __init__(self, mode: str = None, clock: Callable[[], float] = None):
+        self.mode = mode or ENGINE_MODE
+        self.clock = clock or time.time # Epoch seconds; replays inject a simulated clock
+        self.indicators = IndicatorLayer() # Trailing per token, rolling per (token, window)
         self.user_settings: Dict[str, SettingsInDB] = {} # user_id -> Settings
         self.token_map: Dict[int, List[Tuple[str, str]]] = {} # token -> list of (user_id, symbol)
-        self.last_alert_time: Dict[str, datetime] = {} # "user_id:token:type" -> timestamp
+        self.token_plans: Dict[int, TokenPlan] = {} # token -> compiled subscribers (see _ensure_plans)
+        self._plan_versions = None
+        self.user_tokens: Dict[str, Dict[str, int]] = {} # user_id -> {symbol: token}
+        self.stock_ids: Dict[str, Tuple[str, str]] = {} # stock _id -> (user_id, symbol), for change-stream deletes
+        self.cooldowns = CooldownTable(clock) if clock else CooldownTable() # (subscriber slot, alert type) -> monotonic expiry
         self.connection_manager = None # WebSocket Manager
+        self.shards = None # ShardPool when ALERT_ENGINE_SHARDS > 1
+        self.queue = ConflatingTickBuffer(TICK_QUEUE_MAX_BATCHES) # Ticker -> consumer loop
+        self.alert_writer = AlertWriter(lambda: db["alerts"]) # Bulk inserts, spooled to disk while the DB is down
+        self.running = False
+
+    @property
+    def alert_buffer(self) -> List[Dict]:
+        return self.alert_writer.buffer
+
+    @alert_buffer.setter
+    def alert_buffer(self, value):
+        self.alert_writer.buffer = value
+
+    @property
+    def token_map(self) -> Dict[int, List[Tuple[str, str]]]:
+        return self._token_map
+
+    @token_map.setter
+    def token_map(self, value):
+        self._token_map = TrackedDict(value)
+        self._maps_generation = getattr(self, "_maps_generation", 0) + 1
+
+    @property
+    def user_settings(self) -> Dict[str, SettingsInDB]:
+        return self._user_settings
+
+    @user_settings.setter
+    def user_settings(self, value):
+        self._user_settings = TrackedDict(value)
+        self._maps_generation = getattr(self, "_maps_generation", 0) + 1
 
     def set_manager(self, manager):
         self.connection_manager = manager
@@ -20,15 +114,37 @@ class AlertEngine:
     async def start(self):
         """Initialize cache and start background refresh task"""
         print("Starting Alert Engine...")
-        self.queue = asyncio.Queue() # Initialize queue here to ensure loop exists
-        self.alert_buffer = [] # Buffer for bulk inserts
+        cache_events.subscribe(self.apply_event)
+        if SNAPSHOT_PATH:
+            # Before the first refresh, which prunes state of tokens nobody watches anymore
+            restore_snapshot(self, SNAPSHOT_PATH, SNAPSHOT_MAX_AGE_SECONDS)
+        if ENGINE_SHARDS > 1:
+            from backend.services.shards import ShardPool
+            self.shards = ShardPool(ENGINE_SHARDS, self.mode)
+            self.shards.start()
+            asyncio.create_task(self.shards.collect(self))
         await self.refresh_cache()
         asyncio.create_task(self._cache_refresh_loop())
+        asyncio.create_task(watch_collection(db, "stocks", stock_event, cache_events))
+        asyncio.create_task(watch_collection(db, "settings", settings_event, cache_events))
+        self.running = True
         asyncio.create_task(self._consume_ticks_loop())
-        asyncio.create_task(self._cache_refresh_loop())
-        asyncio.create_task(self._consume_ticks_loop())
-        asyncio.create_task(self._flush_alerts_loop())
+        asyncio.create_task(self.alert_writer.run())
         asyncio.create_task(self._retention_policy_loop())
+        if SNAPSHOT_PATH:
+            asyncio.create_task(self._snapshot_loop())
+
+    def stop(self):
+        if self.running and SNAPSHOT_PATH:
+            try:
+                save_snapshot(self, SNAPSHOT_PATH)
+            except Exception as e:
+                print(f"Error writing alert engine snapshot: {e}")
+        self.alert_writer.close()
+        self.running = False
+        if self.shards:
+            self.shards.stop()
+            self.shards = None
 
     async def _retention_policy_loop(self):
         """Delete alerts older than 30 days"""
@@ -44,24 +160,24 @@ class AlertEngine:
             # Run once every 24 hours
             await asyncio.sleep(86400)
 
-    async def _flush_alerts_loop(self):
-        """Background task to flush alerts to DB in batches"""
+    async def _snapshot_loop(self):
+        """Periodically persist indicator and cooldown state (written off the event loop)"""
         while True:
-            await asyncio.sleep(1) # Flush every second
-            if self.alert_buffer:
-                to_insert = self.alert_buffer
-                self.alert_buffer = [] # Clear buffer
-                try:
-                    await db["alerts"].insert_many(to_insert)
-                    print(f"Flushed {len(to_insert)} alerts to DB")
-                except Exception as e:
-                    print(f"Error flushing alerts: {e}")
-                    # Ideally, re-add to buffer or log to file
-    
+            await asyncio.sleep(SNAPSHOT_SECONDS)
+            try:
+                await asyncio.to_thread(write, capture(self), SNAPSHOT_PATH)
+            except Exception as e:
+                print(f"Error writing alert engine snapshot: {e}")
+
+    def offer_ticks(self, ticks: List[Dict]):
+        """Put ticks into the queue (Non-blocking for Ticker; conflates instead of growing when the consumer lags)"""
+        if self.running:
+            self.queue.put(ticks)
+        else:
+            self.queue.drop()
+
     async def enqueue_ticks(self, ticks: List[Dict]):
-        """Put ticks into the queue (Non-blocking for Ticker)"""
-        if hasattr(self, 'queue'):
-            await self.queue.put(ticks)
+        self.offer_ticks(ticks)
 
     async def _consume_ticks_loop(self):
         """Consumer loop to process ticks from queue"""
@@ -70,34 +186,31 @@ class AlertEngine:
             try:
                 ticks = await self.queue.get()
                 await self.process_ticks(ticks)
-                self.queue.task_done()
             except Exception as e:
                 print(f"Error in alert consumer loop: {e}")
 
     async def _cache_refresh_loop(self):
         while True:
-            await asyncio.sleep(60)
+            await asyncio.sleep(CACHE_RECONCILE_SECONDS)
             try:
                 await self.refresh_cache()
             except Exception as e:
                 print(f"Error refreshing cache: {e}")
 
     async def refresh_cache(self):
-        """Load all settings and active stocks into memory"""
+        """Full reload of settings and active stocks (startup + periodic consistency check)"""
         # 1. Load Settings
-        settings_cursor = db["settings"].find({})
+        settings_fields = {field: 1 for field in SettingsBase.model_fields}
+        settings_fields["user_id"] = 1
+        settings_cursor = db["settings"].find({}, settings_fields)
         new_settings = {}
         async for setting in settings_cursor:
             new_settings[str(setting["user_id"])] = SettingsInDB(**setting)
-            # Initialize rolling algo if needed
-            if str(setting["user_id"]) not in self.rolling_algos:
-                self.rolling_algos[str(setting["user_id"])] = RollingWindowAlgo(window_minutes=setting["timeframe_minutes"])
-        
-        self.user_settings = new_settings
 
         # 2. Load Active Stocks & Build Token Map
-        stocks_cursor = db["stocks"].find({"active": True})
+        stocks_cursor = db["stocks"].find({"active": True}, {"user_id": 1, "symbol": 1, "instrument_token": 1})
         new_token_map = {}
+        new_stock_ids = {}
         
         async for stock in stocks_cursor:
             tid = stock.get("instrument_token")
@@ -105,56 +218,229 @@ class AlertEngine:
                 if tid not in new_token_map:
                     new_token_map[tid] = []
                 new_token_map[tid].append((str(stock["user_id"]), stock["symbol"]))
+                new_stock_ids[str(stock["_id"])] = (str(stock["user_id"]), stock["symbol"])
         
+        drift = self._cache_drift(new_token_map, new_settings)
+        self.user_settings = new_settings
         self.token_map = new_token_map
-        print(f"Cache Refreshed: {len(self.user_settings)} users, {len(self.token_map)} tokens monitored.")
+        self.stock_ids = new_stock_ids
+        self._ensure_plans()
+        print(f"Cache Refreshed: {len(self.user_settings)} users, {len(self.token_map)} tokens monitored, {drift} entries drifted.")
+
+    def _cache_drift(self, token_map: Dict, user_settings: Dict) -> int:
+        """How many tokens/users differ between the live cache and a fresh load"""
+        drift = 0
+        for token in set(token_map) | set(self._token_map):
+            if sorted(token_map.get(token, [])) != sorted(self._token_map.get(token, [])):
+                drift += 1
+        fields = set(SettingsBase.model_fields)
+        for user_id in set(user_settings) | set(self._user_settings):
+            old, new = self._user_settings.get(user_id), user_settings.get(user_id)
+            if old is None or new is None or old.model_dump(include=fields) != new.model_dump(include=fields):
+                drift += 1
+        return drift
+
+    def _map_versions(self):
+        return (self._maps_generation, self._token_map.version, self._user_settings.version)
+
+    def apply_event(self, event: CacheEvent):
+        """Patch token_map/user_settings with one delta and recompile only the affected tokens"""
+        self._ensure_plans() # Patching assumes plans match the maps
+        user_id = event.user_id
+        touched = set()
+        moved_from = None # Token a STOCK_ADDED took the symbol away from
+
+        if event.kind == STOCK_ADDED:
+            token, symbol = event.instrument_token, event.symbol
+            if self.user_tokens.get(user_id, {}).get(symbol, token) != token:
+                moved_from = self._remove_subscriber(user_id, symbol)
+                touched.add(moved_from)
+            subscribers = self._token_map.get(token, [])
+            if (user_id, symbol) not in subscribers:
+                self._token_map[token] = subscribers + [(user_id, symbol)]
+                self.user_tokens.setdefault(user_id, {})[symbol] = token
+                touched.add(token)
+            if event.stock_id:
+                self.stock_ids[event.stock_id] = (user_id, symbol)
+
+        elif event.kind == STOCK_REMOVED:
+            symbol = event.symbol
+            if event.stock_id:
+                user_id, symbol = self.stock_ids.pop(event.stock_id, (user_id, symbol))
+            token = self._remove_subscriber(user_id, symbol)
+            if token is not None:
+                touched.add(token)
+
+        elif event.kind == SETTINGS_UPDATED:
+            if self._user_settings.get(user_id) != event.settings:
+                self._user_settings[user_id] = event.settings
+                touched.update(self.user_tokens.get(user_id, {}).values())
+
+        touched.discard(None)
+        for token in touched:
+            if token in self._token_map:
+                self.token_plans[token] = build_plan(self._token_map[token], self._user_settings, self.cooldowns.slot_of)
+            else:
+                self.token_plans.pop(token, None)
+        self.indicators.prune(self.token_plans, touched)
+        self._plan_versions = self._map_versions()
+        if self.shards and touched:
+            self.shards.apply_event(event, moved_from)
+
+    def _remove_subscriber(self, user_id: str, symbol: str):
+        token = self.user_tokens.get(user_id, {}).pop(symbol, None)
+        if token is None:
+            return None
+        subscribers = [s for s in self._token_map.get(token, []) if s != (user_id, symbol)]
+        self.cooldowns.release(user_id, symbol)
+        if subscribers:
+            self._token_map[token] = subscribers
+        else:
+            self._token_map.pop(token, None)
+        return token
+
+    def _ensure_plans(self):
+        """Recompile token plans if token_map/user_settings changed since the last build"""
+        versions = self._map_versions()
+        if versions != self._plan_versions:
+            self.cooldowns.retain(s for subscribers in self._token_map.values() for s in subscribers)
+            self.token_plans = build_plans(self._token_map, self._user_settings, self.cooldowns.slot_of)
+            self.indicators.prune(self.token_plans)
+            self.user_tokens = {}
+            for token, subscribers in self._token_map.items():
+                for user_id, symbol in subscribers:
+                    self.user_tokens.setdefault(user_id, {})[symbol] = token
+            self._plan_versions = versions
+            if self.shards:
+                self.shards.sync(self._token_map, self._user_settings)
 
     async def process_ticks(self, ticks: List[Dict]):
-        # Optimized process_ticks using cached token_map
+        self._ensure_plans()
+        self.cooldowns.sweep()
+        if self.shards:
+            self.shards.dispatch(ticks)
+            return
+        self._absorb_conflated(ticks)
+        if self.mode == "reference":
+            await self.process_ticks_reference(ticks)
+        else:
+            await self.process_ticks_batch(ticks)
+
+    def _absorb_conflated(self, ticks: List[Dict]):
+        """Let indicators see the high/low of ticks the queue conflated away"""
+        now = self.clock()
+        for tick in ticks:
+            if "conflated_high" not in tick:
+                continue
+            plan = self.token_plans.get(tick["instrument_token"])
+            if plan is not None:
+                self.indicators.absorb(tick["instrument_token"], plan, tick["conflated_high"], tick["conflated_low"], tick_time(tick, now))
+
+    async def process_ticks_reference(self, ticks: List[Dict]):
+        # Per-tick path (kept as the parity reference for batch mode)
         
+        now = self.clock()
         for tick in ticks:
             token = tick["instrument_token"]
             price = tick["last_price"]
             
             # O(1) Lookup
-            if token not in self.token_map:
+            plan = self.token_plans.get(token)
+            if plan is None:
                 continue
-                
-            for user_id, symbol in self.token_map[token]:
-                settings = self.user_settings.get(user_id)
-                if not settings:
-                    continue
 
-                # --- Run Algorithms ---
+            # --- Run Algorithms (once per tick, shared by all subscribers) ---
+            t_dip, t_spike = 0.0, 0.0
+            if plan.trailing:
+                t_dip, t_spike = self.indicators.trailing.process_tick(token, price)
+                t_dip, t_spike = t_dip or 0, t_spike or 0
+
+            rolling = {}
+            for window in plan.windows:
+                rolling[window] = self.indicators.rolling_algo(window).process_tick(token, price, tick_time(tick, now))
+
+            # Indicators must still see the tick, but nobody can alert while all are cooling down
+            if not self.cooldowns.any_ready(plan.cooldown_keys):
+                continue
+
+            # --- Fan Out & Check Thresholds ---
+            hits = []
+            for group in plan.groups:
                 dip_pct, spike_pct = 0.0, 0.0
-                
-                # Trailing
-                if settings.algo_mode in [AlgoMode.TRAILING, AlgoMode.BOTH]:
-                    t_dip, t_spike = self.trailing_algo.process_tick(token, price)
-                    dip_pct = max(dip_pct, t_dip or 0)
-                    spike_pct = max(spike_pct, t_spike or 0)
-
-                # Rolling
-                if settings.algo_mode in [AlgoMode.ROLLING, AlgoMode.BOTH]:
-                    r_algo = self.rolling_algos.get(user_id)
-                    if r_algo:
-                        r_dip, r_spike = r_algo.process_tick(token, price)
-                        dip_pct = max(dip_pct, r_dip)
-                        spike_pct = max(spike_pct, r_spike)
-
-                # --- Check Thresholds ---
-                if dip_pct >= settings.dip_threshold:
-                    await self.trigger_alert(user_id, symbol, price, dip_pct, AlertType.DIP, settings)
-                
-                if spike_pct >= settings.rise_threshold:
-                    await self.trigger_alert(user_id, symbol, price, spike_pct, AlertType.SPIKE, settings)
+
+                if group.trailing:
+                    dip_pct = max(dip_pct, t_dip)
+                    spike_pct = max(spike_pct, t_spike)
+
+                if group.window is not None:
+                    r_dip, r_spike = rolling[group.window]
+                    dip_pct = max(dip_pct, r_dip)
+                    spike_pct = max(spike_pct, r_spike)
+
+                for i in group.dip_members[:group.crossed_dips(dip_pct)]:
+                    hits.append((i, 0, dip_pct, AlertType.DIP))
+                for i in group.rise_members[:group.crossed_spikes(spike_pct)]:
+                    hits.append((i, 1, spike_pct, AlertType.SPIKE))
+
+            # Fire in subscriber order, DIP before SPIKE
+            hits.sort(key=lambda hit: hit[:2])
+            for i, _, change, type in hits:
+                await self.trigger_alert(plan.user_ids[i], plan.symbols[i], price, change, type, plan.settings[i])
+
+    async def process_ticks_batch(self, ticks: List[Dict]):
+        """Evaluate a whole batch column-wise; fires the same alerts, in the same order, as the reference path"""
+        batch = TickBatch(ticks, self.token_plans, self.clock())
+        if not len(batch):
+            return
+
+        # Trailing state only moves for tokens with at least one trailing subscriber
+        trailing_slots = np.fromiter((self.token_plans[token].trailing for token in batch.tokens.tolist()), dtype=bool, count=len(batch.tokens))
+        t_dip, t_spike = trailing_batch(self.indicators.trailing.state, batch, trailing_slots[batch.slots])
+
+        # (row, subscriber position, type order) -> alert args
+        hits = []
+        for token, start, end in batch.groups():
+            plan = self.token_plans[token]
+            prices = batch.prices[start:end]
+
+            rolling = {}
+            for window in plan.windows:
+                rolling[window] = self.indicators.rolling_algo(window).process_batch(token, prices, batch.timestamps[start:end])
+
+            if not self.cooldowns.any_ready(plan.cooldown_keys):
+                continue
+
+            for group in plan.groups:
+                dip_pct = np.zeros(end - start)
+                spike_pct = np.zeros(end - start)
+                if group.trailing:
+                    dip_pct = np.maximum(dip_pct, t_dip[start:end])
+                    spike_pct = np.maximum(spike_pct, t_spike[start:end])
+                if group.window is not None:
+                    r_dip, r_spike = rolling[group.window]
+                    dip_pct = np.maximum(dip_pct, r_dip)
+                    spike_pct = np.maximum(spike_pct, r_spike)
+
+                # Only subscribers whose threshold is below the batch extreme can alert
+                for j in range(group.crossed_dips(dip_pct.max())):
+                    i = group.dip_members[j]
+                    for k in np.flatnonzero(dip_pct >= group.dip_thresholds[j]).tolist():
+                        row = batch.rows[batch.order[start + k]]
+                        hits.append((row, i, 0, plan.user_ids[i], plan.symbols[i], float(dip_pct[k]), AlertType.DIP, plan.settings[i]))
+                for j in range(group.crossed_spikes(spike_pct.max())):
+                    i = group.rise_members[j]
+                    for k in np.flatnonzero(spike_pct >= group.rise_thresholds[j]).tolist():
+                        row = batch.rows[batch.order[start + k]]
+                        hits.append((row, i, 1, plan.user_ids[i], plan.symbols[i], float(spike_pct[k]), AlertType.SPIKE, plan.settings[i]))
+
+        hits.sort(key=lambda hit: hit[:3])
+        for row, _, _, user_id, symbol, change, type, settings in hits:
+            await self.trigger_alert(user_id, symbol, ticks[row]["last_price"], change, type, settings)
 
     async def trigger_alert(self, user_id: str, symbol: str, price: float, change: float, type: AlertType, settings: SettingsInDB):
         # Check Cooldown
-        alert_key = f"{user_id}:{symbol}:{type}"
-        last_time = self.last_alert_time.get(alert_key)
-        
-        if last_time and (datetime.utcnow() - last_time).total_seconds() < settings.cooldown_minutes * 60:
+        alert_key = self.cooldowns.key(user_id, symbol, type)
+        if not self.cooldowns.ready(alert_key):
             return # In cooldown
 
         # Select emoji and phrase based on type
@@ -180,21 +466,21 @@ class AlertEngine:
             "price": price,
             "change_percent": change,
             "alert_type": type,
-            "timestamp": datetime.utcnow(),
+            "timestamp": datetime.utcfromtimestamp(self.clock()),
             "message": formatted_message
         }
         
         # Batch insert
-        self.alert_buffer.append(alert_log)
+        self.alert_writer.add(alert_log)
         
         # Update cooldown
-        self.last_alert_time[alert_key] = datetime.utcnow()
+        self.cooldowns.start(alert_key, settings.cooldown_minutes * 60)
         
         # Send Notifications (Async)
         print(f"ALERT SENT: {alert_log['message']}")
         from backend.services.notifications import notification_service
         # Fire and forget to avoid blocking
-        asyncio.create_task(notification_service.send_all(settings, alert_log['message']))
+        asyncio.create_task(notification_service.send_alert(settings, alert_log))
 
         # Broadcast to Frontend (Real-Time Activity Log)
         if self.connection_manager:
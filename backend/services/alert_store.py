@@ -0,0 +1,183 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+# A batch is written as soon as it reaches this size, or after ALERT_FLUSH_SECONDS, whichever comes first
+ALERT_FLUSH_MAX_BATCH = int(os.getenv("ALERT_FLUSH_MAX_BATCH", 500))
+ALERT_FLUSH_SECONDS = float(os.getenv("ALERT_FLUSH_SECONDS", 1))
+# Alerts held in memory at most; beyond this they go straight to the spool
+ALERT_BUFFER_MAX = int(os.getenv("ALERT_BUFFER_MAX", 20000))
+# Append-only file that alerts spill to while MongoDB is unavailable ("" disables)
+ALERT_SPOOL_PATH = os.getenv("ALERT_SPOOL_PATH", "alert_spool.jsonl")
+
+DUPLICATE_KEY = 11000
+
+class AlertWriter:
+    """Buffers alert logs and bulk-inserts them, spilling to a local spool when the DB is down.
+
+    Inserts are unordered, so one bad document doesn't hold up the rest.
+    Documents get their _id before the first attempt (pymongo assigns it in
+    place), so replaying the spool after a partial write only hits duplicate
+    key errors, which are ignored. The spool is replayed after the next
+    successful flush, and on startup.
+    """
+    def __init__(self, collection: Callable, spool_path: str = ALERT_SPOOL_PATH, max_batch: int = ALERT_FLUSH_MAX_BATCH,
+                 interval: float = ALERT_FLUSH_SECONDS, buffer_max: int = ALERT_BUFFER_MAX):
+        self.collection = collection # Called per flush: the DB connects after the engine is built
+        self.spool_path = spool_path
+        self.max_batch = max_batch
+        self.interval = interval
+        self.buffer_max = buffer_max
+        self.buffer: List[Dict] = []
+        self.full = asyncio.Event()
+        self.spool_depth = self._count(spool_path) + self._count(self._replay_path) if spool_path else 0
+        self.replaying = False
+        self.spool_lock = threading.Lock() # Spills come from the event loop and from worker threads
+        self.metrics = {"flushes": 0, "inserted": 0, "spooled": 0, "replayed": 0, "failed_flushes": 0,
+                        "bad_lines": 0, "last_flush_ms": None, "last_batch": 0}
+
+    @property
+    def _replay_path(self) -> str:
+        return self.spool_path + ".replaying"
+
+    @property
+    def _bad_path(self) -> str:
+        return self.spool_path + ".bad"
+
+    @staticmethod
+    def _count(path: str) -> int:
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb") as f:
+            return sum(1 for _ in f)
+
+    def add(self, alert: Dict):
+        self.buffer.append(alert)
+        if len(self.buffer) >= self.max_batch:
+            self.full.set()
+        if len(self.buffer) > self.buffer_max and self.spool_path:
+            # The writer can't keep up; bound memory by moving the backlog to disk
+            self.spill(self.buffer)
+            self.buffer = []
+
+    async def run(self):
+        if self.spool_depth:
+            await self.replay()
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            while self.buffer:
+                await self.flush()
+                if len(self.buffer) < self.max_batch:
+                    break
+
+    async def flush(self):
+        batch, self.buffer = self.buffer[:self.max_batch], self.buffer[self.max_batch:]
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            await self._insert(batch)
+        except Exception as e:
+            self.metrics["failed_flushes"] += 1
+            print(f"Error flushing alerts: {e}. Spooling {len(batch)} alerts to {self.spool_path or 'nowhere'}")
+            if self.spool_path:
+                await asyncio.to_thread(self.spill, batch)
+            return
+        self.metrics["flushes"] += 1
+        self.metrics["inserted"] += len(batch)
+        self.metrics["last_batch"] = len(batch)
+        self.metrics["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        print(f"Flushed {len(batch)} alerts to DB")
+        if self.spool_depth and not self.replaying:
+            asyncio.create_task(self.replay())
+
+    async def _insert(self, documents: List[Dict]):
+        """Unordered bulk insert; documents already stored (by an earlier partial write) are fine"""
+        try:
+            await self.collection().insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY]
+            if errors or e.details.get("writeConcernErrors"):
+                raise
+
+    def spill(self, documents: List[Dict]):
+        """Append to the spool (blocking; fsynced so a crash right after doesn't lose them)"""
+        lines = "".join(json_util.dumps(document) + "\n" for document in documents).encode()
+        with self.spool_lock:
+            with open(self.spool_path, "ab+") as f:
+                # A crash mid-spill leaves a line without its newline; don't glue the next record onto it
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        lines = b"\n" + lines
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self.spool_depth += len(documents)
+            self.metrics["spooled"] += len(documents)
+
+    async def replay(self):
+        """Insert everything in the spool; the file is only removed once all of it is stored"""
+        if self.replaying:
+            return
+        self.replaying = True
+        try:
+            # New spills go to a fresh file while this one is replayed
+            with self.spool_lock:
+                if os.path.exists(self.spool_path) and not os.path.exists(self._replay_path):
+                    os.replace(self.spool_path, self._replay_path)
+            if not os.path.exists(self._replay_path):
+                return
+            batch = []
+            with open(self._replay_path, errors="replace") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        batch.append(json_util.loads(line))
+                    except ValueError:
+                        # Torn by a crash mid-spill: set it aside instead of blocking the rest of the spool
+                        self._set_aside(line)
+                        continue
+                    if len(batch) >= self.max_batch:
+                        await self._insert(batch)
+                        self._replayed(len(batch))
+                        batch = []
+            if batch:
+                await self._insert(batch)
+                self._replayed(len(batch))
+            os.remove(self._replay_path)
+            with self.spool_lock:
+                self.spool_depth = self._count(self.spool_path) # Whatever was spilled meanwhile
+            print("Alert spool replayed into DB")
+        except Exception as e:
+            print(f"Error replaying alert spool: {e}. Will retry after the next successful flush")
+            self.spool_depth = self._count(self.spool_path) + self._count(self._replay_path)
+        finally:
+            self.replaying = False
+
+    def _set_aside(self, line: str):
+        with open(self._bad_path, "a") as f:
+            f.write(line if line.endswith("\n") else line + "\n")
+        self.metrics["bad_lines"] += 1
+
+    def _replayed(self, count: int):
+        self.metrics["replayed"] += count
+        self.spool_depth = max(0, self.spool_depth - count)
+
+    def close(self):
+        """Shutdown: whatever is still buffered goes to the spool, to be inserted on next start"""
+        if self.buffer and self.spool_path:
+            self.spill(self.buffer)
+            self.buffer = []
+
+    def status(self) -> Dict:
+        return {**self.metrics, "buffered": len(self.buffer), "spool_depth": self.spool_depth}
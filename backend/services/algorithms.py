@@ -1,8 +1,16 @@
+import time
+from array import array
 from collections import deque
 from typing import Dict, Optional, Tuple
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import numpy as np
 from backend.models import AlgoMode
 
+# Below this many ticks NumPy call overhead outweighs the vectorized math
+VECTOR_MIN_TICKS = 8
+# Kite sends exchange timestamps as naive datetimes in Indian Standard Time
+IST = timezone(timedelta(hours=5, minutes=30))
+
 class TrailingAlgo:
     def __init__(self):
         # Stores state for each token: {token_id: {'high': float, 'low': float}}
@@ -32,40 +40,174 @@ class TrailingAlgo:
 
         return dip_percent, spike_percent
 
+    def absorb(self, token: int, high: float, low: float):
+        """Fold in extremes of ticks that were conflated away (no alert evaluation)"""
+        data = self.state.get(token)
+        if data is None:
+            self.state[token] = {'high': high, 'low': low}
+            return
+        if high > data['high']:
+            data['high'] = high
+        if low < data['low']:
+            data['low'] = low
+
 class RollingWindowState:
-    def __init__(self, window_minutes: int):
+    """Sliding-window min/max over (timestamp, price) ticks.
+
+    Ticks live in a preallocated float64 ring (power-of-two capacity, grown
+    on demand); the monotonic min/max queues hold absolute tick sequence
+    numbers into it. Only ticks still referenced by a queue are kept, so the
+    ring holds just the candidates for a future window extreme.
+    Timestamps are float seconds and never move backwards within a window.
+    """
+    __slots__ = ("window_seconds", "times", "prices", "mask", "head", "tail", "min_queue", "max_queue", "last_time")
+
+    def __init__(self, window_minutes: int, capacity: int = 16):
         self.window_seconds = window_minutes * 60
-        self.data = deque() # Stores (timestamp, price)
-        self.min_deque = deque() # Stores (timestamp, price) for min tracking
-        self.max_deque = deque() # Stores (timestamp, price) for max tracking
-
-    def update(self, price: float, timestamp: datetime) -> Tuple[float, float]:
-        # 1. Remove expired items from data
-        while self.data and (timestamp - self.data[0][0]).total_seconds() > self.window_seconds:
-            self.data.popleft()
-        
-        # 2. Remove expired items from min/max deques
-        while self.min_deque and (timestamp - self.min_deque[0][0]).total_seconds() > self.window_seconds:
-            self.min_deque.popleft()
-        while self.max_deque and (timestamp - self.max_deque[0][0]).total_seconds() > self.window_seconds:
-            self.max_deque.popleft()
+        self.times = array('d', bytes(8 * capacity))
+        self.prices = array('d', bytes(8 * capacity))
+        self.mask = capacity - 1 # capacity is a power of two
+        self.head = 0 # Oldest sequence number still referenced by a queue
+        self.tail = 0 # Next sequence number to write
+        self.min_queue = deque() # Sequence numbers, prices increasing (front is min)
+        self.max_queue = deque() # Sequence numbers, prices decreasing (front is max)
+        self.last_time = float("-inf")
+
+    def _expire(self, timestamp: float) -> float:
+        if timestamp < self.last_time:
+            timestamp = self.last_time
+        self.last_time = timestamp
+
+        times, mask, window = self.times, self.mask, self.window_seconds
+        min_queue, max_queue = self.min_queue, self.max_queue
+        while min_queue and timestamp - times[min_queue[0] & mask] > window:
+            min_queue.popleft()
+        while max_queue and timestamp - times[max_queue[0] & mask] > window:
+            max_queue.popleft()
+        return timestamp
+
+    def _reserve(self, count: int):
+        """Release slots no queue references anymore and make room for `count` more"""
+        fronts = [queue[0] for queue in (self.min_queue, self.max_queue) if queue]
+        self.head = min(fronts) if fronts else self.tail
+
+        capacity = self.mask + 1
+        needed = self.tail - self.head + count
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        times = array('d', bytes(8 * capacity))
+        prices = array('d', bytes(8 * capacity))
+        new_mask = capacity - 1
+        for seq in range(self.head, self.tail):
+            times[seq & new_mask] = self.times[seq & self.mask]
+            prices[seq & new_mask] = self.prices[seq & self.mask]
+        self.times, self.prices, self.mask = times, prices, new_mask
+
+    def update(self, price: float, timestamp: float) -> Tuple[float, float]:
+        # 1. Remove expired items from min/max queues
+        timestamp = self._expire(timestamp)
+
+        # 2. Maintain Monotonic Properties
+        # Min Queue: Increasing order (front is min)
+        prices = self.prices
+        mask = self.mask
+        min_queue, max_queue = self.min_queue, self.max_queue
+        while min_queue and prices[min_queue[-1] & mask] >= price:
+            min_queue.pop()
+        # Max Queue: Decreasing order (front is max)
+        while max_queue and prices[max_queue[-1] & mask] <= price:
+            max_queue.pop()
+
+        # 3. Store the tick (the newest tick is always a candidate for both)
+        self._reserve(1)
+        seq = self.tail
+        self.times[seq & self.mask] = timestamp
+        self.prices[seq & self.mask] = price
+        self.tail = seq + 1
+        min_queue.append(seq)
+        max_queue.append(seq)
+
+        # 4. Return current Min/Max
+        return self.prices[min_queue[0] & self.mask], self.prices[max_queue[0] & self.mask]
+
+    def export(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Live ticks oldest first: (times, prices, in_min_queue, in_max_queue)"""
+        seqs = np.arange(self.head, self.tail)
+        slots = seqs & self.mask
+        times = np.frombuffer(self.times, dtype=np.float64)[slots]
+        prices = np.frombuffer(self.prices, dtype=np.float64)[slots]
+        return times, prices, np.isin(seqs, list(self.min_queue)), np.isin(seqs, list(self.max_queue))
+
+    @classmethod
+    def restore(cls, window_minutes: int, times: np.ndarray, prices: np.ndarray,
+                in_min: np.ndarray, in_max: np.ndarray, last_time: float) -> "RollingWindowState":
+        """Rebuild a state from export() output"""
+        capacity = 16
+        while capacity < len(times):
+            capacity *= 2
+        state = cls(window_minutes, capacity)
+        np.frombuffer(state.times, dtype=np.float64)[:len(times)] = times
+        np.frombuffer(state.prices, dtype=np.float64)[:len(prices)] = prices
+        state.tail = len(times)
+        state.min_queue.extend(np.flatnonzero(in_min).tolist())
+        state.max_queue.extend(np.flatnonzero(in_max).tolist())
+        state.last_time = last_time
+        return state
+
+    def update_batch(self, prices: np.ndarray, timestamp: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Equivalent to calling update() for each price with the same timestamp.
+        Returns arrays of the running window Min/Max after each price."""
+        # 1. Expire once: ticks stamped with the same time cannot expire each other
+        timestamp = self._expire(timestamp)
+
+        # 2. Running extremes = batch prefix extremes combined with what is already in the window
+        mask = self.mask
+        prior_min = self.prices[self.min_queue[0] & mask] if self.min_queue else np.inf
+        prior_max = self.prices[self.max_queue[0] & mask] if self.max_queue else -np.inf
+        mins = np.minimum(np.minimum.accumulate(prices), prior_min)
+        maxs = np.maximum(np.maximum.accumulate(prices), prior_max)
 
         # 3. Maintain Monotonic Properties
-        # Min Deque: Increasing order (front is min)
-        while self.min_deque and self.min_deque[-1][1] >= price:
-            self.min_deque.pop()
-        self.min_deque.append((timestamp, price))
+        # Only prices strictly below (above) everything after them survive in the min (max) queue
+        later_min = np.append(np.minimum.accumulate(prices[::-1])[::-1][1:], np.inf)
+        later_max = np.append(np.maximum.accumulate(prices[::-1])[::-1][1:], -np.inf)
+        batch_low, batch_high = prices.min(), prices.max()
+        while self.min_queue and self.prices[self.min_queue[-1] & mask] >= batch_low:
+            self.min_queue.pop()
+        while self.max_queue and self.prices[self.max_queue[-1] & mask] <= batch_high:
+            self.max_queue.pop()
+
+        # 4. Store only the survivors, in order
+        min_survivor = prices < later_min
+        max_survivor = prices > later_max
+        keep = min_survivor | max_survivor
+        kept = prices[keep].tolist()
+        self._reserve(len(kept))
+        first = self.tail
+        for seq, price in enumerate(kept, first):
+            self.times[seq & self.mask] = timestamp
+            self.prices[seq & self.mask] = price
+        self.tail = first + len(kept)
+        seqs = np.arange(first, self.tail)
+        self.min_queue.extend(seqs[min_survivor[keep]].tolist())
+        self.max_queue.extend(seqs[max_survivor[keep]].tolist())
 
-        # Max Deque: Decreasing order (front is max)
-        while self.max_deque and self.max_deque[-1][1] <= price:
-            self.max_deque.pop()
-        self.max_deque.append((timestamp, price))
+        return mins, maxs
 
-        # 4. Add to data
-        self.data.append((timestamp, price))
 
-        # 5. Return current Min/Max
-        return self.min_deque[0][1], self.max_deque[0][1]
+def tick_time(tick: Dict, default: float) -> float:
+    """Exchange time of a tick as epoch seconds, or `default` when the feed sent none"""
+    timestamp = tick.get("exchange_timestamp") or tick.get("timestamp")
+    if isinstance(timestamp, datetime):
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=IST) # Not the server's local zone
+        return timestamp.timestamp()
+    if isinstance(timestamp, float):
+        return timestamp
+    return default
+
 
 class RollingWindowAlgo:
     def __init__(self, window_minutes: int = 10):
@@ -73,14 +215,15 @@ class RollingWindowAlgo:
         # Stores state: {token_id: RollingWindowState}
         self.state: Dict[int, RollingWindowState] = {}
 
-    def process_tick(self, token: int, price: float) -> Tuple[Optional[float], Optional[float]]:
-        now = datetime.utcnow()
+    def process_tick(self, token: int, price: float, timestamp: Optional[float] = None) -> Tuple[Optional[float], Optional[float]]:
+        if timestamp is None:
+            timestamp = time.time()
         
         if token not in self.state:
             self.state[token] = RollingWindowState(self.window_minutes)
 
         window_state = self.state[token]
-        window_low, window_high = window_state.update(price, now)
+        window_low, window_high = window_state.update(price, timestamp)
 
         if window_high == 0: return 0.0, 0.0
 
@@ -88,3 +231,40 @@ class RollingWindowAlgo:
         spike_percent = ((price - window_low) / window_low) * 100
 
         return dip_percent, spike_percent
+
+    def absorb(self, token: int, high: float, low: float, timestamp: float):
+        """Fold in extremes of ticks that were conflated away (no alert evaluation)"""
+        if token not in self.state:
+            self.state[token] = RollingWindowState(self.window_minutes)
+        self.state[token].update(high, timestamp)
+        self.state[token].update(low, timestamp)
+
+    def process_batch(self, token: int, prices: np.ndarray, timestamps: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorized process_tick over consecutive ticks of one token"""
+        if token not in self.state:
+            self.state[token] = RollingWindowState(self.window_minutes)
+
+        window_state = self.state[token]
+        # Ticks can expire each other only when their timestamps differ
+        if len(prices) < VECTOR_MIN_TICKS or (timestamps != timestamps[0]).any():
+            dips, spikes = [], []
+            for price, timestamp in zip(prices.tolist(), timestamps.tolist()):
+                window_low, window_high = window_state.update(price, timestamp)
+                if window_high == 0:
+                    dips.append(0.0)
+                    spikes.append(0.0)
+                else:
+                    dips.append(((window_high - price) / window_high) * 100)
+                    spikes.append(((price - window_low) / window_low) * 100)
+            return np.array(dips), np.array(spikes)
+
+        window_low, window_high = window_state.update_batch(prices, float(timestamps[0]))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dip_percent = ((window_high - prices) / window_high) * 100
+            spike_percent = ((prices - window_low) / window_low) * 100
+        zero = window_high == 0
+        dip_percent[zero] = 0.0
+        spike_percent[zero] = 0.0
+
+        return dip_percent, spike_percent
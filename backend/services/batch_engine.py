@@ -0,0 +1,127 @@
+import time
+import numpy as np
+from typing import Dict, List, Tuple
+from backend.services.algorithms import tick_time
+
+class TickBatch:
+    """Columnar view of a tick batch (only ticks for monitored tokens).
+
+    Rows are grouped by token: `order` sorts the batch so that every token's
+    ticks are contiguous (arrival order is kept inside a group), `slots` holds
+    the per-batch token slot of each row in that sorted order.
+    """
+    __slots__ = ("rows", "tokens", "prices", "timestamps", "slots", "order", "bounds")
+
+    def __init__(self, ticks: List[Dict], token_map: Dict, now: float = None):
+        # Indices into the original tick list, in arrival order
+        self.rows = [i for i, tick in enumerate(ticks) if tick["instrument_token"] in token_map]
+        tokens = np.fromiter((ticks[i]["instrument_token"] for i in self.rows), dtype=np.int64, count=len(self.rows))
+        prices = np.fromiter((ticks[i]["last_price"] for i in self.rows), dtype=np.float64, count=len(self.rows))
+        # Exchange time when the feed has it, else the time the batch arrived
+        now = time.time() if now is None else now
+        timestamps = np.fromiter((tick_time(ticks[i], now) for i in self.rows), dtype=np.float64, count=len(self.rows))
+
+        # Token slots: one per distinct token in this batch
+        self.tokens, slots = np.unique(tokens, return_inverse=True)
+        self.order = np.argsort(slots, kind="stable")
+        self.slots = slots[self.order]
+        self.prices = prices[self.order]
+        self.timestamps = timestamps[self.order]
+
+        # Group boundaries in sorted order: ticks of tokens[k] are [bounds[k], bounds[k + 1])
+        self.bounds = np.searchsorted(self.slots, np.arange(len(self.tokens) + 1))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def groups(self):
+        """Yield (token, start, end) for every token slot in the sorted batch"""
+        for k, token in enumerate(self.tokens.tolist()):
+            yield token, int(self.bounds[k]), int(self.bounds[k + 1])
+
+
+def segmented_running_max(values: np.ndarray, slots: np.ndarray) -> np.ndarray:
+    """Running max that restarts at every slot boundary (slots must be sorted).
+
+    Works on integer ranks so the result is bit-exact: offsetting each slot by
+    `slot * n_unique` makes earlier slots strictly smaller than later ones, so
+    a single `maximum.accumulate` never carries across a boundary.
+    """
+    if len(values) == 0:
+        return values.copy()
+    uniq, ranks = np.unique(values, return_inverse=True)
+    offset = slots.astype(np.int64) * len(uniq)
+    return uniq[np.maximum.accumulate(ranks + offset) - offset]
+
+
+def segmented_running_min(values: np.ndarray, slots: np.ndarray) -> np.ndarray:
+    """Running min that restarts at every slot boundary (slots must be sorted)"""
+    if len(values) == 0:
+        return values.copy()
+    uniq, ranks = np.unique(values, return_inverse=True)
+    offset = slots.astype(np.int64) * len(uniq)
+    # Negative offsets make earlier slots strictly larger than later ones
+    return uniq[np.minimum.accumulate(ranks - offset) + offset]
+
+
+def percent_moves(high: np.ndarray, low: np.ndarray, prices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized dip-from-high and spike-from-low, using the same float ops as the scalar algos"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dip = ((high - prices) / high) * 100
+        spike = ((prices - low) / low) * 100
+    return dip, spike
+
+
+def trailing_batch(state: Dict[int, Dict[str, float]], batch: TickBatch, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Apply a batch to TrailingAlgo state in one pass.
+
+    `mask` (per sorted row) selects the rows whose token has a trailing
+    subscriber; other tokens are left untouched, like the per-tick path.
+    Returns (dip, spike) per sorted row, 0.0 where no move was computed.
+    """
+    n = len(batch)
+    dip = np.zeros(n)
+    spike = np.zeros(n)
+    if not mask.any():
+        return dip, spike
+
+    slots = batch.slots[mask]
+    prices = batch.prices[mask]
+
+    # Prior high/low per slot; unseen tokens start from the first tick
+    prior_high = np.full(len(batch.tokens), -np.inf)
+    prior_low = np.full(len(batch.tokens), np.inf)
+    seen = np.zeros(len(batch.tokens), dtype=bool)
+    for k, token in enumerate(batch.tokens.tolist()):
+        data = state.get(token)
+        if data is not None:
+            prior_high[k] = data['high']
+            prior_low[k] = data['low']
+            seen[k] = True
+
+    high = np.maximum(segmented_running_max(prices, slots), prior_high[slots])
+    low = np.minimum(segmented_running_min(prices, slots), prior_low[slots])
+    t_dip, t_spike = percent_moves(high, low, prices)
+
+    # The first tick ever seen for a token only initializes the state
+    first = np.ones(len(slots), dtype=bool)
+    first[1:] = slots[1:] != slots[:-1]
+    first &= ~seen[slots]
+    t_dip[first] = 0.0
+    t_spike[first] = 0.0
+
+    dip[mask] = t_dip
+    spike[mask] = t_spike
+
+    # Write back the final high/low of every touched token
+    last = np.ones(len(slots), dtype=bool)
+    last[:-1] = slots[1:] != slots[:-1]
+    for slot, h, l in zip(slots[last].tolist(), high[last].tolist(), low[last].tolist()):
+        token = int(batch.tokens[slot])
+        if token in state:
+            state[token]['high'] = h
+            state[token]['low'] = l
+        else:
+            state[token] = {'high': h, 'low': l}
+
+    return dip, spike
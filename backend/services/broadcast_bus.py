@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Dict, List
+from backend.services.tick_codec import encode_message
+
+# "local" delivers in-process only; "redis" fans frames out to every replica over Redis pub/sub
+WS_BROADCAST_BUS = os.getenv("WS_BROADCAST_BUS", "local")
+WS_BROADCAST_CHANNEL = os.getenv("WS_BROADCAST_CHANNEL", "stormalert:ws")
+
+# Bus message kinds
+TICKS = "ticks"
+MESSAGE = "message"
+CACHE_EVENT = "cache_event" # Watchlist/settings deltas, so every replica's caches follow every write
+
+Handler = Callable[[str, object], Awaitable[None]]
+
+class LocalBus:
+    """In-process stand-in: publishing delivers straight to this process' handlers.
+
+    Several ConnectionManagers subscribed to one LocalBus behave like
+    replicas sharing a Redis channel, which is how the tests use it.
+    """
+    def __init__(self):
+        self.handlers: List[Handler] = []
+        self.metrics = {"published": 0, "received": 0}
+
+    def subscribe(self, handler: Handler):
+        if handler not in self.handlers:
+            self.handlers.append(handler)
+
+    async def publish(self, kind: str, data):
+        self.metrics["published"] += 1
+        await self._deliver(kind, data)
+
+    async def _deliver(self, kind: str, data):
+        self.metrics["received"] += 1
+        for handler in self.handlers:
+            try:
+                await handler(kind, data)
+            except Exception as e:
+                print(f"Error delivering broadcast: {e}")
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def status(self) -> Dict:
+        return {"bus": "local", **self.metrics}
+
+
+class RedisBus(LocalBus):
+    """Redis pub/sub backbone: the process that owns the feed publishes each
+    frame once; every replica (itself included) receives it from the channel
+    and delivers it to its own sockets."""
+    def __init__(self, redis_url: str, channel: str = WS_BROADCAST_CHANNEL):
+        super().__init__()
+        self.redis_url = redis_url
+        self.channel = channel
+        self.redis = None
+        self.listener = None
+
+    async def start(self):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(self.redis_url)
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self.channel)
+        self.listener = asyncio.create_task(self._listen(pubsub))
+
+    async def _listen(self, pubsub):
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    payload = json.loads(message["data"])
+                    await self._deliver(payload["kind"], payload["data"])
+            except asyncio.CancelledError:
+                await pubsub.aclose()
+                raise
+            except Exception as e:
+                print(f"Broadcast bus listener error: {e}. Resubscribing in 1s...")
+                await asyncio.sleep(1)
+                try:
+                    await pubsub.subscribe(self.channel)
+                except Exception:
+                    pass
+
+    async def publish(self, kind: str, data):
+        self.metrics["published"] += 1
+        # Datetimes in ticks become ISO strings, as they would on the wire anyway
+        await self.redis.publish(self.channel, encode_message({"kind": kind, "data": data}))
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            self.listener = None
+        if self.redis:
+            await self.redis.aclose()
+            self.redis = None
+
+    def status(self) -> Dict:
+        return {"bus": "redis", "channel": self.channel, **self.metrics}
+
+
+def create_bus():
+    if WS_BROADCAST_BUS == "redis":
+        return RedisBus(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return LocalBus()
@@ -0,0 +1,135 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+from backend.models import SettingsInDB
+
+STOCK_ADDED = "stock_added"
+STOCK_REMOVED = "stock_removed"
+SETTINGS_UPDATED = "settings_updated"
+
+class CacheEvent:
+    """One delta for the alert engine's in-memory maps"""
+    __slots__ = ("kind", "user_id", "symbol", "instrument_token", "settings", "stock_id")
+
+    def __init__(self, kind: str, user_id: str, symbol: str = None, instrument_token: int = None,
+                 settings: SettingsInDB = None, stock_id: str = None):
+        self.kind = kind
+        self.user_id = str(user_id)
+        self.symbol = symbol
+        self.instrument_token = instrument_token
+        self.settings = settings
+        self.stock_id = stock_id
+
+    def __repr__(self):
+        return f"CacheEvent({self.kind}, user={self.user_id}, symbol={self.symbol}, token={self.instrument_token})"
+
+    def to_dict(self) -> Dict:
+        """JSON-safe form, for relaying to other replicas"""
+        return {
+            "kind": self.kind, "user_id": self.user_id, "symbol": self.symbol, "instrument_token": self.instrument_token,
+            "settings": self.settings.model_dump(mode="json", by_alias=True) if self.settings else None,
+            "stock_id": self.stock_id,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CacheEvent":
+        settings = SettingsInDB(**data["settings"]) if data.get("settings") else None
+        return cls(data["kind"], data["user_id"], symbol=data.get("symbol"), instrument_token=data.get("instrument_token"),
+                   settings=settings, stock_id=data.get("stock_id"))
+
+
+class CacheEventBus:
+    """In-process pub/sub for cache deltas.
+
+    Routers publish what they just wrote; the change-stream listener
+    publishes what other processes wrote. Handlers must be idempotent,
+    since the same write can arrive from both.
+
+    With several replicas, `relay` forwards every locally published event
+    to the others (only the feed replica watches change streams, and a
+    router write is only seen by the replica that served it); events that
+    arrive from another replica are published with relay=False.
+    """
+    def __init__(self):
+        self.handlers: List[Callable[[CacheEvent], None]] = []
+        self.relay: Optional[Callable[[CacheEvent], Awaitable]] = None
+
+    def subscribe(self, handler: Callable[[CacheEvent], None]):
+        if handler not in self.handlers:
+            self.handlers.append(handler)
+
+    def unsubscribe(self, handler: Callable[[CacheEvent], None]):
+        if handler in self.handlers:
+            self.handlers.remove(handler)
+
+    def publish(self, event: CacheEvent, relay: bool = True):
+        for handler in self.handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"Error applying cache event {event}: {e}")
+        if relay and self.relay:
+            asyncio.get_running_loop().create_task(self._relay(event))
+
+    async def _relay(self, event: CacheEvent):
+        try:
+            await self.relay(event)
+        except Exception as e:
+            print(f"Error relaying cache event {event}: {e}")
+
+    # --- Helpers for routers ---
+    def stock_added(self, user_id: str, symbol: str, instrument_token: int, stock_id: str = None):
+        self.publish(CacheEvent(STOCK_ADDED, user_id, symbol=symbol, instrument_token=instrument_token, stock_id=stock_id))
+
+    def stock_removed(self, user_id: str, symbol: str, instrument_token: int = None, stock_id: str = None):
+        self.publish(CacheEvent(STOCK_REMOVED, user_id, symbol=symbol, instrument_token=instrument_token, stock_id=stock_id))
+
+    def settings_updated(self, settings: SettingsInDB):
+        self.publish(CacheEvent(SETTINGS_UPDATED, settings.user_id, settings=settings))
+
+
+def stock_event(change: dict) -> Optional[CacheEvent]:
+    """Translate a `stocks` change-stream document into a CacheEvent"""
+    stock_id = str(change["documentKey"]["_id"])
+    if change["operationType"] == "delete":
+        # Only the _id survives a delete; the engine resolves it from its own index
+        return CacheEvent(STOCK_REMOVED, user_id="", stock_id=stock_id)
+    stock = change.get("fullDocument")
+    if not stock:
+        return None
+    if not stock.get("active", True) or not stock.get("instrument_token"):
+        return CacheEvent(STOCK_REMOVED, stock["user_id"], symbol=stock["symbol"], stock_id=stock_id)
+    return CacheEvent(STOCK_ADDED, stock["user_id"], symbol=stock["symbol"],
+                      instrument_token=stock["instrument_token"], stock_id=stock_id)
+
+
+def settings_event(change: dict) -> Optional[CacheEvent]:
+    """Translate a `settings` change-stream document into a CacheEvent"""
+    setting = change.get("fullDocument")
+    if not setting:
+        return None
+    return CacheEvent(SETTINGS_UPDATED, setting["user_id"], settings=SettingsInDB(**setting))
+
+
+async def watch_collection(db, collection: str, translate: Callable[[dict], Optional[CacheEvent]], bus: CacheEventBus):
+    """Forward a MongoDB change stream to the bus.
+    Returns quietly when change streams are unsupported (standalone mongod)."""
+    from pymongo.errors import OperationFailure
+    while True:
+        try:
+            async with db[collection].watch(full_document="updateLookup") as stream:
+                print(f"Watching '{collection}' change stream")
+                async for change in stream:
+                    event = translate(change)
+                    if event:
+                        bus.publish(event)
+        except OperationFailure as e:
+            print(f"Change streams unavailable for '{collection}' ({e}). Relying on router events.")
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Change stream error on '{collection}': {e}. Reconnecting in 5s...")
+            await asyncio.sleep(5)
+
+
+cache_events = CacheEventBus()
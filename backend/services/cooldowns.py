@@ -0,0 +1,127 @@
+import heapq
+import time
+import numpy as np
+from typing import Callable, Dict, List, Tuple
+from backend.models import AlertType
+
+# Alert type -> low bit of a cooldown key
+TYPE_ORDER = {AlertType.DIP: 0, AlertType.SPIKE: 1}
+
+class CooldownTable:
+    """Alert cooldowns keyed by integer (subscriber slot, alert type).
+
+    Every (user_id, symbol) subscriber is interned to a small integer slot;
+    its cooldown keys are `slot * 2 + type order`. Expiry times live in one
+    float64 array indexed by key, on a monotonic clock, so a check is an
+    array read and a whole token can be tested with one fancy index.
+    A heap of (expiry, key) lets `sweep` clear expired entries, and slots of
+    subscribers that went away are recycled once they stop cooling down.
+    """
+    def __init__(self, clock: Callable[[], float] = time.monotonic, capacity: int = 1024):
+        self.clock = clock
+        self.until = np.zeros(capacity) # key -> monotonic expiry, 0 when not cooling down
+        self.heap: List[Tuple[float, int]] = [] # (expiry, key); stale entries are skipped on pop
+        self.active = 0 # Keys currently cooling down
+        self.slots: Dict[Tuple[str, str], int] = {} # (user_id, symbol) -> slot
+        self.owners: List[Tuple[str, str]] = [] # slot -> (user_id, symbol), None when free
+        self.free: List[int] = []
+        self.orphans = set() # Released slots still cooling down
+
+    def __len__(self):
+        return self.active
+
+    def slot_of(self, user_id: str, symbol: str) -> int:
+        slot = self.slots.get((user_id, symbol))
+        if slot is not None:
+            self.orphans.discard(slot)
+            return slot
+        if self.free:
+            slot = self.free.pop()
+            self.owners[slot] = (user_id, symbol)
+        else:
+            slot = len(self.owners)
+            self.owners.append((user_id, symbol))
+            if 2 * slot + 2 > len(self.until):
+                self.until = np.concatenate([self.until, np.zeros(len(self.until))])
+        self.slots[(user_id, symbol)] = slot
+        return slot
+
+    def key(self, user_id: str, symbol: str, type: AlertType) -> int:
+        return 2 * self.slot_of(user_id, symbol) + TYPE_ORDER[type]
+
+    def ready(self, key: int, now: float = None) -> bool:
+        """True when `key` is out of cooldown"""
+        if not self.active:
+            return True
+        return (self.clock() if now is None else now) >= self.until[key]
+
+    def any_ready(self, keys: np.ndarray, now: float = None) -> bool:
+        """True when at least one of `keys` (e.g. every key of a token's subscribers) is out of cooldown.
+        An empty `keys` (a plan compiled without slots) counts as ready"""
+        if not self.active or not len(keys):
+            return True
+        return bool(((self.clock() if now is None else now) >= self.until[keys]).any())
+
+    def start(self, key: int, seconds: float, now: float = None):
+        """Put `key` in cooldown for `seconds`"""
+        if seconds <= 0:
+            return
+        until = (self.clock() if now is None else now) + seconds
+        if not self.until[key]:
+            self.active += 1
+        self.until[key] = until
+        heapq.heappush(self.heap, (until, key))
+
+    def sweep(self, now: float = None) -> int:
+        """Clear every expired cooldown; returns how many were cleared"""
+        now = self.clock() if now is None else now
+        heap, until = self.heap, self.until
+        cleared = 0
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            if until[key] != expiry:
+                continue # Re-armed since; a later heap entry owns it
+            until[key] = 0.0
+            self.active -= 1
+            cleared += 1
+            slot = key >> 1
+            if slot in self.orphans and not until[2 * slot] and not until[2 * slot + 1]:
+                self._free(slot)
+        return cleared
+
+    def release(self, user_id: str, symbol: str):
+        """Forget a subscriber; its slot is recycled once its cooldowns have expired"""
+        slot = self.slots.get((user_id, symbol))
+        if slot is None:
+            return
+        if self.until[2 * slot] or self.until[2 * slot + 1]:
+            self.orphans.add(slot) # A quick re-add must still honour the cooldown
+        else:
+            self._free(slot)
+
+    def retain(self, subscribers):
+        """Release every subscriber not in `subscribers` (an iterable of (user_id, symbol))"""
+        live = set(subscribers)
+        for pair in [pair for pair in self.slots if pair not in live]:
+            self.release(*pair)
+
+    def _free(self, slot: int):
+        self.orphans.discard(slot)
+        del self.slots[self.owners[slot]]
+        self.owners[slot] = None
+        self.free.append(slot)
+
+    def export(self, now: float = None) -> List[Tuple[str, str, int, float]]:
+        """Running cooldowns as (user_id, symbol, type order, seconds left); clock-independent"""
+        now = self.clock() if now is None else now
+        keys = np.flatnonzero(self.until > now).tolist()
+        return [(*self.owners[key >> 1], key & 1, float(self.until[key] - now)) for key in keys]
+
+    def restore(self, entries: List[Tuple[str, str, int, float]], now: float = None):
+        """Re-arm cooldowns from export() output"""
+        now = self.clock() if now is None else now
+        for user_id, symbol, order, remaining in entries:
+            self.start(2 * self.slot_of(user_id, symbol) + order, remaining, now)
+
+    def status(self) -> Dict:
+        return {"cooling": self.active, "subscribers": len(self.slots), "heap": len(self.heap)}
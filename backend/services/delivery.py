@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict
+
+# Provider limits: (sends/second, burst) for the whole channel and for one destination (chat, number, address).
+# Buckets live in each process, so these are split evenly over NOTIFY_PROCESSES senders.
+CHANNEL_LIMITS = {
+    "telegram": (float(os.getenv("NOTIFY_TELEGRAM_RATE", 25)), float(os.getenv("NOTIFY_TELEGRAM_DEST_RATE", 1))),
+    "whatsapp": (float(os.getenv("NOTIFY_WHATSAPP_RATE", 10)), float(os.getenv("NOTIFY_WHATSAPP_DEST_RATE", 1))),
+    "email": (float(os.getenv("NOTIFY_EMAIL_RATE", 5)), float(os.getenv("NOTIFY_EMAIL_DEST_RATE", 0.5))),
+}
+DEST_BURST = float(os.getenv("NOTIFY_DEST_BURST", 3))
+# Processes sending through the same provider accounts (worker processes on every host)
+NOTIFY_PROCESSES = int(os.getenv("NOTIFY_PROCESSES", 1))
+# Concurrent sends per channel
+CHANNEL_CONCURRENCY = {
+    "email": int(os.getenv("NOTIFY_EMAIL_CONCURRENCY", 5)),
+    "whatsapp": int(os.getenv("NOTIFY_WHATSAPP_CONCURRENCY", 10)),
+    "telegram": int(os.getenv("NOTIFY_TELEGRAM_CONCURRENCY", 20)),
+}
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", 3))
+# A failed destination is held back this long (doubling per attempt) before its retry
+NOTIFY_RETRY_SECONDS = float(os.getenv("NOTIFY_RETRY_SECONDS", 1))
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float = None) -> float:
+        """Seconds until one token is available"""
+        self._refill(self.clock() if now is None else now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float = None):
+        self._refill(self.clock() if now is None else now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Hold the bucket empty for at least `seconds`"""
+        self._refill(self.clock())
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class Job:
+    __slots__ = ("destination", "send", "priority", "seq", "enqueued_at", "not_before", "attempts", "done")
+
+    def __init__(self, destination: str, send: Callable[[], Awaitable], priority: float, seq: int, now: float, done: asyncio.Future):
+        self.destination = destination
+        self.send = send # Makes one attempt; raises on failure
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = now
+        self.not_before = now
+        self.attempts = 0
+        self.done = done
+
+
+class ChannelScheduler:
+    """Paces one channel's sends through a channel bucket and a bucket per destination.
+
+    Waiting sends sit in a priority queue (highest priority first, FIFO among
+    equals). A send whose destination is out of tokens is parked until it
+    refills, so one busy chat never holds up the others. A failed send goes
+    back in the queue with its destination paused, instead of sleeping
+    inside a task.
+    """
+    def __init__(self, channel: str, rate: float, dest_rate: float, concurrency: int = 10,
+                 dest_burst: float = DEST_BURST, max_attempts: int = NOTIFY_MAX_ATTEMPTS, clock: Callable[[], float] = time.monotonic):
+        self.channel = channel
+        self.bucket = TokenBucket(rate, max(rate, 1), clock)
+        self.dest_rate = dest_rate
+        self.dest_burst = dest_burst
+        self.destinations: Dict[str, TokenBucket] = {}
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self.ready = [] # (-priority, seq, job)
+        self.parked = [] # (not_before, seq, job)
+        self.seq = itertools.count()
+        self.slots = asyncio.Semaphore(concurrency)
+        self.wake = asyncio.Event()
+        self.in_flight = 0
+        self.task = None
+        self.waits = deque(maxlen=1000) # Queued -> first attempt, seconds
+        self.metrics = {"sent": 0, "failed": 0, "retried": 0}
+
+    async def submit(self, destination: str, send: Callable[[], Awaitable], priority: float = 0):
+        """Queue a send and wait for it to succeed; raises the last error once attempts run out"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        job = Job(destination, send, priority, next(self.seq), self.clock(), asyncio.get_running_loop().create_future())
+        heapq.heappush(self.ready, (-priority, job.seq, job))
+        self.wake.set()
+        await job.done
+
+    def _destination(self, destination: str) -> TokenBucket:
+        bucket = self.destinations.get(destination)
+        if bucket is None:
+            if len(self.destinations) > 10000: # Forget destinations that have fully recovered
+                now = self.clock()
+                self.destinations = {key: b for key, b in self.destinations.items() if not b.full(now)}
+            bucket = self.destinations[destination] = TokenBucket(self.dest_rate, self.dest_burst, self.clock)
+        return bucket
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            while self.parked and self.parked[0][0] <= now:
+                _, _, job = heapq.heappop(self.parked)
+                heapq.heappush(self.ready, (-job.priority, job.seq, job))
+
+            if not self.ready:
+                self.wake.clear()
+                timeout = self.parked[0][0] - now if self.parked else None
+                try:
+                    await asyncio.wait_for(self.wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            wait = self.bucket.wait_time(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            _, _, job = heapq.heappop(self.ready)
+            destination = self._destination(job.destination)
+            wait = destination.wait_time(now)
+            if wait > 0:
+                job.not_before = now + wait
+                heapq.heappush(self.parked, (job.not_before, job.seq, job))
+                continue
+
+            await self.slots.acquire()
+            now = self.clock()
+            self.bucket.take(now)
+            destination.take(now)
+            if job.attempts == 0:
+                self.waits.append(now - job.enqueued_at)
+            self.in_flight += 1
+            asyncio.create_task(self._attempt(job))
+
+    async def _attempt(self, job: Job):
+        try:
+            await job.send()
+            self.metrics["sent"] += 1
+            if not job.done.done():
+                job.done.set_result(None)
+        except Exception as e:
+            job.attempts += 1
+            if job.attempts >= self.max_attempts:
+                self.metrics["failed"] += 1
+                print(f"Failed after {job.attempts} attempts: {e}")
+                if not job.done.done():
+                    job.done.set_exception(e)
+            else:
+                self.metrics["retried"] += 1
+                # Provider flood control (e.g. Telegram RetryAfter) pauses the whole channel
+                retry_after = getattr(e, "retry_after", None)
+                if isinstance(retry_after, (int, float)):
+                    self.bucket.pause(retry_after)
+                delay = NOTIFY_RETRY_SECONDS * 2 ** (job.attempts - 1)
+                print(f"Attempt {job.attempts} failed, retrying in {delay}s...")
+                self._destination(job.destination).pause(delay)
+                heapq.heappush(self.ready, (-job.priority, job.seq, job))
+                self.wake.set()
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    def status(self) -> Dict:
+        waits = sorted(self.waits)
+        return {
+            **self.metrics,
+            "queued": len(self.ready) + len(self.parked),
+            "in_flight": self.in_flight,
+            "wait_avg_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else None,
+            "wait_max_ms": round(waits[-1] * 1000, 1) if waits else None,
+        }
+
+
+class DeliveryScheduler:
+    """One ChannelScheduler per notification channel.
+
+    Limits are enforced per process; with `processes` senders sharing the
+    provider accounts, each gets an equal share of every rate so together
+    they stay within it.
+    """
+    def __init__(self, limits: Dict = None, concurrency: Dict[str, int] = None, processes: int = None, **kwargs):
+        limits = limits or CHANNEL_LIMITS
+        concurrency = concurrency or CHANNEL_CONCURRENCY
+        self.processes = max(processes or NOTIFY_PROCESSES, 1)
+        self.channels = {
+            channel: ChannelScheduler(channel, rate / self.processes, dest_rate / self.processes, concurrency.get(channel, 10), **kwargs)
+            for channel, (rate, dest_rate) in limits.items()
+        }
+
+    async def submit(self, channel: str, destination: str, send: Callable[[], Awaitable], priority: float = 0):
+        await self.channels[channel].submit(destination, send, priority)
+
+    def close(self):
+        for scheduler in self.channels.values():
+            scheduler.close()
+
+    def status(self) -> Dict:
+        return {channel: scheduler.status() for channel, scheduler in self.channels.items()}
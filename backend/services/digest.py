@@ -0,0 +1,66 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List
+from backend.models import AlertType, SettingsInDB
+
+# Longest digest message; the smallest moves beyond this are summarized as a count
+DIGEST_MAX_LINES = int(os.getenv("DIGEST_MAX_LINES", 20))
+
+def summary(alerts: List[Dict]) -> str:
+    """One message for a burst of alert logs, biggest moves first"""
+    if len(alerts) == 1:
+        return alerts[0]["message"]
+    ranked = sorted(alerts, key=lambda alert: abs(alert["change_percent"]), reverse=True)
+    dips = sum(1 for alert in alerts if alert["alert_type"] == AlertType.DIP)
+    lines = [f"🚨 *StormAlert: {len(alerts)} alerts* (📉 {dips} · 📈 {len(alerts) - dips})"]
+    for alert in ranked[:DIGEST_MAX_LINES]:
+        emoji = "📉" if alert["alert_type"] == AlertType.DIP else "📈"
+        lines.append(f"{emoji} *{alert['stock_symbol']}* {alert['change_percent']:.2f}% · ₹{alert['price']:.2f}")
+    if len(ranked) > DIGEST_MAX_LINES:
+        lines.append(f"_…and {len(ranked) - DIGEST_MAX_LINES} more_")
+    return "\n".join(lines)
+
+
+class AlertDigest:
+    """Coalesces a user's alerts into one notification per window.
+
+    The first alert opens a `digest_seconds` window for its user; everything
+    that arrives before it closes goes out as a single summary, with the
+    priority of the biggest move in it.
+    """
+    def __init__(self, send: Callable[[SettingsInDB, str, float], Awaitable]):
+        self.send = send
+        self.pending: Dict[str, List[Dict]] = {} # user_id -> alert logs
+        self.settings: Dict[str, SettingsInDB] = {} # user_id -> latest settings
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.metrics = {"alerts": 0, "digests": 0, "messages_saved": 0}
+
+    def add(self, settings: SettingsInDB, alert: Dict):
+        user_id = str(settings.user_id)
+        self.settings[user_id] = settings
+        self.pending.setdefault(user_id, []).append(alert)
+        self.metrics["alerts"] += 1
+        if user_id not in self.timers:
+            self.timers[user_id] = asyncio.get_running_loop().call_later(max(settings.digest_seconds, 0), self._flush, user_id)
+
+    def _flush(self, user_id: str):
+        asyncio.create_task(self.flush(user_id))
+
+    async def flush(self, user_id: str):
+        timer = self.timers.pop(user_id, None)
+        if timer:
+            timer.cancel()
+        alerts = self.pending.pop(user_id, None)
+        settings = self.settings.pop(user_id, None)
+        if not alerts:
+            return
+        self.metrics["digests"] += 1
+        self.metrics["messages_saved"] += len(alerts) - 1
+        priority = max(abs(alert["change_percent"]) for alert in alerts)
+        await self.send(settings, summary(alerts), priority)
+
+    async def flush_all(self):
+        await asyncio.gather(*[self.flush(user_id) for user_id in list(self.pending)])
+
+    def status(self) -> Dict:
+        return {**self.metrics, "open": len(self.pending)}
@@ -0,0 +1,38 @@
+from typing import Dict, Iterable
+from backend.services.algorithms import TrailingAlgo, RollingWindowAlgo
+from backend.services.subscriber_index import TokenPlan
+
+class IndicatorLayer:
+    """Indicator state shared by every subscriber of a token.
+
+    Trailing high/low is kept once per token and rolling windows once per
+    (token, window length), so each tick updates each indicator exactly once
+    no matter how many users watch the token.
+    """
+    def __init__(self):
+        self.trailing = TrailingAlgo()
+        self.rolling: Dict[int, RollingWindowAlgo] = {} # window_minutes -> Algo
+
+    def rolling_algo(self, window_minutes: int) -> RollingWindowAlgo:
+        algo = self.rolling.get(window_minutes)
+        if algo is None:
+            algo = self.rolling[window_minutes] = RollingWindowAlgo(window_minutes=window_minutes)
+        return algo
+
+    def absorb(self, token: int, plan: TokenPlan, high: float, low: float, timestamp: float):
+        """Apply the high/low a conflated tick stands in for to every indicator the token uses"""
+        if plan.trailing:
+            self.trailing.absorb(token, high, low)
+        for window in plan.windows:
+            self.rolling_algo(window).absorb(token, high, low, timestamp)
+
+    def prune(self, plans: Dict[int, TokenPlan], tokens: Iterable[int] = None):
+        """Drop state for windows/tokens nobody subscribes to anymore (optionally only for `tokens`)"""
+        for window in list(self.rolling):
+            algo = self.rolling[window]
+            for token in list(algo.state) if tokens is None else [t for t in tokens if t in algo.state]:
+                plan = plans.get(token)
+                if plan is None or window not in plan.windows:
+                    del algo.state[token]
+            if not algo.state:
+                del self.rolling[window]
@@ -1,18 +1,52 @@
 import os
-import smtplib
 from email.mime.text import MIMEText
 from twilio.rest import Client
 from telegram import Bot
 import asyncio
+import json
+import time
+import uuid
+from typing import Awaitable, Dict, Iterable, List, Tuple
 from backend.models import SettingsInDB
+from backend.services.delivery import DeliveryScheduler
+from backend.services.digest import AlertDigest
+from backend.services.outbox import RedisOutbox
+from backend.services.smtp_pool import SmtpPool
+
+# Notifications enqueued within this window go to the outbox in one pipelined round-trip
+NOTIFY_BATCH_MS = float(os.getenv("NOTIFY_BATCH_MS", 5))
+NOTIFY_BATCH_MAX = int(os.getenv("NOTIFY_BATCH_MAX", 200))
+NOTIFY_REDIS_POOL_SIZE = int(os.getenv("NOTIFY_REDIS_POOL_SIZE", 10))
+# After a failed enqueue, send directly for this long before trying Redis again
+NOTIFY_REDIS_RETRY_SECONDS = float(os.getenv("NOTIFY_REDIS_RETRY_SECONDS", 5))
+
+# Status recorded for channels sent directly after an enqueue failed
+DIRECT = "direct"
 
 class NotificationService:
-    def __init__(self):
+    def __init__(self, processes: int = None):
+        # Queue (Redis): one pooled async client for the process, created on first use
+        self.redis_url = os.getenv("REDIS_URL")
+        self.redis = None
+        self.outbox = None # RedisOutbox on the pooled client
+        self.redis_down_until = 0.0
+        self.outbound: List[Tuple[str, asyncio.Future]] = [] # (payload, flushed) waiting for the next pipeline
+        self.flush_handle = None
+        self.flushing = set() # Pipelines on their way to Redis; close() waits for them
+        self.queue_metrics = {"enqueued": 0, "pipelines": 0, "direct": 0, "enqueue_failures": 0}
+
         # Email
         self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
         self.smtp_port = int(os.getenv("SMTP_PORT", 587))
         self.smtp_username = os.getenv("SMTP_USERNAME")
         self.smtp_password = os.getenv("SMTP_PASSWORD")
+        self.smtp_pool = SmtpPool(self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password)
+
+        # Rate limits, priority and retries for every outbound send; `processes` senders share the limits
+        self.scheduler = DeliveryScheduler(processes=processes)
+
+        # Per-user digests, for users who opted in
+        self.digest = AlertDigest(self.send_all)
 
         # WhatsApp (Twilio)
         self.twilio_sid = os.getenv("TWILIO_SID")
@@ -28,107 +62,174 @@ class NotificationService:
         if self.telegram_token:
             self.telegram_bot = Bot(token=self.telegram_token)
 
-    async def send_email(self, to_email: str, subject: str, body: str):
+    async def send_email(self, to_email: str, subject: str, body: str, priority: float = 0):
         if not (self.smtp_username and self.smtp_password):
             return
         
-        def _send():
-            msg = MIMEText(body)
-            msg['Subject'] = subject
-            msg['From'] = self.smtp_username
-            msg['To'] = to_email
-
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
-            print(f"Email sent to {to_email}")
+        msg = MIMEText(body)
+        msg['Subject'] = subject
+        msg['From'] = self.smtp_username
+        msg['To'] = to_email
 
-        loop = asyncio.get_running_loop()
-        # Wrap in retry
-        async def _async_send():
-            await loop.run_in_executor(None, _send)
+        async def _send():
+            await self.smtp_pool.send(msg)
+            print(f"Email sent to {to_email}")
             
-        await self._retry(_async_send)
+        await self.scheduler.submit("email", to_email, _send, priority)
 
-    async def send_whatsapp(self, to_number: str, message: str):
+    async def send_whatsapp(self, to_number: str, message: str, priority: float = 0):
         if not self.twilio_client:
             return
         
-        def _send():
-            # Ensure 'whatsapp:' prefix
-            dest = to_number
-            if not dest.startswith("whatsapp:"):
-                dest = f"whatsapp:{dest}"
+        # Ensure 'whatsapp:' prefix
+        dest = to_number
+        if not dest.startswith("whatsapp:"):
+            dest = f"whatsapp:{dest}"
 
+        def _create():
             self.twilio_client.messages.create(
                 body=message,
                 from_=self.twilio_from,
                 to=dest
             )
-            print(f"WhatsApp sent to {dest}")
 
-        loop = asyncio.get_running_loop()
-        # Wrap in retry
-        async def _async_send():
-            await loop.run_in_executor(None, _send)
+        async def _send():
+            await asyncio.get_running_loop().run_in_executor(None, _create)
+            print(f"WhatsApp sent to {dest}")
             
-        await self._retry(_async_send)
+        await self.scheduler.submit("whatsapp", dest, _send, priority)
 
-    async def send_telegram(self, chat_id: str, message: str):
+    async def send_telegram(self, chat_id: str, message: str, priority: float = 0):
         if not self.telegram_bot:
             return
         
-        try:
+        async def _send():
             await self.telegram_bot.send_message(chat_id=chat_id, text=message)
             print(f"Telegram sent to {chat_id}")
-        except Exception as e:
-            print(f"Failed to send Telegram: {e}")
-
-    async def send_all(self, settings: SettingsInDB, message: str):
-        # Check if Redis is available for queuing
-        redis_url = os.getenv("REDIS_URL")
-        if redis_url:
-            try:
-                import redis
-                import json
-                r = redis.from_url(redis_url)
-                task = {
-                    "settings": settings.model_dump(),
-                    "message": message
-                }
-                r.rpush("notifications", json.dumps(task))
-                print(f"Enqueued notification for {settings.user_id}")
+
+        await self.scheduler.submit("telegram", str(chat_id), _send, priority)
+
+    async def send_alert(self, settings: SettingsInDB, alert: Dict):
+        """Notify about one alert log, folding it into the user's digest if they opted in"""
+        if settings.digest_enabled:
+            self.digest.add(settings, alert)
+            return
+        # Bigger moves go out first when providers are rate limiting
+        await self.send_all(settings, alert["message"], priority=abs(alert["change_percent"]))
+
+    async def send_all(self, settings: SettingsInDB, message: str, priority: float = 0):
+        """Notify on every enabled channel; `priority` (the size of the move) orders delivery under rate limits"""
+        # Queue for the worker when Redis is configured and reachable
+        delivery_id = None
+        if self.redis_url and time.time() >= self.redis_down_until:
+            delivery_id = uuid.uuid4().hex # Idempotency key: channels already sent are skipped on redelivery
+            task = {
+                "delivery_id": delivery_id,
+                "settings": settings.model_dump(mode="json"),
+                "message": message,
+                "priority": priority,
+                "enqueued_at": time.time()
+            }
+            if await self._enqueue(json.dumps(task)):
                 return
-            except Exception as e:
-                print(f"Redis enqueue failed: {e}. Falling back to direct send.")
 
         # Direct Send (Fallback or Dev Mode)
-        tasks = []
-        if settings.email_enabled and settings.email_address:
-            tasks.append(self.send_email(settings.email_address, "StormAlert Notification", message))
+        self.queue_metrics["direct"] += 1
+        await self.deliver(settings, message, priority, delivery_id)
+
+    async def deliver(self, settings: SettingsInDB, message: str, priority: float = 0, delivery_id: str = None):
+        """Send on every enabled channel right away.
+
+        `delivery_id` is set when an enqueue failed: the entry may have
+        reached the stream anyway (e.g. the reply timed out), so the channels
+        are first recorded under it and a worker that gets the entry skips
+        them. If Redis can't take that record either, the entry almost
+        certainly never landed.
+        """
+        sends = self.channel_sends(settings, message, priority)
+        if not sends:
+            return
+        if delivery_id:
+            await self._record_direct(delivery_id, [channel for channel, _ in sends])
+        for error in await asyncio.gather(*[send for _, send in sends], return_exceptions=True):
+            if isinstance(error, Exception):
+                print(f"Notification for {settings.user_id} not delivered: {error}")
+
+    async def _record_direct(self, delivery_id: str, channels: List[str]):
+        try:
+            outbox = self._outbox()
+            await asyncio.gather(*[outbox.record(delivery_id, channel, DIRECT) for channel in channels])
+        except Exception as e:
+            print(f"Could not record direct send {delivery_id}: {e}")
+
+    def channel_sends(self, settings: SettingsInDB, message: str, priority: float = 0, skip: Iterable[str] = ()) -> List[Tuple[str, Awaitable]]:
+        """(channel, send coroutine) for every channel the user has enabled, except those in `skip`"""
+        sends = []
+        if settings.email_enabled and settings.email_address and "email" not in skip:
+            sends.append(("email", self.send_email(settings.email_address, "StormAlert Notification", message, priority)))
         
-        if settings.whatsapp_enabled and settings.whatsapp_number:
-            tasks.append(self.send_whatsapp(settings.whatsapp_number, message))
+        if settings.whatsapp_enabled and settings.whatsapp_number and "whatsapp" not in skip:
+            sends.append(("whatsapp", self.send_whatsapp(settings.whatsapp_number, message, priority)))
             
-        if settings.telegram_enabled and settings.telegram_chat_id:
-            tasks.append(self.send_telegram(settings.telegram_chat_id, message))
-            
-        if tasks:
-            await asyncio.gather(*tasks)
-
-    async def _retry(self, func, *args, retries=3, delay=1):
-        """Helper to retry async functions"""
-        for attempt in range(retries):
-            try:
-                await func(*args)
-                return
-            except Exception as e:
-                if attempt == retries - 1:
-                    print(f"Failed after {retries} attempts: {e}")
-                else:
-                    print(f"Attempt {attempt+1} failed, retrying in {delay}s...")
-                    await asyncio.sleep(delay)
-                    delay *= 2 # Exponential backoff
+        if settings.telegram_enabled and settings.telegram_chat_id and "telegram" not in skip:
+            sends.append(("telegram", self.send_telegram(settings.telegram_chat_id, message, priority)))
+        return sends
+
+    def _outbox(self):
+        if self.outbox is None:
+            import redis.asyncio as redis
+            self.redis = redis.from_url(self.redis_url, max_connections=NOTIFY_REDIS_POOL_SIZE, socket_connect_timeout=1, socket_timeout=2)
+            self.outbox = RedisOutbox(self.redis)
+        return self.outbox
+
+    async def _enqueue(self, payload: str) -> bool:
+        """Add to the current batch; True once the batch is safely in Redis"""
+        flushed = asyncio.get_running_loop().create_future()
+        self.outbound.append((payload, flushed))
+        if len(self.outbound) >= NOTIFY_BATCH_MAX:
+            self._flush_now()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(NOTIFY_BATCH_MS / 1000, self._flush_now)
+        return await flushed
+
+    def _flush_now(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.outbound = self.outbound, []
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self.flushing.add(task)
+            task.add_done_callback(self.flushing.discard)
+
+    async def _flush(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            await self._outbox().add([payload for payload, _ in batch])
+            ok = True
+            self.queue_metrics["enqueued"] += len(batch)
+            self.queue_metrics["pipelines"] += 1
+        except Exception as e:
+            print(f"Redis enqueue failed: {e}. Falling back to direct send.")
+            ok = False
+            self.redis_down_until = time.time() + NOTIFY_REDIS_RETRY_SECONDS
+            self.queue_metrics["enqueue_failures"] += 1
+        for _, flushed in batch:
+            if not flushed.done():
+                flushed.set_result(ok)
+
+    async def close(self):
+        await self.digest.flush_all()
+        self._flush_now()
+        if self.flushing: # Into the outbox before its client goes away
+            await asyncio.gather(*self.flushing, return_exceptions=True)
+        if self.redis:
+            await self.redis.aclose()
+            self.redis = None
+            self.outbox = None
+        self.scheduler.close()
+        await asyncio.to_thread(self.smtp_pool.close)
+
+    def status(self):
+        return {**self.queue_metrics, "pending": len(self.outbound), "redis_down": time.time() < self.redis_down_until, "smtp": self.smtp_pool.status(), "channels": self.scheduler.status(), "digest": self.digest.status()}
 
 notification_service = NotificationService()
@@ -0,0 +1,169 @@
+"""Durable notification outbox.
+
+Every queued notification carries a delivery ID. Workers claim entries
+through a consumer group; an entry stays pending until a worker acks it,
+and one that sits unacked past the visibility timeout (its worker died)
+is claimed by another worker. Delivery status is recorded per channel
+under the delivery ID, so a redelivered entry only retries the channels
+that have not gone out yet: at-least-once, without double-sending what
+already succeeded.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Tuple
+
+OUTBOX_STREAM = os.getenv("OUTBOX_STREAM", "notifications:outbox")
+OUTBOX_GROUP = os.getenv("OUTBOX_GROUP", "notifiers")
+# Unacked entries older than this are handed to another worker; workers renew their claims while delivering
+OUTBOX_VISIBILITY_SECONDS = float(os.getenv("OUTBOX_VISIBILITY_SECONDS", 60))
+# How long per-channel delivery status is kept
+OUTBOX_STATUS_TTL_SECONDS = int(os.getenv("OUTBOX_STATUS_TTL_SECONDS", 2 * 24 * 3600))
+
+SENT = "sent"
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisOutbox:
+    """Outbox on a Redis stream with a consumer group"""
+    def __init__(self, redis, stream: str = OUTBOX_STREAM, group: str = OUTBOX_GROUP,
+                 visibility_seconds: float = OUTBOX_VISIBILITY_SECONDS):
+        self.redis = redis
+        self.stream = stream
+        self.group = group
+        self.visibility_ms = int(visibility_seconds * 1000)
+        self.metrics = {"added": 0, "claimed": 0, "reclaimed": 0, "acked": 0}
+
+    def _status_key(self, delivery_id: str) -> str:
+        return f"{self.stream}:delivery:{delivery_id}"
+
+    async def setup(self):
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def add(self, payloads: List[str]):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for payload in payloads:
+                pipe.xadd(self.stream, {"task": payload})
+            await pipe.execute()
+        self.metrics["added"] += len(payloads)
+
+    async def claim(self, consumer: str, count: int, block_ms: int = 1000) -> List[Tuple[str, bytes]]:
+        """Entries abandoned by dead workers first, then new ones"""
+        _, stale, *_ = await self.redis.xautoclaim(self.stream, self.group, consumer, self.visibility_ms, "0-0", count=count)
+        entries = [(_text(entry_id), fields[b"task"]) for entry_id, fields in stale if fields]
+        self.metrics["reclaimed"] += len(entries)
+        if len(entries) < count:
+            response = await self.redis.xreadgroup(self.group, consumer, {self.stream: ">"}, count=count - len(entries),
+                                                   block=None if entries else block_ms)
+            for _, messages in response or []:
+                entries.extend((_text(entry_id), fields[b"task"]) for entry_id, fields in messages)
+        self.metrics["claimed"] += len(entries)
+        return entries
+
+    async def touch(self, consumer: str, entry_ids: Iterable[str]):
+        """Renew claims on entries still being delivered"""
+        entry_ids = list(entry_ids)
+        if entry_ids:
+            await self.redis.xclaim(self.stream, self.group, consumer, 0, entry_ids, justid=True)
+
+    async def ack(self, entry_ids: Iterable[str]):
+        entry_ids = list(entry_ids)
+        if not entry_ids:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.xack(self.stream, self.group, *entry_ids)
+            pipe.xdel(self.stream, *entry_ids)
+            await pipe.execute()
+        self.metrics["acked"] += len(entry_ids)
+
+    async def delivered(self, delivery_id: str) -> Dict[str, str]:
+        """channel -> status recorded so far"""
+        return {_text(channel): _text(status) for channel, status in (await self.redis.hgetall(self._status_key(delivery_id))).items()}
+
+    async def record(self, delivery_id: str, channel: str, status: str):
+        key = self._status_key(delivery_id)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, channel, status)
+            pipe.expire(key, OUTBOX_STATUS_TTL_SECONDS)
+            await pipe.execute()
+
+    async def status(self) -> Dict:
+        pending = await self.redis.xpending(self.stream, self.group)
+        return {**self.metrics, "length": await self.redis.xlen(self.stream), "pending": pending["pending"]}
+
+
+class MemoryOutbox:
+    """In-process stand-in with the same claim/ack/visibility semantics (tests, single-process dev)"""
+    def __init__(self, visibility_seconds: float = OUTBOX_VISIBILITY_SECONDS, clock=time.monotonic):
+        self.visibility_seconds = visibility_seconds
+        self.clock = clock
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.new = deque() # Entry IDs never claimed
+        self.pending: Dict[str, Tuple[str, float]] = {} # entry ID -> (consumer, claimed at)
+        self.statuses: Dict[str, Dict[str, str]] = {}
+        self.sequence = 0
+        self.arrived = asyncio.Event()
+        self.metrics = {"added": 0, "claimed": 0, "reclaimed": 0, "acked": 0}
+
+    async def setup(self):
+        pass
+
+    async def add(self, payloads: List[str]):
+        for payload in payloads:
+            self.sequence += 1
+            entry_id = f"{self.sequence}-0"
+            self.entries[entry_id] = payload
+            self.new.append(entry_id)
+        self.metrics["added"] += len(payloads)
+        self.arrived.set()
+
+    def _take(self, consumer: str, count: int) -> List[Tuple[str, str]]:
+        now = self.clock()
+        stale = [entry_id for entry_id, (_, claimed_at) in self.pending.items() if now - claimed_at >= self.visibility_seconds][:count]
+        self.metrics["reclaimed"] += len(stale)
+        taken = stale
+        while self.new and len(taken) < count:
+            taken.append(self.new.popleft())
+        for entry_id in taken:
+            self.pending[entry_id] = (consumer, now)
+        self.metrics["claimed"] += len(taken)
+        return [(entry_id, self.entries[entry_id]) for entry_id in taken]
+
+    async def claim(self, consumer: str, count: int, block_ms: int = 1000) -> List[Tuple[str, str]]:
+        entries = self._take(consumer, count)
+        if not entries and block_ms:
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), block_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            entries = self._take(consumer, count)
+        return entries
+
+    async def touch(self, consumer: str, entry_ids: Iterable[str]):
+        now = self.clock()
+        for entry_id in entry_ids:
+            if entry_id in self.pending:
+                self.pending[entry_id] = (consumer, now)
+
+    async def ack(self, entry_ids: Iterable[str]):
+        for entry_id in entry_ids:
+            if self.pending.pop(entry_id, None) is not None:
+                self.entries.pop(entry_id, None)
+                self.metrics["acked"] += 1
+
+    async def delivered(self, delivery_id: str) -> Dict[str, str]:
+        return dict(self.statuses.get(delivery_id, {}))
+
+    async def record(self, delivery_id: str, channel: str, status: str):
+        self.statuses.setdefault(delivery_id, {})[channel] = status
+
+    async def status(self) -> Dict:
+        return {**self.metrics, "length": len(self.entries), "pending": len(self.pending)}
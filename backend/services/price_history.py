@@ -0,0 +1,109 @@
+import numpy as np
+from typing import Dict, Iterable, List, Tuple
+from backend.services.algorithms import tick_time
+
+def lttb(times: np.ndarray, prices: np.ndarray, points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `points` samples that keep the shape of the series"""
+    n = len(prices)
+    if points >= n or points < 3:
+        return np.arange(n)
+    bucket = (n - 2) / (points - 2)
+    indices = [0]
+    a = 0
+    for i in range(points - 2):
+        start, end = int(i * bucket) + 1, int((i + 1) * bucket) + 1
+        next_end = min(int((i + 2) * bucket) + 1, n)
+        avg_time, avg_price = times[end:next_end].mean(), prices[end:next_end].mean()
+        # Pick the point of this bucket forming the largest triangle with the last pick and the next bucket's mean
+        areas = np.abs((times[a] - avg_time) * (prices[start:end] - prices[a]) - (times[a] - times[start:end]) * (avg_price - prices[a]))
+        a = start + int(areas.argmax())
+        indices.append(a)
+    indices.append(n - 1)
+    return np.array(indices)
+
+
+class PriceHistory:
+    """Last `depth` prices of every token, in one preallocated ring per token.
+
+    Rings are rows of contiguous (slots x depth) arrays indexed by a token
+    slot; a batch of ticks is written with a handful of vectorized ops and
+    nothing is allocated per tick. Rows grow by doubling as tokens appear.
+    """
+    def __init__(self, depth: int = 30, capacity: int = 64):
+        self.depth = depth
+        self.slots: Dict[int, int] = {} # token -> row
+        self.prices = np.zeros((capacity, depth))
+        self.times = np.zeros((capacity, depth)) # Epoch seconds
+        self.changes = np.zeros(capacity) # Latest day change % reported by the feed
+        self.counts = np.zeros(capacity, dtype=np.int64) # Ticks ever written per row
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, token: int):
+        return token in self.slots
+
+    def _slot(self, token: int) -> int:
+        slot = self.slots.get(token)
+        if slot is None:
+            slot = self.slots[token] = len(self.slots)
+            if slot == len(self.counts):
+                self.prices = np.concatenate([self.prices, np.zeros_like(self.prices)])
+                self.times = np.concatenate([self.times, np.zeros_like(self.times)])
+                self.changes = np.concatenate([self.changes, np.zeros_like(self.changes)])
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+        return slot
+
+    def append(self, ticks: List[Dict], now: float):
+        """Record a tick batch (ticks without a timestamp are stamped `now`)"""
+        if not ticks:
+            return
+        slots = np.fromiter((self._slot(tick["instrument_token"]) for tick in ticks), dtype=np.int64, count=len(ticks))
+        prices = np.fromiter((tick["last_price"] for tick in ticks), dtype=np.float64, count=len(ticks))
+        times = np.fromiter((tick_time(tick, now) for tick in ticks), dtype=np.float64, count=len(ticks))
+        changes = np.fromiter((tick.get("change", 0) or 0 for tick in ticks), dtype=np.float64, count=len(ticks))
+
+        # Position of each tick among the batch's ticks for the same token, in arrival order
+        order = np.argsort(slots, kind="stable")
+        sorted_slots = slots[order]
+        starts = np.flatnonzero(np.r_[True, sorted_slots[1:] != sorted_slots[:-1]])
+        rank = np.empty(len(ticks), dtype=np.int64)
+        rank[order] = np.arange(len(ticks)) - np.repeat(starts, np.diff(np.r_[starts, len(ticks)]))
+
+        # NumPy leaves the winner of repeated fancy-index writes unspecified, so every cell is written once:
+        # only a token's last `depth` ticks of the batch, and only its last change
+        added = np.bincount(slots, minlength=len(self.counts))
+        keep = rank >= added[slots] - self.depth
+        columns = (self.counts[slots[keep]] + rank[keep]) % self.depth
+        self.prices[slots[keep], columns] = prices[keep]
+        self.times[slots[keep], columns] = times[keep]
+        touched, last_reversed = np.unique(slots[::-1], return_index=True)
+        self.changes[touched] = changes[len(ticks) - 1 - last_reversed]
+        self.counts += added
+
+    def series(self, token: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(times, prices) oldest first"""
+        slot = self.slots.get(token)
+        if slot is None:
+            return np.zeros(0), np.zeros(0)
+        count = int(self.counts[slot])
+        columns = np.arange(max(0, count - self.depth), count) % self.depth
+        return self.times[slot, columns], self.prices[slot, columns]
+
+    def latest(self) -> List[Dict]:
+        """Last price and change of every token"""
+        return [
+            {"token": token, "price": float(self.prices[slot, (self.counts[slot] - 1) % self.depth]), "change": float(self.changes[slot])}
+            for token, slot in self.slots.items()
+        ]
+
+    def sparklines(self, tokens: Iterable[int], points: int) -> Dict[int, Dict[str, List[float]]]:
+        """LTTB-downsampled {"t": times, "p": prices} per known token"""
+        out = {}
+        for token in tokens:
+            if token not in self.slots:
+                continue
+            times, prices = self.series(token)
+            keep = lttb(times, prices, points)
+            out[token] = {"t": times[keep].tolist(), "p": prices[keep].tolist()}
+        return out
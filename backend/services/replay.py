@@ -0,0 +1,176 @@
+"""Deterministic tick replay: "what would these settings have fired?"
+
+Recorded ticks are fed through a real AlertEngine whose clock only moves
+with the ticks, so a day of data replays as fast as the CPU allows and
+gives the same answer every time. Nothing is written to MongoDB and no
+notification is sent.
+
+    python -m backend.services.replay ticks.jsonl \\
+        --config '{"dip_threshold": 0.8, "timeframe_minutes": 5, "algo_mode": "rolling"}' \\
+        --config '{"dip_threshold": 1.5}' --workers 4
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
+from backend.models import AlertType, SettingsInDB
+from backend.services.algorithms import IST, tick_time
+
+class SimulatedClock:
+    """Epoch-seconds clock that only moves forward, driven by tick timestamps"""
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_to(self, timestamp: float):
+        if timestamp > self.now:
+            self.now = timestamp
+
+
+def _epoch(value) -> float:
+    try:
+        return float(value) # Epoch seconds, possibly as a CSV string
+    except ValueError:
+        moment = datetime.fromisoformat(value)
+        return (moment.replace(tzinfo=IST) if moment.tzinfo is None else moment).timestamp() # Naive times are exchange (IST) time
+
+
+def _tick(token, price, timestamp) -> Dict:
+    tick = {"instrument_token": int(token), "last_price": float(price)}
+    if timestamp not in (None, ""):
+        tick["exchange_timestamp"] = _epoch(timestamp)
+    return tick
+
+
+def load_ticks(path: str) -> Iterator[List[Dict]]:
+    """Yield tick batches from a recording.
+
+    .jsonl: one batch (a list of ticks, as the ticker delivers them) or one
+    tick per line. .csv: instrument_token,last_price,exchange_timestamp
+    columns; consecutive rows with the same timestamp form a batch.
+    .bin segment or a journal directory: the ticker's tick journal, with
+    consecutive records of the same timestamp forming a batch.
+    """
+    if path.endswith(".bin") or os.path.isdir(path):
+        from backend.services.tick_journal import read_journal, read_segment
+        for records in ([read_segment(path)] if path.endswith(".bin") else read_journal(path)):
+            batch, batch_time = [], None
+            for token, timestamp, price in zip(records["token"].tolist(), records["timestamp"].tolist(), records["price"].tolist()):
+                if batch and timestamp != batch_time:
+                    yield batch
+                    batch = []
+                batch_time = timestamp
+                batch.append({"instrument_token": token, "last_price": price, "exchange_timestamp": timestamp})
+            if batch:
+                yield batch
+        return
+
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            batch, batch_time = [], None
+            for row in csv.DictReader(f):
+                tick = _tick(row["instrument_token"], row["last_price"], row.get("exchange_timestamp"))
+                if batch and tick.get("exchange_timestamp") != batch_time:
+                    yield batch
+                    batch = []
+                batch_time = tick.get("exchange_timestamp")
+                batch.append(tick)
+            if batch:
+                yield batch
+        return
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            ticks = record if isinstance(record, list) else [record]
+            yield [_tick(t["instrument_token"], t["last_price"], t.get("exchange_timestamp") or t.get("timestamp")) for t in ticks]
+
+
+def config_user(index: int) -> str:
+    return f"config_{index}"
+
+
+async def replay(batches: Iterable[List[Dict]], configs: List[Dict], mode: str = "batch",
+                 symbols: Dict[int, str] = None, first_index: int = 0) -> List[Dict]:
+    """Run every batch through one engine with one subscriber per config on every token.
+
+    Configs share indicator state the same way users watching one token do,
+    so adding a config costs a threshold check, not another pass over the ticks.
+    Returns one {"config", "alerts"} result per config.
+    """
+    from backend.services.alert_engine import AlertEngine
+
+    clock = SimulatedClock()
+    engine = AlertEngine(mode=mode, clock=clock)
+    users = [config_user(first_index + i) for i in range(len(configs))]
+    engine.user_settings = {user_id: SettingsInDB(user_id=user_id, **config) for user_id, config in zip(users, configs)}
+    symbols = symbols or {}
+    fired = {user_id: [] for user_id in users}
+
+    async def record(user_id, symbol, price, change, type, settings):
+        key = engine.cooldowns.key(user_id, symbol, type)
+        if not engine.cooldowns.ready(key):
+            return
+        engine.cooldowns.start(key, settings.cooldown_minutes * 60)
+        fired[user_id].append({
+            "symbol": symbol,
+            "price": price,
+            "change_percent": round(change, 4),
+            "alert_type": AlertType(type).value,
+            "timestamp": clock(),
+        })
+    engine.trigger_alert = record
+
+    for ticks in batches:
+        new_tokens = {tick["instrument_token"] for tick in ticks} - engine.token_map.keys()
+        for token in new_tokens:
+            engine.token_map[token] = [(user_id, symbols.get(token, str(token))) for user_id in users]
+        clock.advance_to(max(tick_time(tick, clock.now) for tick in ticks) if ticks else clock.now)
+        await engine.process_ticks(ticks)
+
+    return [{"config": config, "alerts": fired[user_id]} for config, user_id in zip(configs, users)]
+
+
+def _replay_file(path: str, configs: List[Dict], mode: str, symbols: Dict[int, str], first_index: int) -> List[Dict]:
+    return asyncio.run(replay(load_ticks(path), configs, mode, symbols, first_index))
+
+
+def replay_file(path: str, configs: List[Dict], workers: int = 1, mode: str = "batch",
+                symbols: Dict[int, str] = None) -> List[Dict]:
+    """Replay a recording for many configs, split across `workers` processes"""
+    workers = max(1, min(workers, len(configs)))
+    if workers == 1:
+        return _replay_file(path, configs, mode, symbols, 0)
+
+    size = -(-len(configs) // workers)
+    chunks = [(start, configs[start:start + size]) for start in range(0, len(configs), size)]
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_replay_file, path, chunk, mode, symbols, start) for start, chunk in chunks]
+        return [result for future in futures for result in future.result()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded ticks against alert settings")
+    parser.add_argument("ticks", help=".jsonl/.csv tick recording, a tick journal segment or journal directory")
+    parser.add_argument("--config", action="append", required=True, help="JSON object of settings fields (repeatable)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--mode", default="batch", choices=["batch", "reference"])
+    args = parser.parse_args()
+
+    results = replay_file(args.ticks, [json.loads(config) for config in args.config], args.workers, args.mode)
+    for result in results:
+        result["count"] = len(result["alerts"])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple
+from backend.models import AlertType, SettingsInDB
+from backend.services.algorithms import tick_time
+from backend.services.cache_events import CacheEvent, STOCK_REMOVED
+
+# One tick in a shard ring
+TICK_RECORD = np.dtype([("token", "<i8"), ("price", "<f8"), ("timestamp", "<f8"), ("high", "<f8"), ("low", "<f8")])
+CURSOR_BYTES = 16 # write_seq, read_seq (int64 each)
+
+class TickRing:
+    """Single-producer/single-consumer tick ring in shared memory.
+
+    The producer writes records first and only then publishes the new
+    write cursor, so the consumer never sees a half-written record.
+    When the ring is full the newest ticks are dropped (and counted).
+    """
+    def __init__(self, capacity: int, name: str = None):
+        create = name is None
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=CURSOR_BYTES + capacity * TICK_RECORD.itemsize)
+        if not create:
+            # The creating process owns the segment; don't let this process' resource tracker unlink it
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.cursor = np.ndarray(2, dtype=np.int64, buffer=self.shm.buf)
+        self.records = np.ndarray(capacity, dtype=TICK_RECORD, buffer=self.shm.buf, offset=CURSOR_BYTES)
+        if create:
+            self.cursor[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __len__(self):
+        return int(self.cursor[0] - self.cursor[1])
+
+    def push(self, tokens: np.ndarray, prices: np.ndarray, timestamps: np.ndarray,
+             highs: np.ndarray = None, lows: np.ndarray = None) -> int:
+        """Append ticks; returns how many fit. `highs`/`lows` carry conflated extremes (default: the price)"""
+        write = int(self.cursor[0])
+        count = min(len(tokens), self.capacity - (write - int(self.cursor[1])))
+        if count <= 0:
+            return 0
+        slots = (write + np.arange(count)) % self.capacity
+        self.records["token"][slots] = tokens[:count]
+        self.records["price"][slots] = prices[:count]
+        self.records["timestamp"][slots] = timestamps[:count]
+        self.records["high"][slots] = prices[:count] if highs is None else highs[:count]
+        self.records["low"][slots] = prices[:count] if lows is None else lows[:count]
+        self.cursor[0] = write + count
+        return count
+
+    def drain(self) -> np.ndarray:
+        """Copy out every published record and release the space"""
+        write, read = int(self.cursor[0]), int(self.cursor[1])
+        records = self.records[(read + np.arange(write - read)) % self.capacity]
+        self.cursor[1] = write
+        return records
+
+    def close(self, unlink: bool = False):
+        del self.cursor, self.records
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _shard_main(shard_id: int, ring_name: str, capacity: int, control, alerts, wakeup, mode: str):
+    """Entry point of a shard process: its own AlertEngine over its own slice of tokens"""
+    asyncio.run(_shard_loop(shard_id, ring_name, capacity, control, alerts, wakeup, mode))
+
+
+def _shard_emitter(engine, alerts):
+    """trigger_alert for a shard: hand the alert to the main process.
+    The main process applies the authoritative cooldown, persistence and
+    fan-out; arming the shard's own cooldown too keeps the shard from
+    re-sending (and its plans from re-evaluating) a stock it just alerted on."""
+    async def emit(user_id, symbol, price, change, type, settings):
+        key = engine.cooldowns.key(user_id, symbol, type)
+        if not engine.cooldowns.ready(key):
+            return
+        engine.cooldowns.start(key, settings.cooldown_minutes * 60)
+        alerts.put((user_id, symbol, price, change, type.value))
+    return emit
+
+
+async def _shard_loop(shard_id, ring_name, capacity, control, alerts, wakeup, mode):
+    from backend.services.alert_engine import AlertEngine
+
+    engine = AlertEngine(mode=mode)
+    engine.trigger_alert = _shard_emitter(engine, alerts)
+
+    ring = TickRing(capacity, name=ring_name)
+    print(f"Alert engine shard {shard_id} started")
+    try:
+        while True:
+            # An Event, not a semaphore: any number of dispatches since the last drain is one wakeup
+            wakeup.wait(timeout=0.1)
+            wakeup.clear() # Before draining, so a batch pushed meanwhile sets it again
+
+            # Control goes through a pipe, so anything sent before a tick batch is readable by now
+            while control.poll():
+                message = control.recv()
+                if message[0] == "stop":
+                    return
+                if message[0] == "sync":
+                    engine.token_map, engine.user_settings = message[1], message[2]
+                elif message[0] == "event":
+                    engine.apply_event(message[1])
+
+            records = ring.drain()
+            if len(records):
+                ticks = []
+                for token, price, timestamp, high, low in zip(records["token"].tolist(), records["price"].tolist(), records["timestamp"].tolist(),
+                                                              records["high"].tolist(), records["low"].tolist()):
+                    tick = {"instrument_token": token, "last_price": price, "exchange_timestamp": timestamp}
+                    if high != price or low != price:
+                        tick["conflated_high"], tick["conflated_low"] = high, low
+                    ticks.append(tick)
+                try:
+                    await engine.process_ticks(ticks)
+                except Exception as e:
+                    print(f"Error in alert engine shard {shard_id}: {e}")
+    finally:
+        ring.close()
+
+
+class ShardPool:
+    """Runs the alert engine as N processes, partitioned by instrument_token.
+
+    Ticks reach shards through shared-memory rings; alerts come back on a
+    multiprocessing queue and are fired on the main process.
+    """
+    def __init__(self, shards: int, mode: str, capacity: int = 65536):
+        self.count = shards
+        self.mode = mode
+        self.capacity = capacity
+        self.context = multiprocessing.get_context("spawn") # Never fork a live event loop / DB client
+        self.rings: List[TickRing] = []
+        self.controls = []
+        self.wakeups = []
+        self.processes = []
+        self.alerts = self.context.Queue()
+        self.metrics = {"dispatched_ticks": 0, "dropped_ticks": 0, "alerts": 0}
+
+    def shard_of(self, token: int) -> int:
+        return token % self.count
+
+    def start(self):
+        for shard_id in range(self.count):
+            ring = TickRing(self.capacity)
+            control_reader, control = self.context.Pipe(duplex=False)
+            wakeup = self.context.Event()
+            process = self.context.Process(
+                target=_shard_main,
+                args=(shard_id, ring.name, self.capacity, control_reader, self.alerts, wakeup, self.mode),
+                name=f"alert-shard-{shard_id}",
+                daemon=True,
+            )
+            process.start()
+            self.rings.append(ring)
+            self.controls.append(control)
+            self.wakeups.append(wakeup)
+            self.processes.append(process)
+        print(f"Started {self.count} alert engine shards")
+
+    def stop(self):
+        for control, wakeup in zip(self.controls, self.wakeups):
+            control.send(("stop",))
+            wakeup.set()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for ring in self.rings:
+            ring.close(unlink=True)
+        self.alerts.put(None) # Release the collector thread
+        self.rings, self.controls, self.wakeups, self.processes = [], [], [], []
+
+    def sync(self, token_map: Dict[int, List[Tuple[str, str]]], user_settings: Dict[str, SettingsInDB]):
+        """Send every shard its slice of token_map (and the settings its users need)"""
+        parts = [{} for _ in range(self.count)]
+        for token, subscribers in token_map.items():
+            parts[self.shard_of(token)][token] = list(subscribers)
+        for shard_id, part in enumerate(parts):
+            users = {user_id for subscribers in part.values() for user_id, _ in subscribers}
+            settings = {user_id: user_settings[user_id] for user_id in users if user_id in user_settings}
+            self.controls[shard_id].send(("sync", part, settings))
+
+    def apply_event(self, event, moved_from: int = None):
+        """Forward a cache delta to the shard(s) it concerns; `moved_from` is the token
+        a STOCK_ADDED took the symbol away from, whose shard must drop it"""
+        if moved_from is not None and self.shard_of(moved_from) != self.shard_of(event.instrument_token):
+            removal = CacheEvent(STOCK_REMOVED, event.user_id, symbol=event.symbol, instrument_token=moved_from)
+            self.controls[self.shard_of(moved_from)].send(("event", removal))
+        if event.instrument_token is not None:
+            self.controls[self.shard_of(event.instrument_token)].send(("event", event))
+        else:
+            # Settings and _id-only deletes can concern any shard
+            for control in self.controls:
+                control.send(("event", event))
+
+    def dispatch(self, ticks: List[Dict]):
+        """Partition a batch by token and hand each part to its shard's ring"""
+        if not ticks:
+            return
+        now = time.time()
+        tokens = np.fromiter((tick["instrument_token"] for tick in ticks), dtype=np.int64, count=len(ticks))
+        prices = np.fromiter((tick["last_price"] for tick in ticks), dtype=np.float64, count=len(ticks))
+        timestamps = np.fromiter((tick_time(tick, now) for tick in ticks), dtype=np.float64, count=len(ticks))
+        highs = np.fromiter((tick.get("conflated_high", tick["last_price"]) for tick in ticks), dtype=np.float64, count=len(ticks))
+        lows = np.fromiter((tick.get("conflated_low", tick["last_price"]) for tick in ticks), dtype=np.float64, count=len(ticks))
+        shard_ids = tokens % self.count
+        for shard_id in range(self.count):
+            mask = shard_ids == shard_id
+            wanted = int(mask.sum())
+            if not wanted:
+                continue
+            written = self.rings[shard_id].push(tokens[mask], prices[mask], timestamps[mask], highs[mask], lows[mask])
+            self.metrics["dispatched_ticks"] += written
+            self.metrics["dropped_ticks"] += wanted - written
+            self.wakeups[shard_id].set()
+
+    async def collect(self, engine):
+        """Fire alerts produced by the shards, in arrival order, on this event loop"""
+        loop = asyncio.get_running_loop()
+        pending = asyncio.Queue()
+
+        def pump():
+            while True:
+                item = self.alerts.get()
+                loop.call_soon_threadsafe(pending.put_nowait, item)
+                if item is None:
+                    return
+        threading.Thread(target=pump, name="alert-shard-collector", daemon=True).start()
+
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            user_id, symbol, price, change, type = item
+            settings = engine.user_settings.get(user_id)
+            if not settings:
+                continue
+            self.metrics["alerts"] += 1
+            try:
+                await engine.trigger_alert(user_id, symbol, price, change, AlertType(type), settings)
+            except Exception as e:
+                print(f"Error firing shard alert: {e}")
+
+    def status(self) -> Dict:
+        return {
+            "shards": self.count,
+            "alive": sum(process.is_alive() for process in self.processes),
+            "ring_depth": [len(ring) for ring in self.rings],
+            **self.metrics,
+        }
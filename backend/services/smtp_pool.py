@@ -0,0 +1,168 @@
+import asyncio
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.message import Message
+from typing import List, Optional, Tuple
+
+# Authenticated SMTP sessions kept open between emails
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 3))
+# Sessions idle longer than this are NOOP-checked before reuse (servers drop idle connections)
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", 30))
+# Emails queued within this window share one session
+SMTP_BATCH_MS = float(os.getenv("SMTP_BATCH_MS", 20))
+SMTP_BATCH_MAX = int(os.getenv("SMTP_BATCH_MAX", 50))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() == "true"
+
+# Failures that mean the session is gone, not that the message was rejected
+SESSION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPHeloError, ConnectionError, OSError)
+# The server refused this message; the session is still usable. SMTPException subclasses OSError,
+# so these must be caught before SESSION_ERRORS or a rejection would be resent on a new session.
+REJECTIONS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError, smtplib.SMTPNotSupportedError)
+
+class SmtpPool:
+    """Pool of logged-in smtplib sessions, used from executor threads.
+
+    Connecting, STARTTLS and AUTH happen once per session instead of once per
+    email. Emails sent within SMTP_BATCH_MS are grouped and each group goes
+    out over a single session. A session that has dropped is replaced and
+    the message is retried on the new one.
+    """
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 size: int = SMTP_POOL_SIZE, starttls: bool = SMTP_STARTTLS, timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle: "queue.LifoQueue[Tuple[smtplib.SMTP, float]]" = queue.LifoQueue() # (session, last used)
+        self.capacity = threading.BoundedSemaphore(size)
+        self.pending: List[Tuple[Message, asyncio.Future]] = []
+        self.flush_handle = None
+        self.metrics = {"connects": 0, "reconnects": 0, "sent": 0, "failed": 0, "batches": 0}
+
+    def _connect(self) -> smtplib.SMTP:
+        session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            session.starttls()
+        if self.username and self.password:
+            session.login(self.username, self.password)
+        self.metrics["connects"] += 1
+        return session
+
+    def _checkout(self) -> smtplib.SMTP:
+        self.capacity.acquire()
+        try:
+            while True:
+                try:
+                    session, last_used = self.idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if time.time() - last_used < SMTP_IDLE_CHECK_SECONDS:
+                    return session
+                try:
+                    if session.noop()[0] == 250:
+                        return session
+                except SESSION_ERRORS:
+                    pass
+                self._discard(session)
+        except BaseException:
+            self.capacity.release()
+            raise
+
+    def _checkin(self, session: Optional[smtplib.SMTP]):
+        if session is not None:
+            self.idle.put((session, time.time()))
+        self.capacity.release()
+
+    def _discard(self, session: smtplib.SMTP):
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def send_batch(self, messages: List[Message]) -> List[Optional[Exception]]:
+        """Send over one session (blocking); one result per message, None when sent"""
+        results = []
+        session = self._checkout()
+        try:
+            for message in messages:
+                for attempt in range(2):
+                    try:
+                        if session is None:
+                            session = self._connect()
+                            self.metrics["reconnects"] += 1
+                        session.send_message(message)
+                        self.metrics["sent"] += 1
+                        results.append(None)
+                        break
+                    except REJECTIONS as e:
+                        self.metrics["failed"] += 1
+                        results.append(e)
+                        break
+                    except SESSION_ERRORS as e:
+                        if session is not None:
+                            self._discard(session)
+                            session = None
+                        if attempt == 1:
+                            self.metrics["failed"] += 1
+                            results.append(e)
+                    except smtplib.SMTPException as e: # Any other refusal
+                        self.metrics["failed"] += 1
+                        results.append(e)
+                        break
+        finally:
+            self._checkin(session)
+        self.metrics["batches"] += 1
+        return results
+
+    async def send(self, message: Message):
+        """Queue an email for the next batch; raises if it could not be delivered"""
+        loop = asyncio.get_running_loop()
+        sent = loop.create_future()
+        self.pending.append((message, sent))
+        if len(self.pending) >= SMTP_BATCH_MAX:
+            self._flush_now()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(SMTP_BATCH_MS / 1000, self._flush_now)
+        await sent
+
+    def _flush_now(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if batch:
+            asyncio.create_task(self._flush(batch))
+
+    async def _flush(self, batch: List[Tuple[Message, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(None, self.send_batch, [message for message, _ in batch])
+        except Exception as e: # Could not even connect
+            self.metrics["failed"] += len(batch)
+            results = [e] * len(batch)
+        for (_, sent), error in zip(batch, results):
+            if sent.done():
+                continue
+            if error is None:
+                sent.set_result(None)
+            else:
+                sent.set_exception(error)
+
+    def close(self):
+        while True:
+            try:
+                session, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                session.quit()
+            except Exception:
+                self._discard(session)
+
+    def status(self):
+        return {**self.metrics, "idle_sessions": self.idle.qsize(), "pending": len(self.pending)}
@@ -0,0 +1,110 @@
+import os
+import time
+import numpy as np
+from typing import Dict
+from backend.services.algorithms import RollingWindowState
+
+SNAPSHOT_VERSION = 1
+
+def capture(engine) -> Dict[str, np.ndarray]:
+    """Copy the engine's indicator and cooldown state into flat columns.
+
+    Runs on the event loop (state must not move while it is read); the
+    result is plain arrays that can be written from another thread.
+    """
+    trailing = engine.indicators.trailing.state
+    columns = {
+        "meta": np.array([SNAPSHOT_VERSION, time.time()]),
+        "trailing_token": np.fromiter(trailing, dtype=np.int64, count=len(trailing)),
+        "trailing_high": np.fromiter((data["high"] for data in trailing.values()), dtype=np.float64, count=len(trailing)),
+        "trailing_low": np.fromiter((data["low"] for data in trailing.values()), dtype=np.float64, count=len(trailing)),
+    }
+
+    # Rolling windows: one row per (window, token), ticks concatenated with offsets
+    windows, tokens, last_times, offsets = [], [], [], [0]
+    times, prices, in_min, in_max = [], [], [], []
+    for window, algo in engine.indicators.rolling.items():
+        for token, state in algo.state.items():
+            t, p, lo, hi = state.export()
+            windows.append(window)
+            tokens.append(token)
+            last_times.append(state.last_time)
+            offsets.append(offsets[-1] + len(t))
+            times.append(t)
+            prices.append(p)
+            in_min.append(lo)
+            in_max.append(hi)
+    columns.update({
+        "rolling_window": np.array(windows, dtype=np.int64),
+        "rolling_token": np.array(tokens, dtype=np.int64),
+        "rolling_last_time": np.array(last_times, dtype=np.float64),
+        "rolling_offsets": np.array(offsets, dtype=np.int64),
+        "rolling_times": np.concatenate(times) if times else np.zeros(0),
+        "rolling_prices": np.concatenate(prices) if prices else np.zeros(0),
+        "rolling_in_min": np.concatenate(in_min) if in_min else np.zeros(0, dtype=bool),
+        "rolling_in_max": np.concatenate(in_max) if in_max else np.zeros(0, dtype=bool),
+    })
+
+    cooldowns = engine.cooldowns.export()
+    columns.update({
+        "cooldown_user": np.array([c[0] for c in cooldowns], dtype=str),
+        "cooldown_symbol": np.array([c[1] for c in cooldowns], dtype=str),
+        "cooldown_type": np.array([c[2] for c in cooldowns], dtype=np.int8),
+        "cooldown_remaining": np.array([c[3] for c in cooldowns], dtype=np.float64),
+    })
+    return columns
+
+
+def write(columns: Dict[str, np.ndarray], path: str):
+    """Write columns to `path` atomically: a crash mid-write leaves the previous snapshot intact"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **columns)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save_snapshot(engine, path: str):
+    write(capture(engine), path)
+
+
+def restore_snapshot(engine, path: str, max_age_seconds: float) -> bool:
+    """Load a snapshot into a freshly started engine. Returns False (and leaves
+    the engine untouched) when there is none, it is unreadable or too old."""
+    try:
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files}
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        print(f"Ignoring unreadable alert engine snapshot {path}: {e}")
+        return False
+
+    version, saved_at = columns["meta"].tolist()
+    age = time.time() - saved_at
+    if version != SNAPSHOT_VERSION or not 0 <= age <= max_age_seconds:
+        print(f"Ignoring alert engine snapshot {path} (version {int(version)}, {age:.0f}s old)")
+        return False
+
+    trailing = engine.indicators.trailing.state
+    for token, high, low in zip(columns["trailing_token"].tolist(), columns["trailing_high"].tolist(), columns["trailing_low"].tolist()):
+        trailing[token] = {"high": high, "low": low}
+
+    offsets = columns["rolling_offsets"]
+    for row, (window, token, last_time) in enumerate(zip(columns["rolling_window"].tolist(), columns["rolling_token"].tolist(),
+                                                         columns["rolling_last_time"].tolist())):
+        ticks = slice(offsets[row], offsets[row + 1])
+        engine.indicators.rolling_algo(window).state[token] = RollingWindowState.restore(
+            window, columns["rolling_times"][ticks], columns["rolling_prices"][ticks],
+            columns["rolling_in_min"][ticks], columns["rolling_in_max"][ticks], last_time)
+
+    # Time kept running while the process was down
+    engine.cooldowns.restore([
+        (user_id, symbol, order, remaining - age)
+        for user_id, symbol, order, remaining in zip(columns["cooldown_user"].tolist(), columns["cooldown_symbol"].tolist(),
+                                                     columns["cooldown_type"].tolist(), columns["cooldown_remaining"].tolist())
+        if remaining > age
+    ])
+    print(f"Restored alert engine snapshot: {len(trailing)} trailing, {len(offsets) - 1} rolling, {len(engine.cooldowns)} cooldowns ({age:.0f}s old)")
+    return True
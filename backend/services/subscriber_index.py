@@ -0,0 +1,93 @@
+from array import array
+from bisect import bisect_right
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from backend.models import AlgoMode, SettingsInDB
+
+class SubscriberGroup:
+    """Subscribers of one token that see the same moves (same algo flags and window).
+
+    Thresholds are kept sorted, so the subscribers crossed by a move are
+    always a prefix: one bisect answers "who alerts?" and the common
+    no-alert tick stops there.
+    """
+    __slots__ = ("trailing", "window", "dip_thresholds", "dip_members", "rise_thresholds", "rise_members")
+
+    def __init__(self, trailing: bool, window: Optional[int]):
+        self.trailing = trailing
+        self.window = window
+        self.dip_thresholds = array('d')
+        self.dip_members = array('l') # Subscriber index in the TokenPlan, same order as dip_thresholds
+        self.rise_thresholds = array('d')
+        self.rise_members = array('l')
+
+    def crossed_dips(self, dip_pct: float) -> int:
+        """Number of leading dip_members whose threshold is <= dip_pct"""
+        return bisect_right(self.dip_thresholds, dip_pct)
+
+    def crossed_spikes(self, spike_pct: float) -> int:
+        """Number of leading rise_members whose threshold is <= spike_pct"""
+        return bisect_right(self.rise_thresholds, spike_pct)
+
+
+class TokenPlan:
+    """Compiled subscriber table for one token.
+
+    Subscribers are stored column-wise, indexed by their position in
+    token_map[token], which is also the order alerts are fired in.
+    """
+    __slots__ = ("trailing", "windows", "groups", "user_ids", "symbols", "settings", "cooldown_seconds", "cooldown_keys")
+
+    def __init__(self):
+        self.trailing = False # Any subscriber on TRAILING/BOTH
+        self.windows: List[int] = [] # Distinct rolling window lengths (minutes)
+        self.groups: List[SubscriberGroup] = []
+        self.user_ids: List[str] = []
+        self.symbols: List[str] = []
+        self.settings: List[SettingsInDB] = []
+        self.cooldown_seconds = array('d')
+        self.cooldown_keys = np.zeros(0, dtype=np.int64) # CooldownTable keys: [2 * i] DIP, [2 * i + 1] SPIKE
+
+
+def build_plan(subscribers: List[Tuple[str, str]], user_settings: Dict[str, SettingsInDB],
+               slot_of: Callable[[str, str], int] = None) -> TokenPlan:
+    """`slot_of` maps (user_id, symbol) to its CooldownTable slot, to fill cooldown_keys"""
+    plan = TokenPlan()
+    members: Dict[Tuple[bool, Optional[int]], List[int]] = {}
+    for user_id, symbol in subscribers:
+        settings = user_settings.get(user_id)
+        if not settings:
+            continue
+        uses_trailing = settings.algo_mode in [AlgoMode.TRAILING, AlgoMode.BOTH]
+        window = settings.timeframe_minutes if settings.algo_mode in [AlgoMode.ROLLING, AlgoMode.BOTH] else None
+
+        plan.trailing = plan.trailing or uses_trailing
+        if window is not None and window not in plan.windows:
+            plan.windows.append(window)
+
+        members.setdefault((uses_trailing, window), []).append(len(plan.user_ids))
+        plan.user_ids.append(user_id)
+        plan.symbols.append(symbol)
+        plan.settings.append(settings)
+        plan.cooldown_seconds.append(settings.cooldown_minutes * 60)
+
+    if slot_of is not None:
+        slots = np.fromiter((slot_of(user_id, symbol) for user_id, symbol in zip(plan.user_ids, plan.symbols)), dtype=np.int64, count=len(plan.user_ids))
+        plan.cooldown_keys = np.stack([2 * slots, 2 * slots + 1], axis=1).ravel()
+
+    for (uses_trailing, window), indices in members.items():
+        group = SubscriberGroup(uses_trailing, window)
+        for i in sorted(indices, key=lambda i: plan.settings[i].dip_threshold):
+            group.dip_thresholds.append(plan.settings[i].dip_threshold)
+            group.dip_members.append(i)
+        for i in sorted(indices, key=lambda i: plan.settings[i].rise_threshold):
+            group.rise_thresholds.append(plan.settings[i].rise_threshold)
+            group.rise_members.append(i)
+        plan.groups.append(group)
+    return plan
+
+
+def build_plans(token_map: Dict[int, List[Tuple[str, str]]], user_settings: Dict[str, SettingsInDB],
+                slot_of: Callable[[str, str], int] = None) -> Dict[int, TokenPlan]:
+    """Compile token_map + user_settings into one TokenPlan per monitored token"""
+    return {token: build_plan(subscribers, user_settings, slot_of) for token, subscribers in token_map.items()}
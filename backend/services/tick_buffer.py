@@ -0,0 +1,178 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Dict, List
+
+class ConflatingTickBuffer:
+    """Bounded ingest buffer between the ticker and the alert engine.
+
+    Up to `max_batches` batches are queued as-is. Once the consumer lags
+    beyond that, everything pending is conflated per token: the latest
+    tick wins, but `conflated_high` / `conflated_low` keep the extremes
+    seen in between so trailing and rolling state can still absorb them.
+    Memory is then bounded by the number of distinct tokens.
+
+    On the way out, a tick whose price equals the last one delivered for
+    its token is held back instead of being evaluated again. The held
+    tick is delivered just before the next price change, so rolling windows
+    still see the price as recent, at one evaluation per run of repeats.
+    """
+    def __init__(self, max_batches: int = 100):
+        self.max_batches = max_batches
+        self.pending = deque()
+        self.conflated: Dict[int, Dict] = None # token -> merged tick, while the consumer lags
+        self.ready = asyncio.Event()
+        self.last_prices: Dict[int, float] = {} # token -> last delivered price
+        self.held: Dict[int, Dict] = {} # token -> latest unchanged-price tick not yet delivered
+        self.metrics = {
+            "received_batches": 0,
+            "conflated_ticks": 0,
+            "conflated_batches": 0,
+            "conflation_episodes": 0,
+            "skipped_unchanged": 0,
+            "dropped_batches": 0,
+        }
+
+    def __len__(self):
+        return len(self.pending) + (1 if self.conflated is not None else 0)
+
+    def put(self, ticks: List[Dict]):
+        """Non-blocking: never makes the producer wait, never grows past one batch per token"""
+        self.metrics["received_batches"] += 1
+        if self.conflated is None and len(self.pending) < self.max_batches:
+            self.pending.append(ticks)
+        else:
+            if self.conflated is None:
+                self.conflated = {}
+                self.metrics["conflation_episodes"] += 1
+                while self.pending:
+                    self._merge(self.pending.popleft())
+                    self.metrics["conflated_batches"] += 1
+            self._merge(ticks)
+            self.metrics["conflated_batches"] += 1
+        self.ready.set()
+
+    def _merge(self, ticks: List[Dict]):
+        for tick in ticks:
+            token = tick["instrument_token"]
+            price = tick["last_price"]
+            merged = dict(tick)
+            high = tick.get("conflated_high", price)
+            low = tick.get("conflated_low", price)
+            previous = self.conflated.get(token)
+            if previous is not None:
+                high = max(high, previous["conflated_high"])
+                low = min(low, previous["conflated_low"])
+                self.metrics["conflated_ticks"] += 1
+            merged["conflated_high"] = high
+            merged["conflated_low"] = low
+            self.conflated[token] = merged
+
+    async def get(self) -> List[Dict]:
+        """Wait for the next batch (conflated if the consumer fell behind)"""
+        while True:
+            if self.pending:
+                batch = self.pending.popleft()
+            elif self.conflated is not None:
+                batch = list(self.conflated.values())
+                self.conflated = None
+            else:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+
+            batch = self._skip_unchanged(batch)
+            if batch:
+                return batch
+
+    def _skip_unchanged(self, ticks: List[Dict]) -> List[Dict]:
+        out = []
+        for tick in ticks:
+            token = tick["instrument_token"]
+            price = tick["last_price"]
+            if price == self.last_prices.get(token) and "conflated_high" not in tick:
+                if token in self.held:
+                    self.metrics["skipped_unchanged"] += 1
+                self.held[token] = tick
+                continue
+            held = self.held.pop(token, None)
+            if held is not None:
+                out.append(held)
+            out.append(tick)
+            self.last_prices[token] = price
+        return out
+
+    def drop(self):
+        """Count a batch discarded because nothing is consuming yet"""
+        self.metrics["dropped_batches"] += 1
+
+    def status(self) -> Dict:
+        return {
+            "depth": len(self.pending),
+            "conflating": self.conflated is not None,
+            "conflated_tokens": len(self.conflated) if self.conflated is not None else 0,
+            "max_batches": self.max_batches,
+            **self.metrics,
+        }
+
+
+class TickIngestRing:
+    """Hands tick batches from the KiteTicker thread to the event loop.
+
+    The producer thread appends to a bounded deque (the oldest batch is
+    dropped when it is full) and schedules at most one drain per burst with
+    `call_soon_threadsafe`. The drain runs on the loop, takes everything
+    queued and passes it to `dispatch` as one list. deque appends/pops are
+    atomic, so neither side takes a lock.
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, dispatch: Callable[[List[Dict]], None], capacity: int = 1024):
+        self.loop = loop
+        self.dispatch = dispatch
+        self.capacity = capacity
+        self.batches = deque(maxlen=capacity) # (ticks, perf_counter at ingest)
+        self.scheduled = False
+        self.metrics = {
+            "ingested_batches": 0,
+            "dropped_batches": 0,
+            "drains": 0,
+            "latency_last_ms": 0.0, # Ingest -> dispatch of the oldest batch in a drain
+            "latency_avg_ms": 0.0, # Exponential moving average of the above
+            "latency_max_ms": 0.0,
+        }
+
+    def push(self, ticks: List[Dict]):
+        """Producer side (any thread); never blocks"""
+        if len(self.batches) == self.capacity:
+            self.metrics["dropped_batches"] += 1
+        self.batches.append((ticks, time.perf_counter()))
+        self.metrics["ingested_batches"] += 1
+        # Append before checking: a drain that already cleared the flag will still see this batch
+        if not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        self.scheduled = False
+        ticks = []
+        oldest = None
+        while True:
+            try:
+                batch, ingested = self.batches.popleft()
+            except IndexError:
+                break
+            if oldest is None:
+                oldest = ingested
+            ticks.extend(batch)
+        if oldest is None:
+            return
+
+        latency = (time.perf_counter() - oldest) * 1000
+        metrics = self.metrics
+        metrics["drains"] += 1
+        metrics["latency_last_ms"] = latency
+        metrics["latency_avg_ms"] = latency if metrics["drains"] == 1 else 0.9 * metrics["latency_avg_ms"] + 0.1 * latency
+        metrics["latency_max_ms"] = max(metrics["latency_max_ms"], latency)
+        self.dispatch(ticks)
+
+    def status(self) -> Dict:
+        return {"depth": len(self.batches), "capacity": self.capacity, **self.metrics}
@@ -0,0 +1,67 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List
+
+try:
+    import msgpack
+except ImportError: # Binary frames are optional; clients asking for them get JSON
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+FORMATS = (JSON, MSGPACK) if msgpack else (JSON,)
+
+# Tick fields that KiteTicker delivers as datetimes
+TIME_FIELDS = ("exchange_timestamp", "last_trade_time", "timestamp")
+
+def _plain(value):
+    """Fallback for fields outside the fixed schema"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def plain_tick(tick: Dict) -> Dict:
+    """Tick with its datetime fields as ISO strings; everything else is already JSON-native.
+
+    Kite ticks have a fixed shape (numbers, an `ohlc` dict of floats, a
+    `depth` dict of lists of number dicts), so only the timestamp fields need
+    converting; no per-value reflection like jsonable_encoder.
+    """
+    out = dict(tick)
+    for field in TIME_FIELDS:
+        value = out.get(field)
+        if value is not None and not isinstance(value, (str, int, float)):
+            out[field] = value.isoformat()
+    return out
+
+
+def encode_tick(tick: Dict, format: str = JSON):
+    """One tick, ready to be spliced into a TICK_UPDATE frame"""
+    tick = plain_tick(tick)
+    if format == MSGPACK:
+        return msgpack.packb(tick, default=_plain)
+    return json.dumps(tick, separators=(",", ":"), ensure_ascii=False, default=_plain)
+
+
+def tick_frame(encoded_ticks: List, format: str = JSON):
+    """TICK_UPDATE frame assembled from individually pre-encoded ticks"""
+    if format == MSGPACK:
+        packer = msgpack.Packer()
+        return (packer.pack_map_header(2) + packer.pack("type") + packer.pack("TICK_UPDATE") + packer.pack("data")
+                + packer.pack_array_header(len(encoded_ticks)) + b"".join(encoded_ticks))
+    return '{"type":"TICK_UPDATE","data":[' + ",".join(encoded_ticks) + "]}"
+
+
+def encode_message(message: Dict, format: str = JSON):
+    """Any other message (alerts, dashboard stats)"""
+    if format == MSGPACK:
+        return msgpack.packb(message, default=_plain)
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=_plain)
@@ -0,0 +1,126 @@
+import glob
+import os
+import queue
+import threading
+import time
+import numpy as np
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from backend.services.algorithms import tick_time
+
+# One tick in a journal segment; segments are headerless arrays of these
+JOURNAL_RECORD = np.dtype([
+    ("token", "<i8"), ("timestamp", "<f8"), ("price", "<f8"), ("volume", "<i8"),
+    ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+])
+
+def encode(ticks: List[Dict], now: float) -> np.ndarray:
+    """Pack a tick batch into journal records (missing fields are 0)"""
+    records = np.zeros(len(ticks), dtype=JOURNAL_RECORD)
+    for i, tick in enumerate(ticks):
+        ohlc = tick.get("ohlc") or {}
+        records[i] = (
+            tick["instrument_token"], tick_time(tick, now), tick["last_price"],
+            tick.get("volume_traded", tick.get("volume")) or 0,
+            ohlc.get("open", 0.0), ohlc.get("high", 0.0), ohlc.get("low", 0.0), ohlc.get("close", 0.0),
+        )
+    return records
+
+
+class TickJournal:
+    """Append-only binary record of every tick batch the ticker receives.
+
+    `append` only enqueues; a writer thread encodes and writes, so neither
+    the ticker thread nor the event loop waits on disk. Records go to one
+    segment per day (`ticks-YYYYMMDD.bin`). A crash can at worst leave a
+    partial record at the end of a segment; readers ignore it, and the
+    writer cuts it off before appending so later records stay aligned.
+    """
+    def __init__(self, directory: str, max_pending: int = 10000):
+        self.directory = directory
+        self.pending = queue.Queue(max_pending) # (ticks, receive time); None stops the writer
+        self.thread: Optional[threading.Thread] = None
+        self.file = None
+        self.segment: Optional[str] = None
+        self.metrics = {"batches": 0, "records": 0, "dropped_batches": 0, "errors": 0}
+
+    def append(self, ticks: List[Dict]):
+        """Thread-safe and non-blocking; drops (and counts) the batch if the writer is far behind"""
+        if self.thread is None:
+            self._start()
+        try:
+            self.pending.put_nowait((ticks, time.time()))
+        except queue.Full:
+            self.metrics["dropped_batches"] += 1
+
+    def _start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._write_loop, name="tick-journal", daemon=True)
+        self.thread.start()
+
+    def _write_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            try:
+                ticks, received = item
+                self._open(received).write(encode(ticks, received).tobytes())
+                self.metrics["batches"] += 1
+                self.metrics["records"] += len(ticks)
+                if self.pending.empty():
+                    self.file.flush()
+            except Exception as e:
+                self.metrics["errors"] += 1
+                print(f"Error writing tick journal: {e}")
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def _open(self, received: float):
+        path = segment_path(self.directory, datetime.fromtimestamp(received))
+        if path != self.segment:
+            if self.file:
+                self.file.close()
+            self.file = open(path, "ab")
+            # Drop a torn record left by a crash, or everything after it would be misaligned
+            size = self.file.tell()
+            if size % JOURNAL_RECORD.itemsize:
+                self.file.truncate(size - size % JOURNAL_RECORD.itemsize)
+                self.file.seek(0, os.SEEK_END)
+            self.segment = path
+        return self.file
+
+    def close(self, timeout: float = 5.0):
+        """Write out everything queued so far and stop the writer"""
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+    def status(self) -> Dict:
+        return {**self.metrics, "pending": self.pending.qsize(), "segment": self.segment}
+
+
+def segment_path(directory: str, day: datetime) -> str:
+    return os.path.join(directory, f"ticks-{day:%Y%m%d}.bin")
+
+
+def read_segment(path: str) -> np.ndarray:
+    """Memory-map a segment as a read-only record array (no copy, no parsing)"""
+    count = os.path.getsize(path) // JOURNAL_RECORD.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=JOURNAL_RECORD)
+    return np.memmap(path, dtype=JOURNAL_RECORD, mode="r", shape=(count,))
+
+
+def segments(directory: str, start: str = None, end: str = None) -> List[str]:
+    """Segment paths in date order, optionally limited to [start, end] (YYYYMMDD, inclusive)"""
+    paths = sorted(glob.glob(os.path.join(directory, "ticks-*.bin")))
+    day = lambda path: os.path.basename(path)[6:14]
+    return [path for path in paths if (start is None or day(path) >= start) and (end is None or day(path) <= end)]
+
+
+def read_journal(directory: str, start: str = None, end: str = None) -> Iterator[np.ndarray]:
+    for path in segments(directory, start, end):
+        yield read_segment(path)
@@ -3,13 +3,24 @@ import os
 import logging
 import asyncio
 import random
+import time
 from datetime import datetime
 from typing import List, Callable
+from backend.services.tick_journal import TickJournal
+from backend.services.tick_buffer import TickIngestRing
+from backend.services.price_history import PriceHistory
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Every received tick batch is journaled here, one segment per day ("" disables)
+TICK_JOURNAL_DIR = os.getenv("TICK_JOURNAL_DIR", "tick_journal")
+# Batches buffered between the KiteTicker thread and the event loop
+TICK_INGEST_CAPACITY = int(os.getenv("TICK_INGEST_CAPACITY", 1024))
+# Prices kept per token for sparklines
+PRICE_HISTORY_DEPTH = int(os.getenv("PRICE_HISTORY_DEPTH", 30))
+
 class TickerService:
     def __init__(self):
         self.api_key = os.getenv("KITE_API_KEY")
@@ -19,7 +30,9 @@ class TickerService:
         self.on_ticks_callback = None
         self.mock_mode = False
         self.connection_manager = None
+        self.dashboard_stats = None # Last DASHBOARD_UPDATE sent
         self.loop = None # Store the main event loop
+        self.ingest = None # KiteTicker thread -> event loop (created with the loop)
         
         # Dashboard Metrics
         self.metrics = {
@@ -28,7 +41,8 @@ class TickerService:
             "total_ticks": 0
         }
         self.logs = []
-        self.price_history = {} # token -> list of {price, time}
+        self.price_history = PriceHistory(PRICE_HISTORY_DEPTH) # token -> ring of recent (time, price)
+        self.journal = TickJournal(TICK_JOURNAL_DIR) if TICK_JOURNAL_DIR else None
         self.connected = False
 
     def log(self, message: str, level: str = "INFO"):
@@ -47,6 +61,7 @@ class TickerService:
         # Capture the running loop here, as this is called from startup_event
         try:
             self.loop = asyncio.get_running_loop()
+            self.ingest = TickIngestRing(self.loop, self.dispatch_ticks, TICK_INGEST_CAPACITY)
         except RuntimeError:
             pass
 
@@ -77,50 +92,36 @@ class TickerService:
         """Common tick processing logic (History, Metrics)"""
         self.connected = True
         self.metrics["total_ticks"] += len(ticks)
+        if self.journal:
+            self.journal.append(ticks)
         
         # Update History
-        for tick in ticks:
-            token = tick["instrument_token"]
-            if token not in self.price_history:
-                self.price_history[token] = []
-            
-            self.price_history[token].append({
-                "price": tick["last_price"],
-                "time": tick["timestamp"] if "timestamp" in tick else datetime.now().isoformat(),
-                "change": tick.get("change", 0)
-            })
-            
-            # Keep last 30 points for sparkline
-            if len(self.price_history[token]) > 30:
-                self.price_history[token].pop(0)
+        self.price_history.append(ticks, time.time())
 
     async def broadcast_ticks(self, ticks):
         """Async broadcast method"""
         if self.connection_manager:
             try:
-                # Standard Tick Update
-                # Use jsonable_encoder to handle all datetime/decimal conversions automatically
-                from fastapi.encoders import jsonable_encoder
-                
-                payload = {
-                    "type": "TICK_UPDATE",
-                    "data": jsonable_encoder(ticks)
-                }
-                await self.connection_manager.broadcast(payload)
-                
-                # Dashboard Stats Update
-                dashboard_payload = {
-                    "type": "DASHBOARD_UPDATE",
-                    "stats": {
-                        "active_stocks": len(self.subscribed_tokens),
-                        "connected": self.connected,
-                        "uptime": self.metrics["uptime_start"]
-                    }
-                }
-                await self.connection_manager.broadcast(dashboard_payload)
+                # Standard Tick Update (the manager encodes each tick once per wire format)
+                await self.connection_manager.broadcast_ticks(ticks)
+                dashboard = self._dashboard_update()
+                if dashboard:
+                    await self.connection_manager.broadcast(dashboard)
             except Exception as e:
                 logger.error(f"Broadcast error: {e}")
 
+    def _dashboard_update(self):
+        """DASHBOARD_UPDATE message when the stats changed, else None (late joiners get the last one on connect)"""
+        stats = {
+            "active_stocks": len(self.subscribed_tokens),
+            "connected": self.connected,
+            "uptime": self.metrics["uptime_start"]
+        }
+        if stats == self.dashboard_stats:
+            return None
+        self.dashboard_stats = stats
+        return {"type": "DASHBOARD_UPDATE", "stats": stats}
+
     async def start_mock_ticker(self):
         # STRICT PRODUCTION CHECK
         if os.getenv("PRODUCTION_MODE", "false").lower() == "true":
@@ -174,24 +175,45 @@ class TickerService:
             self.kws.connect(threaded=background)
 
     def on_ticks(self, ws, ticks):
-        """Called by KiteTicker in a separate thread"""
-        # DEBUG LOG
-        if len(ticks) > 0:
-            print(f"DEBUG: Received {len(ticks)} ticks. First: {ticks[0]['instrument_token']} -> {ticks[0]['last_price']}")
+        """Called by KiteTicker in a separate thread: only hands the batch to the event loop"""
+        if self.ingest:
+            self.ingest.push(ticks)
+        else:
+            self.process_ticks(ticks) # No loop yet: keep history, nothing to broadcast to
 
-        # 1. Process Logic
+    def dispatch_ticks(self, ticks):
+        """Runs on the event loop with every batch drained from the ingest ring.
+        Hand-offs are synchronous; a task is only created for a coroutine callback or a bus publish."""
         self.process_ticks(ticks)
+        self.metrics["avg_latency"] = round(self.ingest.metrics["latency_avg_ms"], 2)
 
-        # 2. Broadcast (Schedule on main loop)
-        if self.connection_manager and self.loop:
-            asyncio.run_coroutine_threadsafe(self.broadcast_ticks(ticks), self.loop)
-        else:
-            print("DEBUG: Connection Manager or Loop not ready for broadcast")
+        if self.on_ticks_callback:
+            try:
+                result = self.on_ticks_callback(ticks)
+                if asyncio.iscoroutine(result):
+                    self.loop.create_task(self._await_callback(result))
+            except Exception as e:
+                logger.error(f"Tick callback error: {e}")
 
-        # 3. Callback (Schedule on main loop if it's async, or run if sync)
-        # Assuming on_ticks_callback is async (alert engine)
-        if self.on_ticks_callback and self.loop:
-             asyncio.run_coroutine_threadsafe(self.on_ticks_callback(ticks), self.loop)
+        manager = self.connection_manager
+        if manager is None:
+            return
+        if manager.bus:
+            self.loop.create_task(self.broadcast_ticks(ticks)) # Publishing awaits the bus' network I/O
+            return
+        try:
+            manager.deliver_ticks(ticks)
+            dashboard = self._dashboard_update()
+            if dashboard:
+                manager.deliver(dashboard)
+        except Exception as e:
+            logger.error(f"Broadcast error: {e}")
+
+    async def _await_callback(self, result):
+        try:
+            await result
+        except Exception as e:
+            logger.error(f"Tick callback error: {e}")
 
     def on_connect(self, ws, response):
         logger.info("KiteTicker connected")
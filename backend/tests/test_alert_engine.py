@@ -1,4 +1,5 @@
 import pytest
+import time
 from collections import deque
 from datetime import datetime, timedelta
 from backend.services.algorithms import RollingWindowAlgo, RollingWindowState
@@ -8,7 +9,7 @@ from backend.models import SettingsInDB
 # --- Rolling Window Algo Tests ---
 def test_rolling_window_state_update():
     window = RollingWindowState(window_minutes=1)
-    now = datetime.utcnow()
+    now = time.time()
     
     # 1. Add initial price
     min_val, max_val = window.update(100, now)
@@ -16,12 +17,12 @@ def test_rolling_window_state_update():
     assert max_val == 100
     
     # 2. Add higher price
-    min_val, max_val = window.update(110, now + timedelta(seconds=10))
+    min_val, max_val = window.update(110, now + 10)
     assert min_val == 100
     assert max_val == 110
     
     # 3. Add lower price
-    min_val, max_val = window.update(90, now + timedelta(seconds=20))
+    min_val, max_val = window.update(90, now + 20)
     assert min_val == 90
     assert max_val == 110
     
@@ -31,13 +32,13 @@ def test_rolling_window_state_update():
     # Wait, let's expire just the first one.
     # T=0 (100), T+10 (110), T+20 (90).
     # Advance to T+65. T=0 is expired. T+10 (110) remains.
-    min_val, max_val = window.update(95, now + timedelta(seconds=65))
+    min_val, max_val = window.update(95, now + 65)
     # Window: [110 (10s), 90 (20s), 95 (65s)]
     assert max_val == 110
     assert min_val == 90
     
     # Advance to T+80. T+10 (110) expired.
-    min_val, max_val = window.update(95, now + timedelta(seconds=80))
+    min_val, max_val = window.update(95, now + 80)
     # Window: [90 (20s), 95 (65s), 95 (80s)] -> Wait, 20s is also expired (80-20=60).
     # Actually 80-20 = 60. So 20s is just on the edge or expired.
     # Let's say strictly > 60.
@@ -45,14 +46,14 @@ def test_rolling_window_state_update():
     # Let's test explicit expiration
     window = RollingWindowState(window_minutes=1)
     window.update(100, now) # T=0
-    window.update(120, now + timedelta(seconds=30)) # T=30
+    window.update(120, now + 30) # T=30
     
     # T=70. T=0 expired. Max should be 120.
-    min_val, max_val = window.update(110, now + timedelta(seconds=70))
+    min_val, max_val = window.update(110, now + 70)
     assert max_val == 120
     
     # T=100. T=30 expired. Max should be 110.
-    min_val, max_val = window.update(105, now + timedelta(seconds=100))
+    min_val, max_val = window.update(105, now + 100)
     assert max_val == 110
 
 def test_rolling_window_algo_process_tick():
@@ -97,7 +98,6 @@ async def test_alert_engine_caching():
     # Manually inject cache
     engine.user_settings = mock_settings
     engine.token_map = mock_token_map
-    engine.rolling_algos["user_1"] = RollingWindowAlgo(window_minutes=10)
     
     # Test process_ticks uses cache
     ticks = [{"instrument_token": 123, "last_price": 100, "timestamp": datetime.utcnow()}]
@@ -118,3 +118,67 @@ async def test_alert_engine_caching():
     ticks[0]["last_price"] = 98 # 2% dip
     await engine.process_ticks(ticks)
     assert called
+
+@pytest.mark.asyncio
+async def test_alert_engine_shares_indicators_across_subscribers():
+    engine = AlertEngine()
+    engine.user_settings = {
+        f"user_{i}": SettingsInDB(user_id=f"user_{i}", timeframe_minutes=10 if i % 2 else 5) for i in range(50)
+    }
+    engine.token_map = {123: [(f"user_{i}", "RELIANCE") for i in range(50)]}
+    async def ignore(*args, **kwargs):
+        pass
+    engine.trigger_alert = ignore
+
+    await engine.process_ticks([{"instrument_token": 123, "last_price": 100}])
+
+    # One window state per distinct window length, not per user
+    assert sorted(engine.indicators.rolling) == [5, 10]
+    assert all(list(algo.state) == [123] for algo in engine.indicators.rolling.values())
+    assert list(engine.indicators.rolling[10].state[123].max_queue) == [0]
+
+def test_subscriber_index_sorted_by_threshold():
+    from backend.services.subscriber_index import build_plan
+    from backend.models import AlgoMode
+    settings = {
+        "a": SettingsInDB(user_id="a", dip_threshold=2.0, rise_threshold=0.5, algo_mode=AlgoMode.TRAILING),
+        "b": SettingsInDB(user_id="b", dip_threshold=0.5, rise_threshold=3.0, algo_mode=AlgoMode.TRAILING),
+        "c": SettingsInDB(user_id="c", dip_threshold=1.0, rise_threshold=1.0, algo_mode=AlgoMode.ROLLING, timeframe_minutes=5),
+    }
+    plan = build_plan([("a", "INFY"), ("b", "INFY"), ("c", "INFY"), ("ghost", "INFY")], settings)
+
+    assert plan.user_ids == ["a", "b", "c"]
+    assert plan.trailing and plan.windows == [5]
+    trailing = next(g for g in plan.groups if g.trailing)
+    assert list(trailing.dip_members) == [1, 0]
+    # 1.5% dip crosses b (0.5%) but not a (2.0%)
+    assert list(trailing.dip_members[:trailing.crossed_dips(1.5)]) == [1]
+    assert trailing.crossed_dips(0.1) == 0
+    assert trailing.crossed_spikes(3.0) == 2
+
+# --- Incremental Cache Updates ---
+def test_alert_engine_applies_cache_events_in_place():
+    from backend.services.cache_events import CacheEventBus, stock_event
+    bus = CacheEventBus()
+    engine = AlertEngine()
+    bus.subscribe(engine.apply_event)
+    engine.user_settings = {"u1": SettingsInDB(user_id="u1"), "u2": SettingsInDB(user_id="u2")}
+    engine.token_map = {1: [("u1", "INFY")]}
+    engine._ensure_plans()
+    untouched = engine.token_plans[1]
+
+    # New stock: only token 2 is compiled, token 1 keeps its plan
+    bus.stock_added("u2", "TCS", 2, stock_id="s2")
+    assert engine.token_map[2] == [("u2", "TCS")]
+    assert engine.token_plans[1] is untouched
+    assert engine.token_plans[2].user_ids == ["u2"]
+
+    # Threshold change shows up in that user's tables immediately
+    bus.settings_updated(SettingsInDB(user_id="u2", dip_threshold=0.3))
+    group = engine.token_plans[2].groups[0]
+    assert list(group.dip_thresholds) == [0.3]
+
+    # A change-stream delete only carries the _id
+    bus.publish(stock_event({"operationType": "delete", "documentKey": {"_id": "s2"}}))
+    assert 2 not in engine.token_map and 2 not in engine.token_plans
+    assert engine._plan_versions == engine._map_versions()
@@ -0,0 +1,120 @@
+import asyncio
+import os
+from datetime import datetime
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+from backend.services.alert_store import AlertWriter
+
+class FakeCollection:
+    """insert_many like pymongo: assigns _id in place, rejects duplicate _ids, can fail part-way"""
+    def __init__(self):
+        self.docs = {}
+        self.down = False
+        self.fail_after = None
+        self.calls = []
+
+    async def insert_many(self, documents, ordered=True):
+        self.calls.append((len(documents), ordered))
+        if self.down:
+            raise AutoReconnect("connection refused")
+        errors = []
+        for i, doc in enumerate(documents):
+            doc.setdefault("_id", ObjectId())
+            if self.fail_after is not None and len(self.docs) >= self.fail_after:
+                raise AutoReconnect("connection reset")
+            if doc["_id"] in self.docs:
+                errors.append({"index": i, "code": 11000, "errmsg": "duplicate key"})
+            else:
+                self.docs[doc["_id"]] = dict(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": len(documents) - len(errors)})
+
+
+def alert(i):
+    return {"user_id": "u1", "stock_symbol": f"S{i}", "price": 100.0 + i, "timestamp": datetime(2024, 1, 1, 9, 15, i)}
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_without_waiting_for_the_timer(tmp_path):
+    collection = FakeCollection()
+    writer = AlertWriter(lambda: collection, str(tmp_path / "spool.jsonl"), max_batch=3, interval=60)
+    runner = asyncio.create_task(writer.run())
+    for i in range(7):
+        writer.add(alert(i))
+    await asyncio.sleep(0.01)
+    runner.cancel()
+
+    assert collection.calls == [(3, False), (3, False)] # The seventh waits for the timer
+    assert writer.status()["buffered"] == 1 and writer.status()["last_batch"] == 3
+
+
+@pytest.mark.asyncio
+async def test_outage_spills_to_spool_and_recovery_replays_it(tmp_path):
+    collection = FakeCollection()
+    spool = str(tmp_path / "spool.jsonl")
+    writer = AlertWriter(lambda: collection, spool, max_batch=10)
+
+    collection.down = True
+    writer.add(alert(1))
+    writer.add(alert(2))
+    await writer.flush()
+    assert writer.status()["spool_depth"] == 2 and os.path.exists(spool)
+
+    collection.down = False
+    writer.add(alert(3))
+    await writer.flush()
+    await asyncio.sleep(0.01) # Replay runs in the background after a successful flush
+
+    assert sorted(doc["stock_symbol"] for doc in collection.docs.values()) == ["S1", "S2", "S3"]
+    assert next(doc for doc in collection.docs.values() if doc["stock_symbol"] == "S2")["timestamp"].replace(tzinfo=None) == datetime(2024, 1, 1, 9, 15, 2)
+    assert writer.status()["spool_depth"] == 0 and writer.status()["replayed"] == 2
+    assert not os.path.exists(spool)
+
+
+@pytest.mark.asyncio
+async def test_partial_write_is_replayed_without_duplicates(tmp_path):
+    collection = FakeCollection()
+    writer = AlertWriter(lambda: collection, str(tmp_path / "spool.jsonl"), max_batch=10)
+    for i in range(4):
+        writer.add(alert(i))
+    collection.fail_after = 2 # Connection drops after two documents are stored
+    await writer.flush()
+
+    collection.fail_after = None
+    await writer.replay()
+    assert len(collection.docs) == 4
+
+
+@pytest.mark.asyncio
+async def test_buffer_left_at_shutdown_is_inserted_on_next_start(tmp_path):
+    spool = str(tmp_path / "spool.jsonl")
+    writer = AlertWriter(lambda: FakeCollection(), spool)
+    writer.add(alert(1))
+    writer.close()
+
+    collection = FakeCollection()
+    restarted = AlertWriter(lambda: collection, spool, interval=60)
+    assert restarted.status()["spool_depth"] == 1
+    runner = asyncio.create_task(restarted.run())
+    await asyncio.sleep(0.01)
+    runner.cancel()
+    assert [doc["stock_symbol"] for doc in collection.docs.values()] == ["S1"]
+
+
+@pytest.mark.asyncio
+async def test_torn_spool_line_is_set_aside_and_the_rest_replayed(tmp_path):
+    spool = str(tmp_path / "spool.jsonl")
+    collection = FakeCollection()
+    writer = AlertWriter(lambda: collection, spool, max_batch=10)
+    writer.spill([alert(1), alert(2), alert(3)])
+    with open(spool, "a") as f: # Crash in the middle of the next spill
+        f.write('{"user_id": "u1", "stock_sym')
+    writer.spill([alert(4)])
+
+    await writer.replay()
+    assert sorted(doc["stock_symbol"] for doc in collection.docs.values()) == ["S1", "S2", "S3", "S4"]
+    assert writer.status()["bad_lines"] == 1 and writer.status()["spool_depth"] == 0
+    assert not os.path.exists(spool + ".replaying")
+    with open(spool + ".bad") as f:
+        assert f.read().startswith('{"user_id": "u1", "stock_sym')
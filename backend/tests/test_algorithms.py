@@ -1,6 +1,7 @@
 import unittest
 from collections import deque
-from backend.services.algorithms import TrailingAlgo, RollingWindowAlgo
+import numpy as np
+from backend.services.algorithms import TrailingAlgo, RollingWindowAlgo, tick_time
 
 class TestAlgorithms(unittest.TestCase):
     def test_trailing_algo(self):
@@ -48,6 +49,22 @@ class TestAlgorithms(unittest.TestCase):
         # Window: [100, 105, 95, 90, 110] -> Low: 90
         dip, spike = algo.process_tick(token, 110.0)
         self.assertAlmostEqual(spike, 22.22, places=2)
+    def test_naive_exchange_time_is_ist(self):
+        from datetime import datetime, timezone
+        naive = datetime(2024, 1, 2, 9, 15)
+        self.assertEqual(tick_time({"exchange_timestamp": naive}, 0.0), datetime(2024, 1, 2, 3, 45, tzinfo=timezone.utc).timestamp())
+        self.assertEqual(tick_time({}, 7.0), 7.0)
+
+    def test_process_batch_notices_a_timestamp_change_mid_batch(self):
+        # First and last timestamps match (a late tick), but the middle ticks are past the window and expire the first
+        algo = RollingWindowAlgo(window_minutes=1)
+        prices = np.array([100.0, 120.0, 120.0, 120.0, 120.0, 120.0, 120.0, 110.0])
+        timestamps = np.array([1000.0, 1100.0, 1100.0, 1100.0, 1100.0, 1100.0, 1100.0, 1000.0])
+        expected = RollingWindowAlgo(window_minutes=1)
+        want = [expected.process_tick(1, p, t) for p, t in zip(prices.tolist(), timestamps.tolist())]
+        dips, spikes = algo.process_batch(1, prices, timestamps)
+        self.assertEqual(dips.tolist(), [d for d, _ in want])
+        self.assertEqual(spikes.tolist(), [s for _, s in want])
 
 if __name__ == '__main__':
     unittest.main()
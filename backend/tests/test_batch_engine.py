@@ -0,0 +1,91 @@
+import pytest
+import random
+import numpy as np
+import time
+from backend.services.batch_engine import segmented_running_max, segmented_running_min
+from backend.services.algorithms import RollingWindowAlgo, RollingWindowState
+from backend.services.alert_engine import AlertEngine
+from backend.models import SettingsInDB, AlgoMode
+
+# --- Segmented Accumulate Tests ---
+def test_segmented_running_extremes_restart_per_slot():
+    values = np.array([5.0, 7.0, 6.0, 1.0, 3.0, 2.0, 9.0])
+    slots = np.array([0, 0, 0, 1, 1, 2, 2])
+
+    assert segmented_running_max(values, slots).tolist() == [5.0, 7.0, 7.0, 1.0, 3.0, 2.0, 9.0]
+    assert segmented_running_min(values, slots).tolist() == [5.0, 5.0, 5.0, 1.0, 1.0, 2.0, 2.0]
+
+def test_rolling_process_batch_matches_process_tick():
+    prices = [100.0, 101.5, 99.0, 99.0, 102.0, 98.5, 100.0, 97.5, 101.0, 99.5]
+    scalar = RollingWindowAlgo(window_minutes=10)
+    batched = RollingWindowAlgo(window_minutes=10)
+
+    now = time.time()
+    expected = [scalar.process_tick(1, p, now) for p in prices]
+    dip, spike = batched.process_batch(1, np.array(prices), np.full(len(prices), now))
+    assert list(zip(dip.tolist(), spike.tolist())) == expected
+
+    # Monotonic queues must hold the same prices so later ticks agree too
+    for queue in ("min_queue", "max_queue"):
+        b, s = batched.state[1], scalar.state[1]
+        assert [b.prices[i & b.mask] for i in getattr(b, queue)] == [s.prices[i & s.mask] for i in getattr(s, queue)]
+
+def test_rolling_window_state_grows_and_expires():
+    window = RollingWindowState(window_minutes=1, capacity=2)
+    # Strictly rising prices all stay in the min queue, forcing the ring to grow
+    for t in range(10):
+        low, high = window.update(100.0 + t, float(t))
+    assert (low, high) == (100.0, 109.0)
+    assert window.mask + 1 >= 10
+
+    # 61s later everything up to t=0 has expired
+    assert window.update(105.0, 61.0) == (101.0, 109.0)
+    # A timestamp going backwards is clamped instead of un-expiring ticks
+    assert window.update(104.0, 30.0) == (101.0, 109.0)
+
+# --- Batch vs Reference Parity ---
+def _build_engine(mode):
+    engine = AlertEngine(mode=mode)
+    modes = [AlgoMode.TRAILING, AlgoMode.ROLLING, AlgoMode.BOTH]
+    engine.user_settings = {
+        f"user_{u}": SettingsInDB(
+            user_id=f"user_{u}",
+            dip_threshold=0.5 + 0.25 * u,
+            rise_threshold=0.75 + 0.25 * u,
+            algo_mode=modes[u % 3],
+            timeframe_minutes=5 + 5 * (u % 2),
+        ) for u in range(6)
+    }
+    engine.token_map = {
+        token: [(f"user_{u}", f"STOCK_{token}") for u in range(6) if (token + u) % 2 == 0 or u == 0]
+        for token in range(1, 9)
+    }
+
+    fired = []
+    async def record(user_id, symbol, price, change, type, settings):
+        fired.append((user_id, symbol, price, change, type))
+    engine.trigger_alert = record
+    return engine, fired
+
+@pytest.mark.asyncio
+async def test_batch_mode_fires_same_alerts_as_reference():
+    rng = random.Random(7)
+    prices = {token: 100.0 for token in range(1, 10)}
+    batches = []
+    for _ in range(20):
+        ticks = []
+        for _ in range(rng.randint(1, 60)):
+            token = rng.randint(1, 9) # token 9 is unmonitored
+            prices[token] = round(prices[token] * (1 + rng.uniform(-0.01, 0.01)), 2)
+            ticks.append({"instrument_token": token, "last_price": prices[token]})
+        batches.append(ticks)
+
+    reference, expected = _build_engine("reference")
+    batch, actual = _build_engine("batch")
+    for ticks in batches:
+        await reference.process_ticks(ticks)
+        await batch.process_ticks(ticks)
+
+    assert len(expected) > 0
+    assert actual == expected
+    assert batch.indicators.trailing.state == reference.indicators.trailing.state
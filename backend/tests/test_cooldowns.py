@@ -0,0 +1,98 @@
+import pytest
+from backend.services.cooldowns import CooldownTable
+from backend.services.alert_engine import AlertEngine
+from backend.models import SettingsInDB, AlgoMode, AlertType
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_cooldown_expires_and_is_swept():
+    clock = FakeClock()
+    table = CooldownTable(clock=clock)
+    dip = table.key("u1", "INFY", AlertType.DIP)
+    spike = table.key("u1", "INFY", AlertType.SPIKE)
+    assert spike == dip + 1
+
+    table.start(dip, 60)
+    assert not table.ready(dip) and table.ready(spike)
+    assert len(table) == 1
+
+    clock.now += 59
+    assert table.sweep() == 0 and not table.ready(dip)
+    clock.now += 1
+    assert table.ready(dip)
+    assert table.sweep() == 1
+    assert len(table) == 0 and not table.heap
+
+def test_rearmed_cooldown_outlives_its_old_heap_entry():
+    clock = FakeClock()
+    table = CooldownTable(clock=clock)
+    key = table.key("u1", "INFY", AlertType.DIP)
+    table.start(key, 10)
+    clock.now += 5
+    table.start(key, 10)
+
+    clock.now += 6
+    assert table.sweep() == 0 and not table.ready(key)
+    clock.now += 4
+    assert table.sweep() == 1 and table.ready(key)
+
+def test_any_ready_over_a_tokens_keys():
+    clock = FakeClock()
+    table = CooldownTable(clock=clock, capacity=2)
+    keys = [table.key(f"u{i}", "INFY", type) for i in range(3) for type in (AlertType.DIP, AlertType.SPIKE)]
+    for key in keys:
+        table.start(key, 30)
+    assert not table.any_ready(keys[:4]) # The table grew past its initial capacity
+    clock.now += 30
+    table.start(keys[0], 30)
+    assert table.any_ready(keys[:4])
+
+def test_released_slot_keeps_cooldown_until_expiry():
+    clock = FakeClock()
+    table = CooldownTable(clock=clock)
+    key = table.key("u1", "INFY", AlertType.DIP)
+    table.start(key, 60)
+
+    # Re-adding the stock right away must not reset the cooldown
+    table.release("u1", "INFY")
+    assert table.key("u1", "INFY", AlertType.DIP) == key and not table.ready(key)
+
+    table.release("u1", "INFY")
+    clock.now += 60
+    table.sweep()
+    assert table.status()["subscribers"] == 0
+    # The freed slot is reused
+    assert table.key("u2", "TCS", AlertType.DIP) == key
+
+@pytest.mark.asyncio
+async def test_engine_skips_tokens_whose_subscribers_are_all_cooling_down():
+    engine = AlertEngine(mode="reference")
+    engine.cooldowns = CooldownTable(clock=FakeClock())
+    engine.user_settings = {"u1": SettingsInDB(user_id="u1", algo_mode=AlgoMode.TRAILING, dip_threshold=1.0, cooldown_minutes=5)}
+    engine.token_map = {1: [("u1", "INFY")]}
+
+    calls = []
+    async def record(user_id, symbol, price, change, type, settings):
+        calls.append((price, type))
+    engine.trigger_alert = record
+
+    await engine.process_ticks([{"instrument_token": 1, "last_price": 100.0}, {"instrument_token": 1, "last_price": 98.0}])
+    assert calls == [(98.0, AlertType.DIP)]
+
+    # Only the DIP key is cooling: the token is still fanned out
+    dip, spike = engine.token_plans[1].cooldown_keys.tolist()
+    engine.cooldowns.start(dip, 300)
+    assert engine.cooldowns.any_ready(engine.token_plans[1].cooldown_keys)
+    await engine.process_ticks([{"instrument_token": 1, "last_price": 97.5}])
+    assert len(calls) == 2
+
+    # Both keys cooling: no fan-out at all, but indicators still see the tick
+    engine.cooldowns.start(spike, 300)
+    await engine.process_ticks([{"instrument_token": 1, "last_price": 97.0}])
+    assert len(calls) == 2
+    assert engine.indicators.trailing.state[1]["low"] == 97.0
@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from backend.services.delivery import ChannelScheduler, DeliveryScheduler, TokenBucket
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_its_rate():
+    clock = Clock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time() == 0.5
+    clock.now = 0.5
+    assert bucket.wait_time() == 0
+    bucket.pause(3)
+    assert bucket.wait_time() == 3
+
+
+def test_rate_limits_are_split_across_sender_processes():
+    scheduler = DeliveryScheduler(limits={"telegram": (25, 1)}, processes=4)
+    telegram = scheduler.channels["telegram"]
+    assert telegram.bucket.rate == 6.25 and telegram.dest_rate == 0.25
+
+
+@pytest.mark.asyncio
+async def test_bigger_moves_go_out_first_under_the_channel_limit():
+    scheduler = ChannelScheduler("telegram", rate=50, dest_rate=100, concurrency=1)
+    order = []
+    def send(name):
+        async def _send():
+            order.append(name)
+        return _send
+
+    # Sends waiting together go out largest move first
+    await scheduler.submit("chat-0", send("first"))
+    await asyncio.gather(*[scheduler.submit(f"chat-{p}", send(p), priority=p) for p in (0.5, 3.0, 1.2)])
+    assert order == ["first", 3.0, 1.2, 0.5]
+    status = scheduler.status()
+    assert status["sent"] == 4 and status["queued"] == 0 and status["wait_max_ms"] > 0
+    scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_busy_destination_does_not_hold_up_others():
+    scheduler = ChannelScheduler("telegram", rate=1000, dest_rate=10, dest_burst=1)
+    order = []
+    def send(name):
+        async def _send():
+            order.append(name)
+        return _send
+
+    await asyncio.gather(scheduler.submit("busy", send("busy-1"), priority=5),
+                         scheduler.submit("busy", send("busy-2"), priority=5),
+                         scheduler.submit("quiet", send("quiet")))
+    assert order == ["busy-1", "quiet", "busy-2"]
+    scheduler.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_send_is_retried_through_the_limiter(monkeypatch):
+    monkeypatch.setattr("backend.services.delivery.NOTIFY_RETRY_SECONDS", 0.01)
+    scheduler = ChannelScheduler("email", rate=1000, dest_rate=1000, max_attempts=3)
+    attempts = []
+    async def flaky():
+        attempts.append(len(attempts))
+        if len(attempts) < 3:
+            raise ConnectionError("provider busy")
+
+    await scheduler.submit("a@example.com", flaky)
+    assert len(attempts) == 3
+    assert scheduler.status()["retried"] == 2
+
+    async def broken():
+        raise ConnectionError("down")
+    with pytest.raises(ConnectionError):
+        await scheduler.submit("b@example.com", broken)
+    assert scheduler.status()["failed"] == 1
+    scheduler.close()
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+import pytest
+from backend.workers.notification_worker import NotificationWorker
+from backend.services.outbox import MemoryOutbox, SENT
+from backend.models import SettingsInDB
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+class SlowChannels:
+    """Stands in for NotificationService: every send takes 10ms and records peak concurrency and priority"""
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.active = {"telegram": 0, "email": 0}
+        self.peak = {"telegram": 0, "email": 0}
+        self.sent = []
+        self.priorities = []
+
+    async def _send(self, channel, message):
+        self.active[channel] += 1
+        self.peak[channel] = max(self.peak[channel], self.active[channel])
+        await asyncio.sleep(0.01)
+        self.active[channel] -= 1
+        if channel in self.failing:
+            raise ConnectionError(f"{channel} is down")
+        self.sent.append((channel, message))
+
+    def channel_sends(self, settings, message, priority=0, skip=()):
+        self.priorities.append(priority)
+        return [(channel, self._send(channel, message)) for channel in ("telegram", "email") if channel not in skip]
+
+
+def task(i):
+    settings = SettingsInDB(user_id=USER_ID)
+    return json.dumps({"delivery_id": f"d{i}", "settings": settings.model_dump(mode="json"),
+                       "message": f"alert {i}", "priority": i, "enqueued_at": time.time()})
+
+
+async def run_until(worker, done):
+    runner = asyncio.create_task(worker.run())
+    while not done():
+        await asyncio.sleep(0.01)
+    worker.stop()
+    await runner
+
+
+@pytest.mark.asyncio
+async def test_worker_delivers_batches_concurrently():
+    outbox = MemoryOutbox()
+    await outbox.add([task(i) for i in range(20)])
+    channels = SlowChannels()
+    worker = NotificationWorker(outbox, channels, batch_size=10, max_in_flight=8, block_ms=10)
+
+    await run_until(worker, lambda: worker.metrics["processed"] == 20)
+
+    assert len(channels.sent) == 40
+    assert channels.peak == {"telegram": 8, "email": 8} # Bounded by max_in_flight
+    assert sorted(channels.priorities) == list(range(20))
+    status = worker.status()
+    assert status["batches"] == 2 and status["dequeued"] == 20
+    assert status["failed"] == 0 and status["in_flight"] == 0
+    assert status["latency_p95_ms"] is not None
+    assert (await outbox.status())["length"] == 0 # Everything acked
+
+
+@pytest.mark.asyncio
+async def test_bad_message_is_counted_and_dropped():
+    outbox = MemoryOutbox()
+    await outbox.add(["not json", task(1)])
+    worker = NotificationWorker(outbox, SlowChannels(), batch_size=10, block_ms=10)
+
+    await run_until(worker, lambda: worker.metrics["processed"] + worker.metrics["failed"] == 2)
+    assert worker.metrics == {"dequeued": 2, "processed": 1, "failed": 1, "batches": 1, "skipped_channels": 0}
+    assert (await outbox.status())["length"] == 0
+
+
+@pytest.mark.asyncio
+async def test_entry_of_a_crashed_worker_is_redelivered_without_resending():
+    outbox = MemoryOutbox(visibility_seconds=0.05)
+    await outbox.add([task(1)])
+    # A worker claimed it, sent Telegram, and died before email and ack
+    assert len(await outbox.claim("dead", 10, block_ms=0)) == 1
+    await outbox.record("d1", "telegram", SENT)
+
+    channels = SlowChannels()
+    worker = NotificationWorker(outbox, channels, consumer="alive", block_ms=10)
+    await run_until(worker, lambda: worker.metrics["processed"] == 1)
+
+    assert channels.sent == [("email", "alert 1")]
+    assert worker.metrics["skipped_channels"] == 1
+    assert await outbox.delivered("d1") == {"telegram": SENT, "email": SENT}
+    assert (await outbox.status())["reclaimed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_channel_is_recorded_and_not_retried_forever():
+    outbox = MemoryOutbox()
+    await outbox.add([task(1)])
+    worker = NotificationWorker(outbox, SlowChannels(failing=("email",)), block_ms=10)
+
+    await run_until(worker, lambda: worker.metrics["failed"] == 1)
+    statuses = await outbox.delivered("d1")
+    assert statuses["telegram"] == SENT and statuses["email"].startswith("failed")
+    assert (await outbox.status())["length"] == 0
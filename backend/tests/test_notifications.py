@@ -0,0 +1,162 @@
+import asyncio
+import json
+import pytest
+from backend.services.notifications import NotificationService
+from backend.services.outbox import MemoryOutbox
+from backend.models import AlertType, SettingsInDB
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+class FlakyOutbox(MemoryOutbox):
+    """Counts round-trips; fails them while `down`"""
+    def __init__(self, down=False):
+        super().__init__()
+        self.down = down
+        self.adds = 0
+
+    async def add(self, payloads):
+        if self.down:
+            raise ConnectionError("redis is down")
+        self.adds += 1
+        await super().add(payloads)
+
+
+def service_with(outbox):
+    service = NotificationService()
+    service.redis_url = "redis://stand-in"
+    service.outbox = outbox
+    service.delivered = []
+    async def deliver(settings, message, priority=0, delivery_id=None):
+        service.delivered.append(message)
+    service.deliver = deliver
+    return service
+
+
+@pytest.mark.asyncio
+async def test_burst_is_enqueued_in_one_pipeline():
+    outbox = FlakyOutbox()
+    service = service_with(outbox)
+    settings = SettingsInDB(user_id=USER_ID, telegram_enabled=True, telegram_chat_id="42")
+
+    await asyncio.gather(*[service.send_all(settings, f"alert {i}") for i in range(5)])
+
+    assert outbox.adds == 1
+    queued = [json.loads(payload) for payload in outbox.entries.values()]
+    assert [task["message"] for task in queued] == [f"alert {i}" for i in range(5)]
+    assert len({task["delivery_id"] for task in queued}) == 5
+    assert SettingsInDB(**queued[0]["settings"]).telegram_chat_id == "42"
+    assert service.delivered == []
+    assert service.status()["enqueued"] == 5
+
+
+@pytest.mark.asyncio
+async def test_redis_down_falls_back_to_direct_send():
+    outbox = FlakyOutbox(down=True)
+    service = service_with(outbox)
+    settings = SettingsInDB(user_id=USER_ID)
+
+    await asyncio.gather(service.send_all(settings, "a"), service.send_all(settings, "b"))
+    assert sorted(service.delivered) == ["a", "b"]
+    assert service.status()["redis_down"]
+
+    # While marked down, Redis is not retried on every alert
+    outbox.down = False
+    await service.send_all(settings, "c")
+    assert service.delivered[-1] == "c"
+    assert outbox.adds == 0
+
+
+@pytest.mark.asyncio
+async def test_direct_send_after_an_ambiguous_enqueue_is_not_repeated_by_the_worker():
+    from backend.workers.notification_worker import NotificationWorker
+
+    class TimedOutOutbox(MemoryOutbox):
+        """The entries land, but the reply never arrives"""
+        async def add(self, payloads):
+            await super().add(payloads)
+            raise TimeoutError("reply timed out")
+
+    outbox = TimedOutOutbox()
+    service = NotificationService()
+    service.redis_url = "redis://stand-in"
+    service.outbox = outbox
+    sent = []
+    async def send_telegram(chat_id, message, priority=0):
+        sent.append(message)
+    service.send_telegram = send_telegram
+    settings = SettingsInDB(user_id=USER_ID, telegram_enabled=True, telegram_chat_id="42")
+
+    await service.send_all(settings, "a")
+    assert sent == ["a"]
+
+    worker = NotificationWorker(outbox, service, block_ms=0)
+    [(entry_id, data)] = await outbox.claim(worker.consumer, 10, block_ms=0)
+    await worker.process(entry_id, data)
+    assert sent == ["a"] and worker.metrics["skipped_channels"] == 1
+
+
+@pytest.mark.asyncio
+async def test_close_waits_for_the_last_pipeline():
+    service = service_with(None)
+    settings = SettingsInDB(user_id=USER_ID, telegram_enabled=True, telegram_chat_id="42")
+
+    events = []
+    class SlowOutbox(MemoryOutbox):
+        async def add(self, payloads):
+            await asyncio.sleep(0.01)
+            events.append("added")
+            await super().add(payloads)
+    class Redis:
+        async def aclose(self):
+            events.append("redis closed")
+    service.outbox, service.redis = SlowOutbox(), Redis()
+
+    sending = asyncio.create_task(service.send_all(settings, "last"))
+    await asyncio.sleep(0) # Batched, not yet flushed
+    await service.close()
+    assert events == ["added", "redis closed"]
+    await sending
+    assert service.delivered == []
+
+
+def alert(symbol, change, type=AlertType.DIP):
+    return {"stock_symbol": symbol, "price": 100.0, "change_percent": change, "alert_type": type, "message": f"single {symbol}"}
+
+
+@pytest.mark.asyncio
+async def test_digest_coalesces_a_burst_into_one_message():
+    service = service_with(None)
+    service.redis_url = None
+    # A zero window (below what the API accepts) flushes on the next loop turn
+    digest_user = SettingsInDB(user_id=USER_ID, digest_enabled=True).model_copy(update={"digest_seconds": 0})
+    plain_user = SettingsInDB(user_id="507f1f77bcf86cd799439012")
+
+    for symbol, change in [("INFY", 1.2), ("TCS", 3.4), ("HDFC", 2.0)]:
+        await service.send_alert(digest_user, alert(symbol, change))
+    await service.send_alert(digest_user, alert("RELIANCE", 1.5, AlertType.SPIKE))
+    await service.send_alert(plain_user, alert("WIPRO", 1.1))
+    assert service.delivered == ["single WIPRO"]
+
+    await asyncio.sleep(0.01)
+    assert len(service.delivered) == 2
+    lines = service.delivered[1].split("\n")
+    assert lines[0] == "🚨 *StormAlert: 4 alerts* (📉 3 · 📈 1)"
+    assert [line.split("*")[1] for line in lines[1:]] == ["TCS", "HDFC", "RELIANCE", "INFY"]
+    assert service.digest.status() == {"alerts": 4, "digests": 1, "messages_saved": 3, "open": 0}
+
+
+@pytest.mark.asyncio
+async def test_lone_alert_in_a_digest_window_is_sent_as_is():
+    service = service_with(None)
+    service.redis_url = None
+    settings = SettingsInDB(user_id=USER_ID, digest_enabled=True, digest_seconds=60)
+    await service.send_alert(settings, alert("INFY", 1.2))
+    await service.digest.flush_all() # Shutdown does not wait for the window
+    assert service.delivered == ["single INFY"]
+
+
+def test_digest_window_is_bounded():
+    from pydantic import ValidationError
+    for seconds in (0, 301, None):
+        with pytest.raises(ValidationError):
+            SettingsInDB(user_id=USER_ID, digest_seconds=seconds)
@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from backend.services.outbox import MemoryOutbox, RedisOutbox, SENT
+
+def memory_outbox():
+    return MemoryOutbox(visibility_seconds=0.05)
+
+def redis_outbox():
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisOutbox(fakeredis.FakeAsyncRedis(), visibility_seconds=0.05)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("make_outbox", [memory_outbox, redis_outbox])
+async def test_unacked_entries_are_reclaimed_after_the_visibility_timeout(make_outbox):
+    outbox = make_outbox()
+    await outbox.setup()
+    await outbox.add(['{"n": 1}', '{"n": 2}'])
+
+    first = await outbox.claim("a", 10, block_ms=10)
+    assert [payload for _, payload in first] in ([b'{"n": 1}', b'{"n": 2}'], ['{"n": 1}', '{"n": 2}'])
+    assert await outbox.claim("b", 10, block_ms=10) == [] # Still invisible to others
+
+    await outbox.ack([first[0][0]])
+    await asyncio.sleep(0.06)
+    reclaimed = await outbox.claim("b", 10, block_ms=10)
+    assert [entry_id for entry_id, _ in reclaimed] == [first[1][0]]
+
+    await outbox.record("d1", "telegram", SENT)
+    assert await outbox.delivered("d1") == {"telegram": SENT}
+    await outbox.ack([first[1][0]])
+    status = await outbox.status()
+    assert (status["length"], status["pending"], status["reclaimed"]) == (0, 0, 1)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("make_outbox", [memory_outbox, redis_outbox])
+async def test_touch_keeps_a_slow_delivery_claimed(make_outbox):
+    outbox = make_outbox()
+    await outbox.setup()
+    await outbox.add(['{"n": 1}'])
+    [(entry_id, _)] = await outbox.claim("a", 10, block_ms=10)
+    await asyncio.sleep(0.04)
+    await outbox.touch("a", [entry_id])
+    await asyncio.sleep(0.03)
+    assert await outbox.claim("b", 10, block_ms=10) == []
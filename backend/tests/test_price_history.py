@@ -0,0 +1,45 @@
+import numpy as np
+from backend.services.price_history import PriceHistory, lttb
+
+def tick(token, price, timestamp, change=0.0):
+    return {"instrument_token": token, "last_price": price, "exchange_timestamp": timestamp, "change": change}
+
+def test_rings_keep_the_last_depth_prices_per_token():
+    history = PriceHistory(depth=3, capacity=1)
+    history.append([tick(1, 10.0, 1.0), tick(2, 20.0, 1.0), tick(1, 11.0, 2.0)], now=0.0)
+    history.append([tick(1, 12.0, 3.0), tick(1, 13.0, 4.0, change=1.5)], now=0.0)
+
+    times, prices = history.series(1)
+    assert prices.tolist() == [11.0, 12.0, 13.0]
+    assert times.tolist() == [2.0, 3.0, 4.0]
+    assert history.series(2)[1].tolist() == [20.0]
+    assert len(history) == 2 and 3 not in history
+    assert {"token": 1, "price": 13.0, "change": 1.5} in history.latest()
+
+def test_one_batch_can_wrap_a_ring():
+    history = PriceHistory(depth=4)
+    history.append([tick(7, float(p), float(p)) for p in range(6)], now=0.0)
+    assert history.series(7)[1].tolist() == [2.0, 3.0, 4.0, 5.0]
+
+def test_repeated_tokens_keep_their_last_tick_and_change():
+    history = PriceHistory(depth=2)
+    history.append([tick(1, float(p), float(p), change=float(p)) for p in range(5)] + [tick(2, 9.0, 9.0, change=-1.0)], now=0.0)
+    assert history.series(1)[1].tolist() == [3.0, 4.0]
+    assert {(row["token"], row["price"], row["change"]) for row in history.latest()} == {(1, 4.0, 4.0), (2, 9.0, -1.0)}
+
+def test_lttb_keeps_endpoints_and_extremes():
+    times = np.arange(100, dtype=float)
+    prices = np.full(100, 50.0)
+    prices[37] = 80.0
+    prices[71] = 10.0
+    keep = lttb(times, prices, 10)
+    assert len(keep) == 10 and keep[0] == 0 and keep[-1] == 99
+    assert 37 in keep and 71 in keep
+    assert lttb(times[:5], prices[:5], 10).tolist() == [0, 1, 2, 3, 4]
+
+def test_sparklines_for_many_tokens():
+    history = PriceHistory(depth=50)
+    history.append([tick(token, 100.0 + i, float(i)) for i in range(50) for token in (1, 2)], now=0.0)
+    series = history.sparklines([1, 2, 99], points=5)
+    assert sorted(series) == [1, 2]
+    assert len(series[1]["p"]) == 5 and series[1]["t"][0] == 0.0 and series[1]["p"][-1] == 149.0
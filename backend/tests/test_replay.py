@@ -0,0 +1,48 @@
+import json
+import pytest
+from backend.services.replay import SimulatedClock, load_ticks, replay, replay_file
+
+START = 1_700_000_000.0
+
+def write_recording(path):
+    batches = [
+        [{"instrument_token": 1, "last_price": 100.0, "exchange_timestamp": START}],
+        [{"instrument_token": 1, "last_price": 99.0, "exchange_timestamp": START + 60}],
+        [{"instrument_token": 1, "last_price": 98.4, "exchange_timestamp": START + 120}],
+        # 11 minutes later: the 100.0 high has left a 10-minute window
+        [{"instrument_token": 1, "last_price": 98.0, "exchange_timestamp": START + 780}],
+    ]
+    path.write_text("\n".join(json.dumps(batch) for batch in batches))
+    return str(path)
+
+CONFIGS = [
+    {"algo_mode": "rolling", "dip_threshold": 0.8, "rise_threshold": 50.0, "timeframe_minutes": 10, "cooldown_minutes": 1},
+    {"algo_mode": "trailing", "dip_threshold": 1.5, "rise_threshold": 50.0, "cooldown_minutes": 15},
+]
+
+def test_load_ticks_csv_groups_rows_by_timestamp(tmp_path):
+    path = tmp_path / "ticks.csv"
+    path.write_text("instrument_token,last_price,exchange_timestamp\n1,100,10\n2,50,10\n1,101,11\n")
+    assert [[t["instrument_token"] for t in batch] for batch in load_ticks(str(path))] == [[1, 2], [1]]
+
+@pytest.mark.asyncio
+async def test_replay_uses_tick_time_for_windows_and_cooldowns(tmp_path):
+    path = write_recording(tmp_path / "ticks.jsonl")
+    rolling, trailing = await replay(load_ticks(path), CONFIGS)
+
+    # The 1-minute cooldown armed at +60s has run out on the simulated clock by +120s;
+    # by +780s the 100.0 high is out of the window, while trailing is still cooling down
+    assert [(a["price"], a["timestamp"]) for a in rolling["alerts"]] == [(99.0, START + 60), (98.4, START + 120)]
+    assert [(a["price"], a["timestamp"]) for a in trailing["alerts"]] == [(98.4, START + 120)]
+    assert rolling["config"] is CONFIGS[0]
+
+def test_replay_is_deterministic_across_workers(tmp_path):
+    path = write_recording(tmp_path / "ticks.jsonl")
+    assert replay_file(path, CONFIGS, workers=2) == replay_file(path, CONFIGS, workers=1)
+
+def test_simulated_clock_never_goes_back():
+    clock = SimulatedClock(10.0)
+    clock.advance_to(5.0)
+    assert clock() == 10.0
+    clock.advance_to(12.5)
+    assert clock() == 12.5
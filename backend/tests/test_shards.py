@@ -0,0 +1,82 @@
+import pytest
+import asyncio
+import numpy as np
+from backend.services.shards import TickRing, ShardPool
+from backend.services.alert_engine import AlertEngine
+from backend.models import SettingsInDB, AlgoMode
+
+def test_tick_ring_wraps_and_drops_when_full():
+    ring = TickRing(capacity=4)
+    try:
+        assert ring.push(np.array([1, 2, 3]), np.array([10.0, 20.0, 30.0]), np.zeros(3)) == 3
+        assert ring.drain()["token"].tolist() == [1, 2, 3]
+
+        # Wraps around the end of the buffer; only 4 fit
+        assert ring.push(np.arange(4, 10), np.arange(4, 10, dtype=float), np.zeros(6)) == 4
+        records = ring.drain()
+        assert records["token"].tolist() == [4, 5, 6, 7]
+        assert records["price"].tolist() == [4.0, 5.0, 6.0, 7.0]
+        assert len(ring) == 0
+    finally:
+        ring.close(unlink=True)
+
+@pytest.mark.asyncio
+async def test_shard_pool_fires_alerts_on_main_process():
+    engine = AlertEngine()
+    engine.user_settings = {
+        "u1": SettingsInDB(user_id="u1", algo_mode=AlgoMode.TRAILING, dip_threshold=1.0),
+        "u2": SettingsInDB(user_id="u2", algo_mode=AlgoMode.TRAILING, rise_threshold=1.0),
+    }
+    engine.token_map = {10: [("u1", "INFY")], 11: [("u2", "TCS")]}
+
+    fired = asyncio.Queue()
+    async def record(user_id, symbol, price, change, type, settings):
+        await fired.put((user_id, symbol, price, type.value))
+    engine.trigger_alert = record
+
+    pool = ShardPool(2, mode="batch", capacity=128)
+    pool.start()
+    engine.shards = pool
+    collector = asyncio.create_task(pool.collect(engine))
+    try:
+        await engine.process_ticks([{"instrument_token": 10, "last_price": 100.0}, {"instrument_token": 11, "last_price": 100.0}])
+        await engine.process_ticks([{"instrument_token": 10, "last_price": 98.0}, {"instrument_token": 11, "last_price": 102.0}])
+
+        alerts = {await asyncio.wait_for(fired.get(), timeout=30) for _ in range(2)}
+        assert alerts == {("u1", "INFY", 98.0, "DIP"), ("u2", "TCS", 102.0, "SPIKE")}
+        assert pool.status()["dispatched_ticks"] == 4
+    finally:
+        engine.shards = None
+        pool.stop()
+        await asyncio.wait_for(collector, timeout=5)
+
+@pytest.mark.asyncio
+async def test_shard_emitter_arms_the_shard_cooldown():
+    import queue
+    from backend.models import AlertType
+    from backend.services.shards import _shard_emitter
+    engine = AlertEngine()
+    alerts = queue.Queue()
+    emit = _shard_emitter(engine, alerts)
+    settings = SettingsInDB(user_id="u1", cooldown_minutes=15)
+    for price in (98.0, 97.0):
+        await emit("u1", "INFY", price, -2.0, AlertType.DIP, settings)
+    await emit("u1", "INFY", 103.0, 3.0, AlertType.SPIKE, settings)
+    assert [alerts.get_nowait()[2] for _ in range(alerts.qsize())] == [98.0, 103.0]
+
+def test_moved_symbol_is_removed_from_its_previous_shard():
+    from backend.services.cache_events import CacheEvent, STOCK_ADDED, STOCK_REMOVED
+
+    class Control:
+        def __init__(self):
+            self.sent = []
+        def send(self, message):
+            self.sent.append(message)
+
+    pool = ShardPool(2, mode="batch")
+    pool.controls = [Control(), Control()]
+    pool.apply_event(CacheEvent(STOCK_ADDED, "u1", "INFY", 11), moved_from=10)
+    [(_, removal)] = pool.controls[0].sent
+    [(_, added)] = pool.controls[1].sent
+    assert (removal.kind, removal.user_id, removal.symbol, removal.instrument_token) == (STOCK_REMOVED, "u1", "INFY", 10)
+    assert added.instrument_token == 11
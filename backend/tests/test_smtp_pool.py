@@ -0,0 +1,91 @@
+import asyncio
+import socket
+import pytest
+from email.mime.text import MIMEText
+from backend.services.smtp_pool import SmtpPool
+
+aiosmtpd = pytest.importorskip("aiosmtpd.controller")
+
+class Sink:
+    """Records (connection, recipients) for every message received"""
+    def __init__(self):
+        self.received = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.startswith("blocked"):
+            return "550 5.1.1 Mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.append((session.peer, envelope.rcpt_tos))
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    sink = Sink()
+    port = free_port()
+    controller = aiosmtpd.Controller(sink, hostname="127.0.0.1", port=port)
+    controller.start()
+    yield sink, port
+    controller.stop()
+
+
+def email(to):
+    msg = MIMEText("Price dropped")
+    msg["Subject"] = "StormAlert"
+    msg["From"] = "alerts@stormalert.test"
+    msg["To"] = to
+    return msg
+
+
+@pytest.mark.asyncio
+async def test_burst_goes_out_over_one_session(smtp_server):
+    sink, port = smtp_server
+    pool = SmtpPool("127.0.0.1", port, starttls=False)
+
+    await asyncio.gather(*[pool.send(email(f"user{i}@example.com")) for i in range(10)])
+    await pool.send(email("later@example.com"))
+
+    assert len(sink.received) == 11
+    assert len({peer for peer, _ in sink.received}) == 1 # One connection reused throughout
+    assert pool.status()["connects"] == 1
+    assert pool.status()["batches"] == 2
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_dropped_session_is_replaced(smtp_server):
+    sink, port = smtp_server
+    pool = SmtpPool("127.0.0.1", port, starttls=False)
+    await pool.send(email("a@example.com"))
+
+    # Server hangs up on the idle session
+    session, _ = pool.idle.get_nowait()
+    session.sock.shutdown(socket.SHUT_RDWR)
+    pool.idle.put((session, 0))
+
+    await pool.send(email("b@example.com"))
+    assert [rcpt for _, rcpt in sink.received] == [["a@example.com"], ["b@example.com"]]
+    assert pool.status()["connects"] == 2
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_rejected_recipient_fails_without_dropping_the_session(smtp_server):
+    import smtplib
+    sink, port = smtp_server
+    pool = SmtpPool("127.0.0.1", port, starttls=False)
+
+    results = await asyncio.gather(pool.send(email("blocked@example.com")), pool.send(email("ok@example.com")), return_exceptions=True)
+    assert isinstance(results[0], smtplib.SMTPRecipientsRefused) and results[1] is None
+    assert [rcpt for _, rcpt in sink.received] == [["ok@example.com"]] # Not retried
+    assert pool.status()["connects"] == 1 and pool.status()["failed"] == 1
+    pool.close()
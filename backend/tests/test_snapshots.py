@@ -0,0 +1,51 @@
+import time
+import numpy as np
+import pytest
+from backend.services.alert_engine import AlertEngine
+from backend.services.snapshots import capture, write, save_snapshot, restore_snapshot
+from backend.models import SettingsInDB, AlgoMode, AlertType
+
+def warmed_engine():
+    engine = AlertEngine(mode="reference")
+    engine.user_settings = {"u1": SettingsInDB(user_id="u1", algo_mode=AlgoMode.BOTH, timeframe_minutes=5)}
+    engine.token_map = {1: [("u1", "INFY")], 2: [("u1", "TCS")]}
+    async def ignore(*args, **kwargs):
+        pass
+    engine.trigger_alert = ignore
+    return engine
+
+@pytest.mark.asyncio
+async def test_snapshot_round_trip(tmp_path):
+    engine = warmed_engine()
+    now = time.time()
+    for offset, price in enumerate([100.0, 104.0, 99.0, 101.0]):
+        await engine.process_ticks([{"instrument_token": 1, "last_price": price, "exchange_timestamp": now + offset},
+                                    {"instrument_token": 2, "last_price": price * 10, "exchange_timestamp": now + offset}])
+    engine.cooldowns.start(engine.cooldowns.key("u1", "INFY", AlertType.DIP), 600)
+    path = str(tmp_path / "engine.npz")
+    save_snapshot(engine, path)
+
+    restored = warmed_engine()
+    assert restore_snapshot(restored, path, max_age_seconds=60)
+    assert restored.indicators.trailing.state == engine.indicators.trailing.state
+    assert not restored.cooldowns.ready(restored.cooldowns.key("u1", "INFY", AlertType.DIP))
+    assert restored.cooldowns.ready(restored.cooldowns.key("u1", "INFY", AlertType.SPIKE))
+
+    # The rolling window continues exactly as the original would
+    before = engine.indicators.rolling[5].state[1]
+    after = restored.indicators.rolling[5].state[1]
+    assert list(after.min_queue) == [1, 2] and list(after.max_queue) == [0, 2] # 99, 101 | 104, 101
+    assert after.update(98.0, now + 10) == before.update(98.0, now + 10)
+
+def test_stale_or_missing_snapshot_is_ignored(tmp_path):
+    engine = warmed_engine()
+    path = str(tmp_path / "engine.npz")
+    assert not restore_snapshot(engine, path, max_age_seconds=60)
+
+    engine.indicators.trailing.state[1] = {"high": 100.0, "low": 90.0}
+    columns = capture(engine)
+    columns["meta"] = np.array([columns["meta"][0], time.time() - 3600])
+    write(columns, path)
+    fresh = warmed_engine()
+    assert not restore_snapshot(fresh, path, max_age_seconds=60)
+    assert fresh.indicators.trailing.state == {}
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import pytest
+from backend.services.tick_buffer import ConflatingTickBuffer, TickIngestRing
+from backend.services.alert_engine import AlertEngine
+from backend.models import SettingsInDB, AlgoMode
+
+def tick(token, price):
+    return {"instrument_token": token, "last_price": price}
+
+@pytest.mark.asyncio
+async def test_lagging_consumer_gets_conflated_batch_with_extremes():
+    buffer = ConflatingTickBuffer(max_batches=2)
+    buffer.put([tick(1, 100.0)])
+    buffer.put([tick(1, 101.0)])
+    # Queue is full: everything pending collapses to one tick per token
+    buffer.put([tick(1, 95.0), tick(2, 50.0)])
+    buffer.put([tick(1, 99.0)])
+
+    assert len(buffer) == 1
+    batch = await buffer.get()
+    by_token = {t["instrument_token"]: t for t in batch}
+    assert by_token[1]["last_price"] == 99.0
+    assert (by_token[1]["conflated_high"], by_token[1]["conflated_low"]) == (101.0, 95.0)
+    assert by_token[2]["last_price"] == 50.0
+
+    status = buffer.status()
+    assert status["received_batches"] == 4
+    assert status["conflation_episodes"] == 1
+    assert status["conflated_batches"] == 4
+    assert status["depth"] == 0 and not status["conflating"]
+
+@pytest.mark.asyncio
+async def test_unchanged_price_is_held_until_the_next_move():
+    buffer = ConflatingTickBuffer()
+    buffer.put([tick(1, 100.0)])
+    buffer.put([tick(1, 100.0), tick(2, 10.0)])
+    buffer.put([tick(1, 100.0)])
+    buffer.put([tick(1, 102.0)])
+
+    assert [t["last_price"] for t in await buffer.get()] == [100.0]
+    # Repeats of 100.0 are held back; only the latest is replayed before 102.0
+    assert [t["last_price"] for t in await buffer.get()] == [10.0]
+    assert [t["last_price"] for t in await buffer.get()] == [100.0, 102.0]
+    assert buffer.status()["skipped_unchanged"] == 1
+
+@pytest.mark.asyncio
+async def test_engine_absorbs_conflated_extremes():
+    engine = AlertEngine(mode="batch")
+    engine.alert_buffer = []
+    engine.user_settings = {"u1": SettingsInDB(user_id="u1", algo_mode=AlgoMode.TRAILING, dip_threshold=2.0, rise_threshold=50.0)}
+    engine.token_map = {1: [("u1", "INFY")]}
+
+    fired = []
+    async def record(user_id, symbol, price, change, type, settings):
+        fired.append((user_id, price, round(change, 2)))
+    engine.trigger_alert = record
+
+    await engine.process_ticks([tick(1, 100.0)])
+    # The 110.0 high only survives as a conflated extreme, but the dip is still measured from it
+    await engine.process_ticks([dict(tick(1, 107.0), conflated_high=110.0, conflated_low=100.0)])
+    assert fired == [("u1", 107.0, 2.73)]
+    assert engine.indicators.trailing.state[1] == {"high": 110.0, "low": 100.0}
+
+@pytest.mark.asyncio
+async def test_ingest_ring_drains_a_burst_in_one_dispatch():
+    loop = asyncio.get_running_loop()
+    dispatched = []
+    ring = TickIngestRing(loop, dispatched.append, capacity=3)
+
+    # The KiteTicker thread pushes a burst while the loop is busy
+    producer = threading.Thread(target=lambda: [ring.push([tick(1, 100.0 + i)]) for i in range(4)])
+    producer.start()
+    producer.join()
+    await asyncio.sleep(0)
+
+    # Oldest batch fell out of the ring; the rest arrive together, in order
+    assert dispatched == [[tick(1, 101.0), tick(1, 102.0), tick(1, 103.0)]]
+    status = ring.status()
+    assert status["ingested_batches"] == 4 and status["dropped_batches"] == 1
+    assert status["drains"] == 1 and status["depth"] == 0
+    assert 0 < status["latency_last_ms"] <= status["latency_max_ms"]
+
+    ring.push([tick(2, 10.0)])
+    await asyncio.sleep(0)
+    assert dispatched[-1] == [tick(2, 10.0)]
+
+@pytest.mark.asyncio
+async def test_drained_batches_are_handed_off_without_a_task_per_batch():
+    from types import SimpleNamespace
+    from backend.services.ticker import TickerService
+    from backend.routers.websocket import ConnectionManager
+    ticker = TickerService()
+    ticker.journal = None
+    ticker.set_manager(ConnectionManager())
+    engine = AlertEngine()
+    engine.running = True
+    ticker.on_ticks_callback = engine.offer_ticks
+    tasks = []
+    ticker.loop = SimpleNamespace(create_task=tasks.append)
+
+    ticker.dispatch_ticks([tick(1, 100.0)])
+    assert tasks == []
+    assert len(engine.queue) == 1
+    assert ticker.connection_manager.metrics["broadcasts"] == 2 # The ticks and the first DASHBOARD_UPDATE
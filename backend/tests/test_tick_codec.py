@@ -0,0 +1,28 @@
+import json
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from backend.services.tick_codec import encode_tick, encode_message, tick_frame, MSGPACK
+
+TICK = {
+    "instrument_token": 408065, "last_price": 1502.5, "volume_traded": 12000, "change": -0.4,
+    "exchange_timestamp": datetime(2026, 3, 2, 9, 15, 1), "last_trade_time": datetime(2026, 3, 2, 9, 15),
+    "ohlc": {"open": 1500.0, "high": 1510.0, "low": 1495.5, "close": 1508.0},
+    "depth": {"buy": [{"quantity": 10, "price": 1502.4, "orders": 2}], "sell": []},
+}
+
+def test_json_frame_matches_jsonable_encoder():
+    frame = tick_frame([encode_tick(TICK), encode_tick({**TICK, "instrument_token": 1})])
+    assert json.loads(frame) == {"type": "TICK_UPDATE", "data": jsonable_encoder([TICK, {**TICK, "instrument_token": 1}])}
+    assert encode_tick({"instrument_token": 1, "last_price": Decimal("2.5")}) == '{"instrument_token":1,"last_price":2.5}'
+
+def test_msgpack_frame_splices_pre_encoded_ticks():
+    msgpack = pytest.importorskip("msgpack")
+    frame = tick_frame([encode_tick(TICK, MSGPACK)] * 2, MSGPACK)
+    decoded = msgpack.unpackb(frame)
+    assert decoded["type"] == "TICK_UPDATE" and len(decoded["data"]) == 2
+    assert decoded["data"][0]["exchange_timestamp"] == "2026-03-02T09:15:01"
+    assert decoded["data"][0]["ohlc"]["low"] == 1495.5
+    assert msgpack.unpackb(encode_message({"type": "ALERT_NEW", "data": {"timestamp": TICK["last_trade_time"]}}, MSGPACK)) == \
+        {"type": "ALERT_NEW", "data": {"timestamp": "2026-03-02T09:15:00"}}
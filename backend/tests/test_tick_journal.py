@@ -0,0 +1,53 @@
+from datetime import datetime
+from backend.services.tick_journal import TickJournal, JOURNAL_RECORD, read_segment, read_journal, segments, segment_path
+from backend.services.replay import load_ticks
+from backend.services.algorithms import IST
+
+def kite_tick(token, price, timestamp):
+    return {
+        "instrument_token": token, "last_price": price, "volume_traded": 1200,
+        "exchange_timestamp": datetime.fromtimestamp(timestamp, IST).replace(tzinfo=None), # Kite sends naive IST
+        "ohlc": {"open": 100.0, "high": 105.0, "low": 95.0, "close": 99.0},
+    }
+
+def test_journal_writes_fixed_width_records(tmp_path):
+    journal = TickJournal(str(tmp_path))
+    journal.append([kite_tick(1, 101.0, 1000.0), kite_tick(2, 50.0, 1000.0)])
+    journal.append([{"instrument_token": 1, "last_price": 102.0, "exchange_timestamp": 1001.0}])
+    journal.close()
+
+    [path] = segments(str(tmp_path))
+    records = read_segment(path)
+    assert records.dtype == JOURNAL_RECORD
+    assert records["token"].tolist() == [1, 2, 1]
+    assert records["price"].tolist() == [101.0, 50.0, 102.0]
+    assert records["timestamp"].tolist() == [1000.0, 1000.0, 1001.0]
+    assert records["volume"].tolist() == [1200, 1200, 0]
+    assert records[0]["high"] == 105.0 and records[2]["high"] == 0.0
+    assert journal.status()["records"] == 3
+
+    # Same-timestamp records replay as one batch
+    assert [[t["last_price"] for t in batch] for batch in load_ticks(str(tmp_path))] == [[101.0, 50.0], [102.0]]
+
+def test_reader_ignores_partial_trailing_record_and_filters_days(tmp_path):
+    for day in ("20260101", "20260102"):
+        path = segment_path(str(tmp_path), datetime.strptime(day, "%Y%m%d"))
+        with open(path, "wb") as f:
+            f.write(bytes(JOURNAL_RECORD.itemsize * 2 + 7))
+    assert [len(records) for records in read_journal(str(tmp_path))] == [2, 2]
+    assert [p[-12:-4] for p in segments(str(tmp_path), start="20260102")] == ["20260102"]
+
+def test_writer_cuts_torn_tail_before_appending(tmp_path):
+    journal = TickJournal(str(tmp_path))
+    journal.append([{"instrument_token": 1, "last_price": 101.0, "exchange_timestamp": 1000.0}])
+    journal.close()
+    [path] = segments(str(tmp_path))
+    with open(path, "ab") as f: # Crash in the middle of the next record
+        f.write(bytes(JOURNAL_RECORD.itemsize // 2))
+
+    journal = TickJournal(str(tmp_path))
+    journal.append([{"instrument_token": 2, "last_price": 50.0, "exchange_timestamp": 1001.0}])
+    journal.close()
+    records = read_segment(path)
+    assert records["token"].tolist() == [1, 2]
+    assert records["price"].tolist() == [101.0, 50.0]
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import pytest
+from backend.routers.websocket import ConnectionManager
+
+class FakeSocket:
+    def __init__(self, stall: bool = False):
+        self.stall = stall
+        self.frames = []
+        self.closed = False
+        self.release = asyncio.Event()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        if self.stall:
+            await self.release.wait()
+        self.frames.append(json.loads(frame))
+
+    async def send_bytes(self, frame):
+        import msgpack
+        self.frames.append(msgpack.unpackb(frame))
+
+    async def close(self):
+        self.closed = True
+
+class DeadSocket(FakeSocket):
+    async def send_text(self, frame):
+        raise RuntimeError("connection reset")
+
+@pytest.mark.asyncio
+async def test_stalled_client_does_not_delay_others():
+    manager = ConnectionManager(max_frames=2)
+    fast, slow = FakeSocket(), FakeSocket(stall=True)
+    await manager.connect(fast)
+    await manager.connect(slow)
+
+    for i in range(5):
+        await manager.broadcast({"type": "TICK_UPDATE", "data": [i]})
+        await asyncio.sleep(0.001)
+    assert [frame["data"] for frame in fast.frames] == [[0], [1], [2], [3], [4]]
+
+    # Frame 0 is stuck in send, 1-2 fill the queue, 3 and 4 conflate to the latest
+    slow.release.set()
+    await asyncio.sleep(0.01)
+    assert [frame["data"] for frame in slow.frames] == [[0], [1], [2], [4]]
+    assert manager.clients[slow].metrics["conflated"] == 2
+
+@pytest.mark.asyncio
+async def test_slow_client_is_dropped_rather_than_losing_alerts():
+    manager = ConnectionManager(max_frames=1)
+    slow = FakeSocket(stall=True)
+    await manager.connect(slow)
+    for _ in range(3):
+        await manager.broadcast({"type": "ALERT_NEW", "data": {}})
+    await asyncio.sleep(0)
+    assert slow not in manager.clients and slow.closed
+    assert manager.status()["dropped_slow"] == 1
+
+@pytest.mark.asyncio
+async def test_dead_connection_is_reaped():
+    manager = ConnectionManager()
+    dead = DeadSocket()
+    await manager.connect(dead)
+    await manager.broadcast({"type": "DASHBOARD_UPDATE", "stats": {}})
+    await asyncio.sleep(0.01)
+    assert manager.status()["connections"] == 0 and manager.metrics["reaped"] == 1
+
+@pytest.mark.asyncio
+async def test_clients_only_receive_ticks_for_their_tokens():
+    from backend.services.cache_events import CacheEvent, STOCK_ADDED
+    manager = ConnectionManager(frame_rate=0)
+    everyone, infy, tcs = FakeSocket(), FakeSocket(), FakeSocket()
+    for socket in (everyone, infy, tcs):
+        await manager.connect(socket)
+    manager.handle_message(infy, json.dumps({"action": "subscribe", "tokens": [1]}))
+    manager.subscribe(tcs, [2], user_id="u2")
+    manager.handle_message(tcs, "not json")
+
+    ticks = [{"instrument_token": 1, "last_price": 10.0}, {"instrument_token": 2, "last_price": 20.0}, {"instrument_token": 3, "last_price": 30.0}]
+    await manager.broadcast_ticks(ticks)
+    await asyncio.sleep(0.01)
+    assert everyone.frames == [{"type": "TICK_UPDATE", "data": ticks}]
+    assert infy.frames == [{"type": "SUBSCRIPTIONS", "tokens": [1]}, {"type": "TICK_UPDATE", "data": ticks[:1]}]
+    assert tcs.frames == [{"type": "TICK_UPDATE", "data": ticks[1:2]}]
+
+    # The user adds a stock: their authenticated connection follows; unsubscribing narrows again
+    manager.apply_event(CacheEvent(STOCK_ADDED, "u2", "WIPRO", 3))
+    manager.handle_message(infy, json.dumps({"action": "unsubscribe", "tokens": [1]}))
+    await manager.broadcast_ticks(ticks)
+    await asyncio.sleep(0.01)
+    assert tcs.frames[-1] == {"type": "TICK_UPDATE", "data": ticks[1:]}
+    assert infy.frames[-1] == {"type": "SUBSCRIPTIONS", "tokens": []}
+
+    manager.disconnect(tcs)
+    assert sorted(manager.token_clients) == []
+
+@pytest.mark.asyncio
+async def test_unsubscribe_before_subscribing_keeps_the_firehose():
+    manager = ConnectionManager(frame_rate=0)
+    socket = FakeSocket()
+    await manager.connect(socket)
+    manager.handle_message(socket, json.dumps({"action": "unsubscribe", "tokens": [1]}))
+    await manager.broadcast_ticks([{"instrument_token": 1, "last_price": 10.0}])
+    await asyncio.sleep(0.01)
+    assert socket.frames == [{"type": "TICK_UPDATE", "data": [{"instrument_token": 1, "last_price": 10.0}]}]
+    assert socket in manager.clients
+
+@pytest.mark.asyncio
+async def test_binary_clients_get_msgpack_frames():
+    pytest.importorskip("msgpack")
+    manager = ConnectionManager(frame_rate=0)
+    text, binary = FakeSocket(), FakeSocket()
+    await manager.connect(text)
+    await manager.connect(binary, format="msgpack")
+    await manager.broadcast_ticks([{"instrument_token": 1, "last_price": 10.0}])
+    await manager.broadcast({"type": "ALERT_NEW", "data": {"stock_symbol": "INFY"}})
+    await asyncio.sleep(0.01)
+    # Queued messages go out before the pending tick frame
+    assert text.frames == binary.frames == [
+        {"type": "ALERT_NEW", "data": {"stock_symbol": "INFY"}},
+        {"type": "TICK_UPDATE", "data": [{"instrument_token": 1, "last_price": 10.0}]},
+    ]
+
+@pytest.mark.asyncio
+async def test_ticks_are_conflated_per_token_between_frames():
+    manager = ConnectionManager(frame_rate=20)
+    socket = FakeSocket()
+    await manager.connect(socket)
+    for price in (10.0, 11.0, 12.0):
+        await manager.broadcast_ticks([{"instrument_token": 1, "last_price": price}, {"instrument_token": 2, "last_price": price * 2}])
+        await asyncio.sleep(0.001)
+
+    # The first batch goes out at once; the next two collapse into one frame a frame-interval later
+    assert [frame["data"] for frame in socket.frames] == [[{"instrument_token": 1, "last_price": 10.0}, {"instrument_token": 2, "last_price": 20.0}]]
+    await asyncio.sleep(0.1)
+    assert socket.frames[-1]["data"] == [{"instrument_token": 1, "last_price": 12.0}, {"instrument_token": 2, "last_price": 24.0}]
+    assert len(socket.frames) == 2 and manager.clients[socket].metrics["conflated_ticks"] == 2
+
+    manager.handle_message(socket, json.dumps({"action": "rate", "fps": 1000}))
+    assert manager.clients[socket].frame_rate == 30
+
+@pytest.mark.asyncio
+async def test_non_finite_frame_rate_is_ignored():
+    manager = ConnectionManager(frame_rate=0)
+    socket = FakeSocket()
+    await manager.connect(socket, frame_rate=float("nan"))
+    manager.handle_message(socket, '{"action": "rate", "fps": NaN}')
+    manager.handle_message(socket, '{"action": "rate", "fps": Infinity}')
+    assert manager.clients[socket].frame_rate == 0
+    for price in (10.0, 11.0):
+        await manager.broadcast_ticks([{"instrument_token": 1, "last_price": price}])
+        await asyncio.sleep(0.01)
+    assert [frame["data"][0]["last_price"] for frame in socket.frames] == [10.0, 11.0]
+
+def test_throttled_client_is_not_woken_per_batch():
+    from backend.routers.websocket import ClientConnection
+    client = ClientConnection(FakeSocket(), max_frames=8, frame_rate=1)
+    client.next_tick_frame = float("inf") # Just sent a frame
+    client.offer_ticks({1: "a"})
+    assert client.wakeup.is_set() # First pending tick: the writer must start its timed wait
+    client.wakeup.clear()
+    client.offer_ticks({1: "b", 2: "c"})
+    assert not client.wakeup.is_set() and client.pending_ticks == {1: "b", 2: "c"}
+    client.next_tick_frame = 0.0 # Frame due
+    client.offer_ticks({3: "d"})
+    assert client.wakeup.is_set()
+
+@pytest.mark.asyncio
+async def test_late_joiners_get_the_last_dashboard_stats():
+    manager = ConnectionManager()
+    await manager.broadcast({"type": "DASHBOARD_UPDATE", "stats": {"connected": True}})
+    socket = FakeSocket()
+    await manager.connect(socket)
+    await asyncio.sleep(0.01)
+    assert socket.frames == [{"type": "DASHBOARD_UPDATE", "stats": {"connected": True}}]
+
+@pytest.mark.asyncio
+async def test_replicas_share_frames_over_the_bus():
+    from backend.services.broadcast_bus import LocalBus
+    from backend.services.cache_events import CacheEventBus
+    bus = LocalBus()
+    feed, edge = ConnectionManager(frame_rate=0), ConnectionManager(frame_rate=0)
+    await feed.attach_bus(bus, CacheEventBus())
+    await edge.attach_bus(bus, CacheEventBus())
+    on_feed, on_edge = FakeSocket(), FakeSocket()
+    await feed.connect(on_feed)
+    await edge.connect(on_edge)
+
+    # Only the feed replica publishes; both deliver to their own sockets
+    await feed.broadcast_ticks([{"instrument_token": 1, "last_price": 10.0}, {"instrument_token": 1, "last_price": 11.0}])
+    await feed.broadcast({"type": "ALERT_NEW", "data": {"stock_symbol": "INFY"}})
+    await asyncio.sleep(0.01)
+    expected = [{"type": "ALERT_NEW", "data": {"stock_symbol": "INFY"}}, {"type": "TICK_UPDATE", "data": [{"instrument_token": 1, "last_price": 11.0}]}]
+    assert on_feed.frames == on_edge.frames == expected
+    assert bus.status()["published"] == 2
+
+@pytest.mark.asyncio
+async def test_removed_stock_is_unsubscribed_without_its_token():
+    from backend.services.cache_events import CacheEvent, STOCK_ADDED, STOCK_REMOVED
+    manager = ConnectionManager(frame_rate=0)
+    socket = FakeSocket()
+    await manager.connect(socket)
+    manager.watch(socket, "u1", [{"_id": "s1", "symbol": "INFY", "instrument_token": 1}, {"_id": "s2", "symbol": "TCS", "instrument_token": 2}])
+    manager.apply_event(CacheEvent(STOCK_ADDED, "u1", "WIPRO", 3, stock_id="s3"))
+    assert manager.clients[socket].tokens == {1, 2, 3}
+
+    # Router removal by symbol, change-stream delete by _id only, and a symbol moving to a new token
+    manager.apply_event(CacheEvent(STOCK_REMOVED, "u1", "INFY"))
+    manager.apply_event(CacheEvent(STOCK_REMOVED, "", stock_id="s2"))
+    manager.apply_event(CacheEvent(STOCK_ADDED, "u1", "WIPRO", 4, stock_id="s3"))
+    assert manager.clients[socket].tokens == {4}
+    assert sorted(manager.token_clients) == [4]
+
+    manager.disconnect(socket)
+    assert manager.watchlists == {} and manager.stock_ids == {}
+
+@pytest.mark.asyncio
+async def test_cache_events_reach_every_replica_over_the_bus():
+    from backend.services.broadcast_bus import LocalBus
+    from backend.services.cache_events import CacheEventBus
+    bus = LocalBus()
+    api, edge = ConnectionManager(frame_rate=0), ConnectionManager(frame_rate=0)
+    api_events, edge_events = CacheEventBus(), CacheEventBus()
+    api_events.subscribe(api.apply_event)
+    edge_events.subscribe(edge.apply_event)
+    await api.attach_bus(bus, api_events)
+    await edge.attach_bus(bus, edge_events)
+    socket = FakeSocket()
+    await edge.connect(socket)
+    edge.watch(socket, "u1", [{"_id": "s1", "symbol": "INFY", "instrument_token": 1}])
+
+    # The API replica served the writes; the user's socket lives on the edge replica
+    api_events.stock_added("u1", "TCS", 2, stock_id="s2")
+    await asyncio.sleep(0.01)
+    assert edge.clients[socket].tokens == {1, 2}
+    api_events.stock_removed("u1", "INFY")
+    await asyncio.sleep(0.01)
+    assert edge.clients[socket].tokens == {2}
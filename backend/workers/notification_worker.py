@@ -1,34 +1,221 @@
-import os
-import json
-import redis
+"""Notification worker: delivers the outbox filled by NotificationService.send_all.
+
+One long-running event loop per process claims outbox entries in batches
+and delivers many notifications at once; the service's delivery scheduler
+applies the per-channel concurrency, rate limits and priority. Run several
+processes (or hosts) to scale out: the consumer group hands each entry to
+one worker, and entries a dead worker never acked are claimed by another
+after the visibility timeout. Channels already sent for a delivery ID are
+skipped, so redelivery does not double-send.
+
+Provider rate limits are enforced per process, so each process gets
+1/NOTIFY_PROCESSES of them (defaulting to --processes); when workers run on
+several hosts, set NOTIFY_PROCESSES to the total.
+
+    python -m backend.workers.notification_worker --processes 4
+"""
+import argparse
 import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import time
+from collections import deque
+from typing import Dict, List, Tuple
+import numpy as np
 from backend.services.notifications import NotificationService
+from backend.services.outbox import RedisOutbox, OUTBOX_VISIBILITY_SECONDS, SENT
 from backend.models import SettingsInDB
 
 # Configure Redis
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-r = redis.from_url(REDIS_URL)
-QUEUE_NAME = "notifications"
+# List used before the outbox; anything left on it is moved over at startup
+LEGACY_QUEUE = "notifications"
 
-notification_service = NotificationService()
+# Entries claimed per round-trip
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", 100))
+# Notifications being delivered at once; no more are claimed until some finish
+WORKER_MAX_IN_FLIGHT = int(os.getenv("WORKER_MAX_IN_FLIGHT", 500))
+WORKER_METRICS_SECONDS = float(os.getenv("WORKER_METRICS_SECONDS", 30))
 
-async def process_task(task_data):
-    try:
-        settings = SettingsInDB(**task_data["settings"])
-        message = task_data["message"]
-        print(f"📨 Processing notification for {settings.user_id}")
-        await notification_service.send_all(settings, message)
-    except Exception as e:
-        print(f"❌ Error processing task: {e}")
-
-def run_worker():
-    print(f"👷 Notification Worker Listening on {QUEUE_NAME}...")
+class NotificationWorker:
+    def __init__(self, outbox, service: NotificationService, batch_size: int = WORKER_BATCH_SIZE,
+                 max_in_flight: int = WORKER_MAX_IN_FLIGHT, consumer: str = None,
+                 visibility_seconds: float = OUTBOX_VISIBILITY_SECONDS, block_ms: int = 1000):
+        self.outbox = outbox
+        self.service = service # Channel clients (Twilio, Telegram bot) live here and are reused
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.visibility_seconds = visibility_seconds
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.tasks = set()
+        self.claimed = set() # Entry IDs being delivered, renewed until acked
+        self.running = False
+        self.latencies = deque(maxlen=1000) # Enqueue -> delivered, seconds
+        self.metrics = {"dequeued": 0, "processed": 0, "failed": 0, "batches": 0, "skipped_channels": 0}
+        self.started_at = time.time()
+
+    async def dequeue(self) -> List[Tuple[str, bytes]]:
+        """Claim up to a batch of entries, waiting up to `block_ms` for the first"""
+        batch = await self.outbox.claim(self.consumer, self.batch_size, self.block_ms)
+        if batch:
+            self.metrics["batches"] += 1
+            self.metrics["dequeued"] += len(batch)
+        return batch
+
+    async def run(self):
+        self.running = True
+        await self.outbox.setup()
+        print(f"👷 Notification Worker {self.consumer} claiming from the outbox...")
+        heartbeat = asyncio.create_task(self.heartbeat())
+        while self.running:
+            try:
+                batch = await self.dequeue()
+            except Exception as e:
+                print(f"❌ Dequeue failed: {e}. Retrying in 1s...")
+                await asyncio.sleep(1)
+                continue
+            for entry_id, data in batch:
+                await self.slots.acquire()
+                self.claimed.add(entry_id)
+                task = asyncio.create_task(self.process(entry_id, data))
+                self.tasks.add(task)
+                task.add_done_callback(self._done)
+        await self.drain()
+        heartbeat.cancel()
+
+    def _done(self, task):
+        self.tasks.discard(task)
+        self.slots.release()
+
+    async def drain(self):
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def stop(self):
+        self.running = False
+
+    async def heartbeat(self):
+        """Keep claims on slow deliveries (e.g. waiting on rate limits) from expiring"""
+        while True:
+            await asyncio.sleep(self.visibility_seconds / 3)
+            try:
+                await self.outbox.touch(self.consumer, list(self.claimed))
+            except Exception as e:
+                print(f"❌ Claim renewal failed: {e}")
+
+    async def process(self, entry_id: str, data):
+        try:
+            try:
+                task = json.loads(data)
+                settings = SettingsInDB(**task["settings"])
+            except Exception as e: # Will never succeed; don't let it come back
+                self.metrics["failed"] += 1
+                print(f"❌ Dropping malformed outbox entry {entry_id}: {e}")
+                await self.outbox.ack([entry_id])
+                return
+
+            delivery_id = task.get("delivery_id") or entry_id
+            done = await self.outbox.delivered(delivery_id)
+            self.metrics["skipped_channels"] += len(done)
+            sends = self.service.channel_sends(settings, task["message"], task.get("priority", 0), skip=done)
+            results = await asyncio.gather(*[self._send(delivery_id, channel, send) for channel, send in sends])
+            await self.outbox.ack([entry_id])
+
+            if all(results):
+                self.metrics["processed"] += 1
+            else:
+                self.metrics["failed"] += 1
+            if task.get("enqueued_at"):
+                self.latencies.append(time.time() - task["enqueued_at"])
+        except Exception as e: # Outbox unreachable: leave the entry pending so it is redelivered
+            self.metrics["failed"] += 1
+            print(f"❌ Error processing task: {e}")
+        finally:
+            self.claimed.discard(entry_id)
+
+    async def _send(self, delivery_id: str, channel: str, send) -> bool:
+        """Send one channel and record the outcome; a recorded channel is never sent again"""
+        try:
+            await send
+        except Exception as e: # The scheduler has already retried it
+            await self.outbox.record(delivery_id, channel, f"failed: {e}")
+            return False
+        await self.outbox.record(delivery_id, channel, SENT)
+        return True
+
+    def status(self) -> Dict:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        latencies = np.array(self.latencies) * 1000
+        return {
+            **self.metrics,
+            "in_flight": len(self.tasks),
+            "per_second": round(self.metrics["processed"] / elapsed, 2),
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+            "channels": self.service.scheduler.status() if hasattr(self.service, "scheduler") else None,
+        }
+
+    async def report(self, interval: float = WORKER_METRICS_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                outbox = await self.outbox.status()
+            except Exception as e:
+                outbox = str(e)
+            print(f"📊 Worker {self.consumer}: {json.dumps({**self.status(), 'outbox': outbox})}")
+
+
+async def migrate_legacy_queue(client, outbox):
+    """Move notifications queued on the old list into the outbox"""
+    moved = 0
     while True:
-        # Blocking pop
-        _, data = r.blpop(QUEUE_NAME)
-        if data:
-            task = json.loads(data)
-            asyncio.run(process_task(task))
+        items = await client.lpop(LEGACY_QUEUE, WORKER_BATCH_SIZE)
+        if not items:
+            break
+        await outbox.add([item.decode() if isinstance(item, bytes) else item for item in items])
+        moved += len(items)
+    if moved:
+        print(f"📦 Moved {moved} notifications from the {LEGACY_QUEUE} list to the outbox")
+
+
+async def run_async(processes: int = None):
+    import redis.asyncio as redis
+    client = redis.from_url(REDIS_URL)
+    outbox = RedisOutbox(client)
+    await outbox.setup()
+    await migrate_legacy_queue(client, outbox)
+    service = NotificationService(processes)
+    worker = NotificationWorker(outbox, service)
+    reporter = asyncio.create_task(worker.report())
+    try:
+        await worker.run()
+    finally:
+        reporter.cancel()
+        await service.close()
+        await client.aclose()
+
+
+def run_worker(processes: int = None):
+    asyncio.run(run_async(processes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deliver queued notifications")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", 1)))
+    args = parser.parse_args()
+    senders = int(os.getenv("NOTIFY_PROCESSES", args.processes)) # Rate limits are split across these
+    if args.processes <= 1:
+        run_worker(senders)
+        return
+    processes = [multiprocessing.Process(target=run_worker, args=(senders,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
 
 if __name__ == "__main__":
-    run_worker()
+    main()
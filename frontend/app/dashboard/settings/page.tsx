@@ -29,7 +29,9 @@ export default function SettingsPage() {
         data_source: "zerodha",
         email_enabled: false,
         whatsapp_enabled: false,
-        telegram_enabled: false
+        telegram_enabled: false,
+        digest_enabled: false,
+        digest_seconds: 5
     })
 
     useEffect(() => {
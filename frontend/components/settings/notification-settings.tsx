@@ -4,7 +4,7 @@ import { Label } from "@/components/ui/label"
 import { Input } from "@/components/ui/input"
 import { Switch } from "@/components/ui/switch"
 import { Button } from "@/components/ui/button"
-import { MessageCircle, Mail, Send } from "lucide-react"
+import { MessageCircle, Mail, Send, Layers } from "lucide-react"
 
 interface NotificationSettingsProps {
     settings: any
@@ -99,6 +99,40 @@ export function NotificationSettings({ settings, onChange, onTest }: Notificatio
                         )}
                     </div>
                 </div>
+
+                {/* Digest */}
+                <div className="flex items-start space-x-4">
+                    <div className="mt-1 bg-amber-100 p-2 rounded-full">
+                        <Layers className="h-5 w-5 text-amber-600" />
+                    </div>
+                    <div className="flex-1 space-y-2">
+                        <div className="flex items-center justify-between">
+                            <Label htmlFor="digest-toggle" className="font-medium">Bundle Alert Bursts</Label>
+                            <Switch
+                                id="digest-toggle"
+                                checked={settings.digest_enabled}
+                                onCheckedChange={(c) => onChange("digest_enabled", c)}
+                            />
+                        </div>
+                        {settings.digest_enabled && (
+                            <div className="flex items-center gap-2">
+                                <Input
+                                    type="number"
+                                    min={1}
+                                    max={300}
+                                    className="w-24"
+                                    value={settings.digest_seconds ?? 5}
+                                    onChange={(e) => {
+                                        // An emptied field parses to NaN, which would be sent as null
+                                        const seconds = parseInt(e.target.value)
+                                        if (!Number.isNaN(seconds)) onChange("digest_seconds", Math.min(Math.max(seconds, 1), 300))
+                                    }}
+                                />
+                                <span className="text-sm text-muted-foreground">seconds: alerts within this window arrive as one message</span>
+                            </div>
+                        )}
+                    </div>
+                </div>
             </CardContent>
         </Card>
     )
@@ -0,0 +1,37 @@
+import json
+import random
+import timeit
+from datetime import datetime
+from fastapi.encoders import jsonable_encoder
+from backend.services.tick_codec import JSON, FORMATS, encode_tick, tick_frame
+
+def kite_tick(token):
+    price = round(1000 + random.uniform(-10, 10), 2)
+    level = lambda: {"quantity": random.randint(1, 500), "price": price, "orders": random.randint(1, 9)}
+    return {
+        "tradable": True, "mode": "full", "instrument_token": token,
+        "last_price": price, "last_traded_quantity": 10, "average_traded_price": price,
+        "volume_traded": 120000, "total_buy_quantity": 5000, "total_sell_quantity": 4000,
+        "ohlc": {"open": 1000.0, "high": 1010.0, "low": 990.0, "close": 1000.0},
+        "change": 0.42, "last_trade_time": datetime.now(), "oi": 0, "oi_day_high": 0, "oi_day_low": 0,
+        "exchange_timestamp": datetime.now(),
+        "depth": {"buy": [level() for _ in range(5)], "sell": [level() for _ in range(5)]},
+    }
+
+def main(batch_size: int = 1000, rounds: int = 20):
+    ticks = [kite_tick(token) for token in range(batch_size)]
+
+    # What broadcast_ticks used to do: jsonable_encoder, then send_json serializing again
+    before = lambda: json.dumps({"type": "TICK_UPDATE", "data": jsonable_encoder(ticks)}, separators=(",", ":"), ensure_ascii=False)
+    after = {format: (lambda format=format: tick_frame([encode_tick(tick, format) for tick in ticks], format)) for format in FORMATS}
+
+    assert json.loads(after[JSON]()) == json.loads(before())
+    baseline = min(timeit.repeat(before, number=1, repeat=rounds))
+    print(f"{batch_size}-tick batch, best of {rounds}")
+    print(f"  jsonable_encoder + send_json: {baseline * 1000:8.2f} ms")
+    for format, encode in after.items():
+        best = min(timeit.repeat(encode, number=1, repeat=rounds))
+        print(f"  tick_codec ({format}):{' ' * (12 - len(format))}{best * 1000:8.2f} ms  ({baseline / best:.1f}x, {len(encode())} bytes)")
+
+if __name__ == "__main__":
+    main()
@@ -31,7 +31,6 @@ async def run_stress_test():
 
     engine = AlertEngine()
     engine.alert_buffer = [] # Manually init buffer
-    engine.queue = asyncio.Queue() # Manually init queue
     
     # 1. Setup Mock Cache
     # 500 Stocks
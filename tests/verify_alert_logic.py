@@ -2,6 +2,7 @@ import asyncio
 import unittest
 from unittest.mock import MagicMock, patch, AsyncMock
 from backend.services.alert_engine import AlertEngine
+from backend.services.cooldowns import CooldownTable
 from backend.models import SettingsInDB, AlgoMode, AlertType
 
 class TestAlertLogic(unittest.TestCase):
@@ -11,7 +12,7 @@ class TestAlertLogic(unittest.TestCase):
         self.engine.user_settings = {}
         self.engine.token_map = {}
         self.engine.alert_buffer = []
-        self.engine.last_alert_time = {}
+        self.engine.cooldowns = CooldownTable()
         # Mock connection manager
         self.engine.connection_manager = AsyncMock()
         